@@ -0,0 +1,24 @@
+#!/bin/bash
+
+# Run the scaling benchmarks and write the results as JSON lines.
+#
+# To run the full benchmark grid:
+#
+#    $ ./run_benchmarks.sh
+#
+# Any options are passed on to the benchmark module, for example to run a
+# quick grid for a single target:
+#
+#    $ ./run_benchmarks.sh --quick -t http_download
+#
+# To compare the results of two revisions:
+#
+#    $ python -m topowiz.benchmark --compare old.jsonl new.jsonl
+#
+
+OUTPUT=/tmp/topowiz-bench-$(git describe --always --dirty).jsonl
+
+python3 -m topowiz.benchmark -o $OUTPUT $@
+
+echo "@@@ Benchmark results: $OUTPUT"
+echo
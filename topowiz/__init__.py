@@ -15,4 +15,4 @@ limitations under the License.
 
 """
 
-__version__ = "1.0.0"
+__version__ = "1.1.0"
@@ -19,3 +19,68 @@ FLASKS3_BUCKET_NAME    = 'topo-gen-resources'
 FLASKS3_REGION         = 'us-west-1'
 FLASKS3_ACTIVE         = True
 FLASKS3_FORCE_MIMETYPE = True
+
+# Largest accepted request body, including the network files uploaded to the
+# bulk import form. Larger requests are refused with 413.
+MAX_CONTENT_LENGTH = 1024 * 1024
+
+# Limits for the in-memory cache of built topologies
+TOPO_CACHE_MAX_ENTRIES = 128
+TOPO_CACHE_MAX_BYTES   = 64 * 1024 * 1024
+
+# Server-side store for configs and topologies (see store.py): None, for
+# configs encoded in the URLs, 'sqlite' with the database file at
+# CONFIG_STORE_PATH, or 'files' with the directory at CONFIG_STORE_PATH.
+# The last CONFIG_STORE_CACHE_ENTRIES configs are kept in memory as well.
+# Entries unused for CONFIG_STORE_MAX_AGE seconds are removed, and the least
+# recently used ones once the store exceeds CONFIG_STORE_MAX_BYTES.
+CONFIG_STORE_BACKEND       = None
+CONFIG_STORE_PATH          = "topowiz-store.db"
+CONFIG_STORE_CACHE_ENTRIES = 256
+CONFIG_STORE_MAX_BYTES     = 256 * 1024 * 1024
+CONFIG_STORE_MAX_AGE       = 30 * 24 * 3600
+
+# Limits for the topologies that are built for a request, checked against
+# an estimate of their cost before anything is built (see estimate.py). The
+# largest topologies of the wizard have 262400 groups and about 37 MB, or
+# 72 MB with prefixes. None means no limit.
+MAX_TOPOLOGY_GROUPS = 300000
+MAX_TOPOLOGY_BYTES  = 128 * 1024 * 1024
+
+# Topologies of at least this (estimated) size are streamed by /download,
+# and only offered for download on the /done page, rather than shown
+STREAM_MIN_BYTES = 2 * 1024 * 1024
+
+# Compression of topology downloads with gzip or brotli (if the 'brotli'
+# module is installed), for clients that accept it. Smaller responses aren't
+# worth compressing.
+COMPRESSION_ENABLED   = True
+COMPRESSION_MIN_BYTES = 1024
+
+# Lifetime (in seconds) of /done and /download responses in the caches of
+# browsers and CDNs. These responses never change for the same URL.
+HTTP_CACHE_MAX_AGE = 365 * 24 * 3600
+
+# Worker threads and concurrently handled requests of the asyncio serving
+# mode (see asgi.py)
+ASYNC_WORKERS      = 4
+ASYNC_MAX_REQUESTS = 64
+
+# Log the import and first request timings on cold start
+STARTUP_REPORT = True
+
+# Directory with templates precompiled by
+# 'python -m topowiz.startup compile-templates', or None
+PRECOMPILED_TEMPLATES = None
+
+# Per view and stage request metrics, served by /metrics (see metrics.py).
+# Tracking the memory peaks of the stages slows down the app considerably.
+METRICS_ENABLED      = False
+METRICS_TRACE_MEMORY = False
+
+# Profiling of single requests on demand, with the 'profile' query parameter
+# or the X-Topowiz-Profile header (see profiler.py). This is refused on AWS
+# Lambda, unless PROFILING_ALLOW_LAMBDA is set as well.
+PROFILING_ENABLED      = False
+PROFILING_ALLOW_LAMBDA = False
+PROFILING_MAX_ENTRIES  = 32
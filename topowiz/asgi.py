@@ -0,0 +1,233 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# An asyncio (ASGI) serving mode for the app, with the same routes:
+#
+#    $ uvicorn topowiz.asgi:app
+#
+# Each request is handled by the Flask app in a bounded pool of worker
+# threads, so that the event loop is never blocked by building or serializing
+# a topology. Responses are passed on chunk by chunk as the app produces
+# them: Large downloads (which the app streams, see STREAM_MIN_BYTES) are
+# sent while they are being serialized, and only hold a worker thread while
+# a chunk is produced, not while it is sent to a slow client. Requests beyond
+# ASYNC_MAX_REQUESTS wait in the event loop, rather than in the queue of the
+# pool. Request bodies are limited to MAX_CONTENT_LENGTH before they reach
+# the app, and a response is no longer produced once the client disconnects.
+#
+# Serialization is Python code, so the worker threads of one process share
+# a single CPU. To use more CPUs, run several processes (for example with
+# 'uvicorn --workers').
+#
+
+import asyncio
+import io
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+_DONE = object()
+
+
+def _next_chunk(iterator):
+    return next(iterator, _DONE)
+
+
+def wsgi_environ(scope, body):
+    """
+    Return the WSGI environment for the request of an ASGI 'http' scope.
+
+    """
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD"    : scope["method"],
+        "SCRIPT_NAME"       : scope.get("root_path", "").encode(
+                                            "utf-8").decode("latin-1"),
+        "PATH_INFO"         : scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING"      : scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME"       : server[0],
+        "SERVER_PORT"       : str(server[1]),
+        "SERVER_PROTOCOL"   : "HTTP/%s" % scope.get("http_version", "1.1"),
+        "REMOTE_ADDR"       : client[0],
+        "CONTENT_LENGTH"    : str(len(body)),
+        "wsgi.version"      : (1, 0),
+        "wsgi.url_scheme"   : scope.get("scheme", "http"),
+        "wsgi.input"        : io.BytesIO(body),
+        "wsgi.errors"       : sys.stderr,
+        "wsgi.multithread"  : True,
+        "wsgi.multiprocess" : False,
+        "wsgi.run_once"     : False
+    }
+    for name, value in scope.get("headers", []):
+        name  = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = "HTTP_" + name
+            environ[key] = environ[key] + "," + value if key in environ \
+                else value
+    return environ
+
+
+class AsgiAdapter(object):
+    """
+    ASGI application that serves a WSGI application with a bounded pool of
+    worker threads. Requests with a body of more than 'max_body' bytes are
+    refused (None means no limit).
+
+    """
+    def __init__(self, wsgi_app, max_workers=4, max_requests=64,
+                 max_body=None):
+        self.wsgi_app     = wsgi_app
+        self.executor     = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_requests = max_requests
+        self.max_body     = max_body
+        self._semaphore   = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            if self._semaphore is None:
+                # Created here, so that it belongs to the running loop.
+                self._semaphore = asyncio.Semaphore(self.max_requests)
+            async with self._semaphore:
+                await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type" : "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type" : "lifespan.shutdown.complete"})
+                return
+
+    async def _too_large(self, send):
+        await send({"type"    : "http.response.start",
+                    "status"  : 413,
+                    "headers" : [(b"content-type", b"text/plain")]})
+        await send({"type" : "http.response.body",
+                    "body" : b"Request body too large"})
+
+    async def _read_body(self, scope, receive, send):
+        """
+        Return the request body, or None if the client disconnected or the
+        body is too large (which is answered here).
+
+        """
+        if self.max_body is not None:
+            for name, value in scope.get("headers", []):
+                if name.lower() == b"content-length" and \
+                        value.isdigit() and int(value) > self.max_body:
+                    await self._too_large(send)
+                    return None
+        body = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return None
+            body.append(message.get("body", b""))
+            size += len(body[-1])
+            if self.max_body is not None and size > self.max_body:
+                await self._too_large(send)
+                return None
+            if not message.get("more_body"):
+                return b"".join(body)
+
+    async def _http(self, scope, receive, send):
+        body = await self._read_body(scope, receive, send)
+        if body is None:
+            return
+
+        # Watches for the client to disconnect while the response is
+        # produced, which the app itself has no way of noticing.
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await self._respond(scope, body, send, disconnected)
+        finally:
+            watcher.cancel()
+
+    async def _respond(self, scope, body, send, disconnected):
+        loop    = asyncio.get_running_loop()
+        environ = wsgi_environ(scope, body)
+        status  = []
+
+        def start_response(status_line, headers, exc_info=None):
+            status[:] = [status_line, headers]
+
+        def call_app():
+            iterable = self.wsgi_app(environ, start_response)
+            return iterable, iter(iterable)
+
+        iterable, iterator = await loop.run_in_executor(self.executor,
+                                                        call_app)
+        try:
+            chunk = await loop.run_in_executor(self.executor, _next_chunk,
+                                               iterator)
+            status_line, headers = status
+            await send({
+                "type"    : "http.response.start",
+                "status"  : int(status_line.split(" ", 1)[0]),
+                "headers" : [(k.lower().encode("latin-1"),
+                              v.encode("latin-1")) for k, v in headers]
+            })
+            while chunk is not _DONE:
+                if disconnected.is_set():
+                    return
+                if chunk:
+                    await send({"type" : "http.response.body",
+                                "body" : chunk, "more_body" : True})
+                chunk = await loop.run_in_executor(self.executor,
+                                                   _next_chunk, iterator)
+            await send({"type" : "http.response.body", "body" : b""})
+        except OSError:
+            # Servers raise this for a send to a closed connection.
+            return
+        finally:
+            if hasattr(iterable, "close"):
+                await loop.run_in_executor(self.executor, iterable.close)
+
+
+def create_app():
+    """
+    Return the ASGI application for the Flask app, configured with
+    ASYNC_WORKERS, ASYNC_MAX_REQUESTS and MAX_CONTENT_LENGTH from the app
+    config.
+
+    """
+    from .http import app as flask_app
+    return AsgiAdapter(flask_app,
+                       flask_app.config.get('ASYNC_WORKERS', 4),
+                       flask_app.config.get('ASYNC_MAX_REQUESTS', 64),
+                       flask_app.config.get('MAX_CONTENT_LENGTH'))
+
+
+app = create_app()
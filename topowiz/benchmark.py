@@ -0,0 +1,398 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# Scaling benchmarks for the topology calculation and the HTTP endpoints.
+#
+# The configs in topowiz/tests/data are scaled up over a grid of sizes
+# (zones, racks, hosts, networks) and every benchmark target is run for each
+# of them. For each case the wall time (best of several runs), the peak
+# memory (measured in a separate run with tracemalloc) and the output size
+# are recorded. Results are written as JSON lines, one line per case, so that
+# the results of two revisions can be compared with --compare.
+#
+# Usage:
+#
+#    $ python -m topowiz.benchmark                  # full grid, to stdout
+#    $ python -m topowiz.benchmark --quick -o new.jsonl
+#    $ python -m topowiz.benchmark --compare old.jsonl new.jsonl
+#
+
+import argparse
+import base64
+import copy
+import glob
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from . import __version__
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "tests", "data")
+
+# The grid of sizes over which the configs are swept. The quick grid is meant
+# for a fast sanity check during development.
+GRID = {
+    "networks"           : [1, 2, 4],
+    "zones"              : [1, 2, 3],
+    "num_hosts"          : [5, 256, 2048],
+    "num_racks"          : [8, 64, 256],
+    "num_hosts_per_rack" : [16, 256, 1024]
+}
+QUICK_GRID = {
+    "networks"           : [1, 2],
+    "zones"              : [1, 3],
+    "num_hosts"          : [5, 256],
+    "num_racks"          : [8, 64],
+    "num_hosts_per_rack" : [16, 256]
+}
+
+AWS_ZONE_SUFFIXES = "abcde"
+
+# Benchmark targets: Each takes a config and returns the produced output, so
+# that we can report its size. Targets register themselves with the
+# 'benchmark' decorator. Targets for which a config isn't applicable raise
+# NotApplicable. If a target has a setup function, the setup is run with the
+# config first (not timed) and the target is called with its result instead.
+TARGETS = []
+
+
+class NotApplicable(Exception):
+    pass
+
+
+def benchmark(name, setup=None):
+    """
+    Decorator to register a benchmark target.
+
+    """
+    def register(func):
+        if setup is None:
+            TARGETS.append((name, func))
+        else:
+            TARGETS.append((name, _with_setup(func, setup)))
+        return func
+    return register
+
+
+class _with_setup(object):
+    """
+    A target with a setup function, see run_case().
+
+    """
+    def __init__(self, func, setup):
+        self.func  = func
+        self.setup = setup
+
+
+def _flask_client():
+    """
+    Return a Flask test client and the topology cache of the app. The app is
+    only imported when the HTTP targets are actually run.
+
+    """
+    from .http import app, topo_cache
+    app.config['WTF_CSRF_ENABLED'] = False
+    return app.test_client(), topo_cache
+
+
+@benchmark("build_topology")
+def _bench_build_topology(conf):
+    from .topo import build_topology
+    return build_topology(conf)
+
+
+@benchmark("build_topology_lazy_json")
+def _bench_build_topology_lazy_json(conf):
+    from .serialize import iter_json
+    from .topo      import build_topology
+    return b"".join(iter_json(build_topology(conf, lazy=True)))
+
+
+@benchmark("calculate_num_groups")
+def _bench_calculate_num_groups(conf):
+    from .topo import calculate_num_groups
+    if not conf.get('aws'):
+        raise NotApplicable()
+    return calculate_num_groups(conf)
+
+
+@benchmark("build_topology_prefixes")
+def _bench_build_topology_prefixes(conf):
+    from .topo import build_topology
+    return build_topology(conf, prefixes=True)
+
+
+@benchmark("count_groups")
+def _bench_count_groups(conf):
+    from .topo import count_groups
+    return count_groups(conf)
+
+
+def _legacy_conf_to_url(conf):
+    """
+    The URL encoding of the config used by earlier versions, as reference.
+
+    """
+    return base64.urlsafe_b64encode(json.dumps(conf).encode("utf-8")).decode()
+
+
+@benchmark("conf_encode_legacy")
+def _bench_conf_encode_legacy(conf):
+    return _legacy_conf_to_url(conf).encode()
+
+
+@benchmark("conf_encode")
+def _bench_conf_encode(conf):
+    from .codec import encode_conf
+    return encode_conf(conf).encode()
+
+
+@benchmark("conf_decode_legacy", setup=_legacy_conf_to_url)
+def _bench_conf_decode_legacy(raw_conf):
+    return json.loads(base64.urlsafe_b64decode(raw_conf).decode("utf-8"))
+
+
+def _encode_conf(conf):
+    from .codec import encode_conf
+    return encode_conf(conf)
+
+
+@benchmark("conf_decode", setup=_encode_conf)
+def _bench_conf_decode(raw_conf):
+    from .codec import decode_conf
+    return decode_conf(raw_conf)
+
+
+def _get(path):
+    client, cache = _flask_client()
+    cache.clear()
+    resp = client.get(path)
+    if resp.status_code != 200:
+        raise Exception("GET %s returned %d" % (path.split("/")[1],
+                                                resp.status_code))
+    return resp.get_data()
+
+
+@benchmark("http_done")
+def _bench_http_done(conf):
+    from .http import conf_to_url
+    return _get("/done/" + conf_to_url(conf))
+
+
+@benchmark("http_download")
+def _bench_http_download(conf):
+    from .http import conf_to_url
+    return _get("/download/" + conf_to_url(conf))
+
+
+def load_base_configs():
+    """
+    Load the sample configs and fill in any values that the wizard would have
+    provided.
+
+    """
+    confs = []
+    for fname in sorted(glob.glob(os.path.join(DATA_DIR, "*.json"))):
+        with open(fname) as f:
+            conf = json.load(f)
+        for i, n in enumerate(conf['networks']):
+            n.setdefault("name", "net-%d" % i)
+        if "datacenter" in conf:
+            cd = conf['datacenter']
+            cd.setdefault("prefix_per_host", False)
+            cd.setdefault("flat_network", False)
+        confs.append((os.path.basename(fname)[:-5], conf))
+    return confs
+
+
+def _scale_networks(conf, num_networks):
+    conf['networks'] = [{"cidr" : "10.%d.0.0/16" % (i + 1),
+                         "name" : "net-%d" % i}
+                        for i in range(num_networks)]
+
+
+def iter_cases(grid):
+    """
+    Produce (case name, parameters, config) for every base config and size in
+    the grid.
+
+    """
+    for base_name, base in load_base_configs():
+        if base.get('aws'):
+            dims = ["networks", "zones"]
+        else:
+            cd = base['datacenter']
+            if cd['flat_network']:
+                dims = ["networks"] + \
+                       (["num_hosts"] if cd['prefix_per_host'] else [])
+            else:
+                dims = ["networks", "num_racks"] + \
+                       (["num_hosts_per_rack"] if cd['prefix_per_host']
+                        else [])
+        for values in itertools.product(*[grid[d] for d in dims]):
+            params = dict(zip(dims, values))
+            conf   = copy.deepcopy(base)
+            _scale_networks(conf, params['networks'])
+            if conf.get('aws'):
+                region = conf['aws']['region']
+                conf['aws']['zones'] = [region + AWS_ZONE_SUFFIXES[i]
+                                        for i in range(params['zones'])]
+            else:
+                for d in dims[1:]:
+                    conf['datacenter'][d] = params[d]
+            name = base_name + "".join("/%s=%d" % (d, params[d])
+                                       for d in dims)
+            yield name, params, conf
+
+
+def _output_size(output):
+    if isinstance(output, bytes):
+        return len(output)
+    return len(json.dumps(output).encode("utf-8"))
+
+
+def run_case(func, conf, repeat):
+    """
+    Run a single target for a config and return the measurements.
+
+    """
+    if isinstance(func, _with_setup):
+        conf = func.setup(conf)
+        func = func.func
+
+    times = []
+    for _ in range(repeat):
+        start  = time.perf_counter()
+        output = func(conf)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func(conf)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "wall_s"       : min(times),
+        "peak_bytes"   : peak,
+        "output_bytes" : _output_size(output)
+    }
+
+
+def _revision():
+    try:
+        return subprocess.check_output(
+                    ["git", "describe", "--always", "--dirty"],
+                    cwd=os.path.dirname(__file__),
+                    stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def run(grid, targets=None, repeat=3, out=sys.stdout):
+    """
+    Run all selected targets over the grid, writing one JSON line per case.
+
+    """
+    meta = {
+        "revision" : _revision(),
+        "version"  : __version__,
+        "python"   : platform.python_version()
+    }
+    for case_name, params, conf in iter_cases(grid):
+        for target, func in TARGETS:
+            if targets and target not in targets:
+                continue
+            result = {"case" : case_name, "target" : target}
+            result.update(meta)
+            result["params"] = params
+            try:
+                result.update(run_case(func, conf, repeat))
+            except NotApplicable:
+                continue
+            except Exception as e:
+                result["error"] = str(e)
+            out.write(json.dumps(result, sort_keys=True) + "\n")
+            out.flush()
+
+
+def _load_results(fname):
+    with open(fname) as f:
+        return dict(((r['case'], r['target']), r)
+                    for r in (json.loads(line) for line in f
+                              if line.strip()))
+
+
+def compare(old_fname, new_fname, out=sys.stdout):
+    """
+    Print a table with the ratio (new / old) of the measurements of each case
+    that is present in both result files.
+
+    """
+    old = _load_results(old_fname)
+    new = _load_results(new_fname)
+    keys = ["wall_s", "peak_bytes", "output_bytes"]
+    out.write("%-60s %-28s %10s %10s %10s\n" %
+              (("case", "target") + tuple(keys)))
+    for key in sorted(set(old) & set(new)):
+        o, n = old[key], new[key]
+        if "error" in o or "error" in n:
+            ratios = ["error"] * len(keys)
+        else:
+            ratios = ["%.2fx" % (n[k] / o[k]) if o[k] else "-" for k in keys]
+        out.write("%-60s %-28s %10s %10s %10s\n" % (key + tuple(ratios)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+                    description="Run the topowiz scaling benchmarks.")
+    parser.add_argument("-o", "--output",
+                        help="file for the JSON lines results "
+                             "(default: stdout)")
+    parser.add_argument("-t", "--target", action="append",
+                        choices=[t[0] for t in TARGETS],
+                        help="only run this target (may be repeated)")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="timed runs per case, the best one is reported")
+    parser.add_argument("--quick", action="store_true",
+                        help="use the smaller, quick grid")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two result files and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    grid = QUICK_GRID if args.quick else GRID
+    if args.output:
+        with open(args.output, "w") as out:
+            run(grid, args.target, args.repeat, out)
+    else:
+        run(grid, args.target, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# A bounded, thread safe cache for built topologies.
+#
+# Entries are keyed by a hash of the decoded user config, so that the /done
+# and /download views (and any other encoding of the same config) share a
+# single entry. The order of the keys is part of the hash, since the
+# networks of the config appear in the topology as they were entered. The
+# same hash is the base of the ETags of these views, whose responses depend
+# on nothing but the config in the URL.
+#
+# With a config store (see store.py), serialized topologies are saved there
+# as well, and only rebuilt from scratch if they are missing in both.
+#
+
+import hashlib
+import json
+import threading
+
+from collections import OrderedDict
+
+from .          import __version__
+from .metrics   import metrics
+from .serialize import FORMATS, iter_json
+from .topo      import build_topology
+
+
+def canonical_conf(conf):
+    """
+    Return the canonical serialization of a user config: no insignificant
+    whitespace, encoded as utf-8. The keys keep their order.
+
+    """
+    return json.dumps(conf, separators=(",", ":")).encode("utf-8")
+
+
+def config_hash(conf):
+    """
+    Return the hex digest identifying the given user config.
+
+    """
+    return hashlib.sha256(canonical_conf(conf)).hexdigest()
+
+
+def response_etag(conf, *variant):
+    """
+    Return a strong ETag for a response that is determined by the user config
+    and the 'variant' values (such as the name of the view) alone.
+
+    The version of topowiz is part of the tag, so that responses cached by
+    clients and CDNs are invalidated when a new version produces different
+    output.
+
+    """
+    tag = "|".join([__version__, config_hash(conf)] + list(map(str, variant)))
+    return hashlib.sha256(tag.encode("utf-8")).hexdigest()[:32]
+
+
+def serialize_topology(topo, fmt="pretty"):
+    """
+    The serialized form of a (lazy) topology, as offered for download, in
+    the 'pretty' or 'min' format (see serialize.FORMATS).
+
+    """
+    return b"".join(iter_json(topo, FORMATS[fmt]))
+
+
+class TopologyCache(object):
+    """
+    LRU cache of (topology, serialized topology) tuples.
+
+    Eviction takes place once either the number of entries or the total size
+    of the serialized topologies exceeds its limit. Topologies whose
+    serialized form alone exceeds the size limit are never cached.
+
+    The cached topologies are lazy topologies (see model.py), which are
+    shared between all callers and must not be modified.
+
+    With a 'config_store', serialized topologies that aren't in the cache
+    are looked up there, and newly serialized ones are saved there. The
+    topology itself is rebuilt in lazy form, which costs next to nothing.
+
+    """
+    def __init__(self, max_entries=128, max_bytes=64 * 1024 * 1024,
+                 config_store=None):
+        self.max_entries  = max_entries
+        self.max_bytes    = max_bytes
+        self.config_store = config_store
+        self.hits         = 0
+        self.misses       = 0
+        self.evictions    = 0
+        self._entries     = OrderedDict()
+        self._num_bytes   = 0
+        self._lock        = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, key):
+        """
+        Return the cached tuple for the given config hash, or None.
+
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return entry
+
+    def store(self, key, topo, serialized):
+        """
+        Add an entry to the cache, evicting the least recently used entries
+        as needed.
+
+        """
+        size = len(serialized)
+        if self.max_entries < 1 or size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._num_bytes -= len(old[1])
+            self._entries[key] = (topo, serialized)
+            self._num_bytes   += size
+            while len(self._entries) > self.max_entries or \
+                    self._num_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._num_bytes -= len(evicted)
+                self.evictions  += 1
+
+    def get(self, conf, prefixes=False, fmt="pretty"):
+        """
+        Return (topology, serialized topology) for the given user config,
+        building it only if it is not in the cache already. See
+        topo.build_topology() for 'prefixes'. The topology is serialized in
+        the format 'fmt', which is cached separately.
+
+        The build happens outside of the lock, so that a slow build doesn't
+        hold up other threads. Concurrent misses for the same config may
+        therefore build it more than once, which is harmless.
+
+        """
+        key   = config_hash(conf) + ("+prefixes" if prefixes else "") + \
+            ("" if fmt == "pretty" else "+" + fmt)
+        entry = self.lookup(key)
+        if entry is None:
+            with metrics.stage("build"):
+                topo = build_topology(conf, lazy=True, prefixes=prefixes)
+            serialized = self._load(key)
+            if serialized is None:
+                with metrics.stage("serialize"):
+                    serialized = serialize_topology(topo, fmt=fmt)
+                self._save(key, serialized)
+            entry = (topo, serialized)
+            self.store(key, *entry)
+        return entry
+
+    def _store_key(self, key):
+        # Saved topologies are only valid for the version that created them.
+        return "%s-%s" % (__version__, key)
+
+    def _load(self, key):
+        if self.config_store is None:
+            return None
+        with metrics.stage("load"):
+            return self.config_store.get_topology(self._store_key(key))
+
+    def _save(self, key, serialized):
+        if self.config_store is not None:
+            with metrics.stage("save"):
+                self.config_store.put_topology(self._store_key(key),
+                                               serialized)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._num_bytes = 0
+
+    def stats(self):
+        """
+        Return a dictionary with the cache counters.
+
+        """
+        with self._lock:
+            return {
+                "entries"   : len(self._entries),
+                "bytes"     : self._num_bytes,
+                "hits"      : self.hits,
+                "misses"    : self.misses,
+                "evictions" : self.evictions
+            }
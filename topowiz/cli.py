@@ -0,0 +1,200 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# Command line tool for generating topologies from user configs in batch,
+# without the web app. Only the calculation modules are imported, so Flask
+# and the other web dependencies need not be installed.
+#
+# Usage:
+#
+#    $ python -m topowiz config.json                 # topology to stdout
+#    $ python -m topowiz -o out/ configs/*.json      # one file per config
+#    $ cat configs.jsonl | python -m topowiz -j 8 > topologies.jsonl
+#
+# Each input file holds a single config, except for files ending in '.jsonl'
+# (and stdin, if no files are given), which hold one config per line. With
+# an output directory, each topology is written to a file named after its
+# config. Otherwise a single topology is written to stdout as it is, and
+# several topologies as JSON lines, in the order of the configs. Configs
+# that are invalid are reported on stderr, and as an {"errors" : [...]} line
+# in the JSON lines output.
+#
+# With --jobs, the topologies are built and serialized in a pool of
+# processes. The output order doesn't depend on the number of jobs.
+#
+
+import argparse
+import json
+import os
+import sys
+
+from concurrent.futures import ProcessPoolExecutor
+
+from .serialize  import FORMATS, iter_topology
+from .topo       import build_topology
+from .validation import conf_errors
+
+
+def iter_configs(fnames, stdin):
+    """
+    Produce a (name, config text) tuple for each config in the files, or in
+    stdin if there are none. The configs are parsed by the workers.
+
+    """
+    if not fnames:
+        fnames = ["-"]
+    for fname in fnames:
+        if fname == "-":
+            base = "config"
+            f    = stdin
+        else:
+            base = os.path.splitext(os.path.basename(fname))[0]
+            f    = open(fname)
+        try:
+            if fname == "-" or fname.endswith(".jsonl"):
+                lines = (line for line in f if line.strip())
+                for i, line in enumerate(lines):
+                    yield "%s-%d" % (base, i), line
+            else:
+                yield base, f.read()
+        finally:
+            if f is not stdin:
+                f.close()
+
+
+def generate(text, prefixes=False, fmt="pretty"):
+    """
+    Return the serialized topology for the config text, or the list of
+    errors of the config.
+
+    """
+    try:
+        conf = json.loads(text)
+    except ValueError as e:
+        return None, ["Not valid JSON: %s" % e]
+    errors = conf_errors(conf)
+    if errors:
+        return None, errors
+    try:
+        topo = build_topology(conf, lazy=True, prefixes=prefixes)
+        return b"".join(iter_topology(topo, fmt)), None
+    except Exception as e:
+        return None, [str(e)]
+
+
+def _generate_item(item):
+    text, prefixes, fmt = item
+    return generate(text, prefixes, fmt)
+
+
+def _unique_names(names):
+    """
+    Append a counter to names that were already used.
+
+    """
+    seen = {}
+    for name in names:
+        n = seen.get(name, 0)
+        seen[name] = n + 1
+        yield name if n == 0 else "%s-%d" % (name, n)
+
+
+def run(fnames, out_dir=None, prefixes=False, fmt="pretty", jobs=1,
+        out=None, err=None, stdin=None):
+    """
+    Generate the topologies for all configs. Returns the number of configs
+    that failed.
+
+    """
+    out     = out or sys.stdout.buffer
+    err     = err or sys.stderr
+    configs = list(iter_configs(fnames, stdin or sys.stdin))
+    names   = list(_unique_names(name for name, _ in configs))
+    # Several topologies on stdout, or those of configs read line by line,
+    # are written as JSON lines, which can't be indented.
+    lines   = out_dir is None and \
+        (len(configs) != 1 or not fnames or
+         any(f == "-" or f.endswith(".jsonl") for f in fnames))
+    if lines and fmt == "pretty":
+        fmt = "min"
+
+    items = ((text, prefixes, fmt) for _, text in configs)
+    if jobs > 1:
+        executor = ProcessPoolExecutor(max_workers=jobs)
+        results  = executor.map(_generate_item, items,
+                                chunksize=max(1, len(configs) //
+                                              (jobs * 16)))
+    else:
+        executor = None
+        results  = map(_generate_item, items)
+
+    failed = 0
+    try:
+        for name, (topo_json, errors) in zip(names, results):
+            if errors:
+                failed += 1
+                for e in errors:
+                    err.write("%s: %s\n" % (name, e))
+                if lines:
+                    out.write(json.dumps({"errors" : errors}).encode("utf-8"))
+                    out.write(b"\n")
+            elif out_dir is not None:
+                with open(os.path.join(out_dir, name + ".json"), "wb") as f:
+                    f.write(topo_json)
+            else:
+                out.write(topo_json)
+                out.write(b"\n")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    out.flush()
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+                    prog="topowiz",
+                    description="Generate Romana topologies from user "
+                                "configs.")
+    parser.add_argument("files", nargs="*",
+                        help="config files, '.jsonl' files with one config "
+                             "per line, or '-' for stdin (default: stdin, "
+                             "one config per line)")
+    parser.add_argument("-o", "--output-dir",
+                        help="write each topology to <config name>.json in "
+                             "this directory (default: stdout)")
+    parser.add_argument("-p", "--prefixes", action="store_true",
+                        help="include the address prefixes of the groups")
+    parser.add_argument("-f", "--format", default="pretty",
+                        choices=sorted(FORMATS),
+                        help="output format (default: pretty, or min for "
+                             "JSON lines)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes (default: 1)")
+    args = parser.parse_args(argv)
+
+    if args.output_dir and not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+    failed = run(args.files, args.output_dir, args.prefixes, args.format,
+                 args.jobs)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
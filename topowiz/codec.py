@@ -0,0 +1,282 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# Compact encoding of the user config for inclusion in URLs.
+#
+# The encoded config is the URL safe base64 encoding (without padding) of a
+# one byte format version, followed by the payload:
+#
+#   FORMAT_JSON_ZLIB   - The JSON config, compressed with zlib. Used for
+#                        anything the packed format can't represent.
+#   FORMAT_PACKED      - The config packed into a binary schema (see _pack).
+#   FORMAT_PACKED_ZLIB - The packed config, compressed with zlib.
+#
+# The shortest of the applicable formats is used. Configs encoded by older
+# versions are plain base64 encoded JSON, which is recognized by its first
+# byte ('{'), so old URLs continue to work.
+#
+
+import base64
+import json
+import struct
+import zlib
+
+from .prefixes import format_cidr, parse_cidr
+
+
+FORMAT_JSON_ZLIB   = 1
+FORMAT_PACKED      = 2
+FORMAT_PACKED_ZLIB = 3
+
+# Presence bits of the optional values in the packed format, in the order in
+# which the values follow in the packed data.
+_AWS, _REGION, _ZONES, _DC, _PREFIX_PER_HOST, _FLAT_NETWORK, _NUM_HOSTS, \
+    _NUM_RACKS, _NUM_HOSTS_PER_RACK, _NETWORKS, _NETWORKS_FIRST = \
+    [1 << i for i in range(11)]
+
+_DC_BOOLS = [(_PREFIX_PER_HOST, "prefix_per_host"),
+             (_FLAT_NETWORK, "flat_network")]
+_DC_INTS = [(_NUM_HOSTS, "num_hosts"), (_NUM_RACKS, "num_racks"),
+            (_NUM_HOSTS_PER_RACK, "num_hosts_per_rack")]
+
+_HAS_BLOCK_MASK = 0x80
+
+# Largest size of a decompressed config. Configs come from URLs, so this
+# guards against small URLs that decompress to huge amounts of data.
+MAX_CONF_BYTES = 256 * 1024
+
+
+def _pack_str(s):
+    b = s.encode("utf-8")
+    return struct.pack("B", len(b)) + b
+
+
+def _unpack_str(data, pos):
+    n = data[pos]
+    return data[pos + 1:pos + 1 + n].decode("utf-8"), pos + 1 + n
+
+
+def _pack_aws(aws):
+    present = _AWS
+    body    = b""
+    region  = aws.get('region', "")
+    if 'region' in aws:
+        present |= _REGION
+        body    += _pack_str(region)
+    if 'zones' in aws:
+        present |= _ZONES
+        body    += struct.pack("B", len(aws['zones']))
+        for zone in aws['zones']:
+            if not zone.startswith(region):
+                raise ValueError("zone not in region")
+            body += _pack_str(zone[len(region):])
+    return present, 0, body
+
+
+def _pack_dc(cd):
+    present = _DC
+    bools   = 0
+    body    = b""
+    for bit, key in _DC_BOOLS:
+        if key in cd:
+            present |= bit
+            bools   |= bit >> 4 if cd[key] else 0
+    for bit, key in _DC_INTS:
+        if key in cd:
+            present |= bit
+            body    += struct.pack("!H", cd[key])
+    return present, bools, body
+
+
+def _pack_networks(networks):
+    body = struct.pack("!H", len(networks))
+    for i, n in enumerate(networks):
+        addr, plen = parse_cidr(n['cidr'])
+        if 'block_mask' in n:
+            body += struct.pack("!IBB", addr, plen | _HAS_BLOCK_MASK,
+                                n['block_mask'])
+        else:
+            body += struct.pack("!IB", addr, plen)
+        body += _pack_str("" if n['name'] == "net-%d" % i else n['name'])
+    return _NETWORKS, 0, body
+
+
+def _pack(conf):
+    """
+    Pack the config into the binary schema:
+
+        uint16  presence bits
+        uint8   boolean values (prefix_per_host, flat_network)
+        str     aws region                      (if present)
+        uint8   number of zones, followed by    (if present)
+                the zone names without the region prefix (str)
+        uint16  num_hosts, num_racks, num_hosts_per_rack  (each if present)
+        uint16  number of networks, followed by (if present)
+                uint32 address, uint8 prefix length (high bit: block mask
+                follows), [uint8 block mask], str name
+
+    Strings are prefixed with their length (uint8). A network name is stored
+    as empty string if it is the default name 'net-<index>'. A presence bit
+    records if the networks came first in the config, so that the order of
+    keys is preserved.
+
+    Raises an exception if the config can't be represented.
+
+    """
+    present = 0
+    bools   = 0
+    body    = b""
+    for key, pack in [("aws", _pack_aws), ("datacenter", _pack_dc),
+                      ("networks", _pack_networks)]:
+        if key in conf:
+            p, b, data = pack(conf[key])
+            present |= p
+            bools   |= b
+            body    += data
+    if list(conf)[:1] == ["networks"]:
+        present |= _NETWORKS_FIRST
+
+    return struct.pack("!HB", present, bools) + body
+
+
+def _unpack_aws(data, pos, present, bools):
+    aws    = {}
+    region = ""
+    if present & _REGION:
+        region, pos = _unpack_str(data, pos)
+        aws['region'] = region
+    if present & _ZONES:
+        zones = aws['zones'] = []
+        num_zones, pos = data[pos], pos + 1
+        for _ in range(num_zones):
+            suffix, pos = _unpack_str(data, pos)
+            zones.append(region + suffix)
+    return aws, pos
+
+
+def _unpack_dc(data, pos, present, bools):
+    cd = {}
+    for bit, key in _DC_BOOLS:
+        if present & bit:
+            cd[key] = bool(bools & (bit >> 4))
+    for bit, key in _DC_INTS:
+        if present & bit:
+            cd[key], = struct.unpack_from("!H", data, pos)
+            pos += 2
+    return cd, pos
+
+
+def _unpack_networks(data, pos, present, bools):
+    networks = []
+    num_networks, = struct.unpack_from("!H", data, pos)
+    pos += 2
+    for i in range(num_networks):
+        addr, plen = struct.unpack_from("!IB", data, pos)
+        pos += 5
+        n = {"cidr" : format_cidr(addr, plen & ~_HAS_BLOCK_MASK)}
+        if plen & _HAS_BLOCK_MASK:
+            block_mask, pos = data[pos], pos + 1
+        name, pos = _unpack_str(data, pos)
+        n['name'] = name or "net-%d" % i
+        if plen & _HAS_BLOCK_MASK:
+            n['block_mask'] = block_mask
+        networks.append(n)
+    return networks, pos
+
+
+def _unpack(data):
+    """
+    Unpack a config packed by _pack().
+
+    """
+    present, bools = struct.unpack_from("!HB", data)
+    pos   = 3
+    parts = []
+    for bit, key, unpack in [(_AWS, "aws", _unpack_aws),
+                             (_DC, "datacenter", _unpack_dc),
+                             (_NETWORKS, "networks", _unpack_networks)]:
+        if present & bit:
+            value, pos = unpack(data, pos, present, bools)
+            parts.append((key, value))
+    if present & _NETWORKS_FIRST:
+        parts.insert(0, parts.pop())
+    return dict(parts)
+
+
+def _candidates(conf):
+    """
+    Produce the (format, payload) tuples that can represent the config.
+
+    """
+    js = json.dumps(conf, separators=(",", ":")).encode("utf-8")
+    yield FORMAT_JSON_ZLIB, zlib.compress(js, 9)
+    try:
+        packed = _pack(conf)
+        # The packed format normalizes some things (such as the order of
+        # keys or the formatting of CIDRs), so it's only used if it exactly
+        # reproduces the config.
+        if json.dumps(_unpack(packed)) != json.dumps(conf):
+            return
+    except Exception:
+        return
+    yield FORMAT_PACKED, packed
+    yield FORMAT_PACKED_ZLIB, zlib.compress(packed, 9)
+
+
+def encode_conf(conf):
+    """
+    Return the compact, URL safe encoding of the config.
+
+    """
+    fmt, payload = min(_candidates(conf), key=lambda c: len(c[1]))
+    return base64.urlsafe_b64encode(
+                        struct.pack("B", fmt) + payload).decode().rstrip("=")
+
+
+def _decompress(data):
+    """
+    Decompress zlib data of up to MAX_CONF_BYTES, raising an exception for
+    anything larger.
+
+    """
+    d      = zlib.decompressobj()
+    result = d.decompress(data, MAX_CONF_BYTES)
+    if d.unconsumed_tail:
+        raise ValueError("Config larger than %d bytes" % MAX_CONF_BYTES)
+    return result
+
+
+def decode_conf(raw_conf):
+    """
+    Decode a config encoded by encode_conf(), or by older versions as plain
+    base64 encoded JSON.
+
+    Raises an exception if the config can't be decoded.
+
+    """
+    data = base64.urlsafe_b64decode(raw_conf + "=" * (-len(raw_conf) % 4))
+    fmt  = data[0]
+    if fmt == ord("{"):
+        return json.loads(data.decode("utf-8"))
+    if fmt == FORMAT_JSON_ZLIB:
+        return json.loads(_decompress(data[1:]).decode("utf-8"))
+    if fmt == FORMAT_PACKED:
+        return _unpack(data[1:])
+    if fmt == FORMAT_PACKED_ZLIB:
+        return _unpack(_decompress(data[1:]))
+    raise ValueError("Unknown config format %d" % fmt)
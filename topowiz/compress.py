@@ -0,0 +1,83 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# Content encodings for topology downloads.
+#
+# Topologies compress extremely well, since they mostly consist of the same
+# keys and indentation over and over. gzip is always available; brotli is
+# offered if the 'brotli' module is installed. Both can compress a body in
+# one go, or chunk by chunk for streamed responses.
+#
+
+import zlib
+
+try:
+    import brotli
+except ImportError:             # pragma: no cover
+    brotli = None
+
+
+# Compression levels, chosen for speed: Higher levels gain little on
+# topologies, at several times the CPU cost.
+GZIP_LEVEL     = 6
+BROTLI_QUALITY = 5
+
+
+def available_encodings():
+    """
+    Return the supported content encodings, the preferred one first.
+
+    """
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def _compressor(encoding):
+    """
+    Return a (compress, flush) tuple of functions for the encoding.
+
+    """
+    if encoding == "gzip":
+        c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return c.compress, c.flush
+    if encoding == "br" and brotli is not None:
+        c = brotli.Compressor(quality=BROTLI_QUALITY)
+        return c.process, c.finish
+    raise ValueError("Unsupported content encoding: %s" % encoding)
+
+
+def compress(data, encoding):
+    """
+    Compress the bytes with the given content encoding.
+
+    """
+    compress_chunk, flush = _compressor(encoding)
+    return compress_chunk(data) + flush()
+
+
+def iter_compressed(chunks, encoding):
+    """
+    Compress a sequence of chunks with the given content encoding, yielding
+    the compressed chunks as they become available.
+
+    """
+    compress_chunk, flush = _compressor(encoding)
+    for chunk in chunks:
+        out = compress_chunk(chunk)
+        if out:
+            yield out
+    yield flush()
@@ -0,0 +1,168 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# Differences between the topologies of two user configs.
+#
+# The difference is expressed as a JSON Patch (RFC 6902): A list of 'add',
+# 'remove' and 'replace' operations, which turn the old topology into the new
+# one when applied in order.
+#
+# Both topologies are compared in their lazy form (see model.py). Two group
+# ranges with the same label and the same kind of children contain identical
+# groups at the same index, so only the groups beyond the shorter range are
+# looked at: Adding a rack to a data center with 256 racks takes a single
+# 'add' operation, found without creating any of the other racks.
+#
+
+from collections.abc import Mapping, Sequence
+
+from .model import GroupRange, to_dict
+from .topo  import build_topology
+
+
+def _escape(key):
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token):
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def _range_shape(r):
+    return (r.label, r.start, r.assignment_key, r.groups_first, r.prefixes)
+
+
+def _same_groups(old, new):
+    """
+    Return True if the two (lazy) sequences of groups are known to be equal,
+    without walking them.
+
+    """
+    if old is new:
+        return True
+    if isinstance(old, GroupRange) and isinstance(new, GroupRange):
+        return old.count == new.count and \
+            _range_shape(old) == _range_shape(new) and \
+            _same_groups(old.children, new.children)
+    return isinstance(old, tuple) and isinstance(new, tuple) and \
+        not old and not new
+
+
+def _common_length(old, new):
+    """
+    Return the number of leading items of two sequences that are known to be
+    equal without comparing them: The length of the shorter range for group
+    ranges that only differ by their length, and 0 otherwise.
+
+    """
+    if isinstance(old, GroupRange) and isinstance(new, GroupRange) and \
+            _range_shape(old) == _range_shape(new) and \
+            _same_groups(old.children, new.children):
+        return min(old.count, new.count)
+    return 0
+
+
+def _diff_sequences(old, new, path, ops):
+    common = _common_length(old, new)
+    for i in range(common, min(len(old), len(new))):
+        _diff(old[i], new[i], "%s/%d" % (path, i), ops)
+    # Removals start at the end, so that the indices of the remaining items
+    # stay valid.
+    for i in reversed(range(len(new), len(old))):
+        ops.append({"op" : "remove", "path" : "%s/%d" % (path, i)})
+    for i in range(len(old), len(new)):
+        ops.append({"op" : "add", "path" : "%s/%d" % (path, i),
+                    "value" : to_dict(new[i])})
+
+
+def _diff_mappings(old, new, path, ops):
+    for key in old:
+        if key not in new:
+            ops.append({"op" : "remove", "path" : path + "/" + _escape(key)})
+    for key in new:
+        if key in old:
+            _diff(old[key], new[key], path + "/" + _escape(key), ops)
+        else:
+            ops.append({"op" : "add", "path" : path + "/" + _escape(key),
+                        "value" : to_dict(new[key])})
+
+
+def _diff(old, new, path, ops):
+    if isinstance(old, Mapping) and isinstance(new, Mapping):
+        _diff_mappings(old, new, path, ops)
+    elif isinstance(old, Sequence) and not isinstance(old, str) and \
+            isinstance(new, Sequence) and not isinstance(new, str):
+        if not _same_groups(old, new):
+            _diff_sequences(old, new, path, ops)
+    elif old != new or type(old) is not type(new):
+        ops.append({"op" : "replace", "path" : path, "value" : to_dict(new)})
+
+
+def diff_topologies(old_topo, new_topo):
+    """
+    Return the JSON Patch that turns one topology into the other. Both may be
+    lazy topologies or plain dicts, as returned by build_topology().
+
+    """
+    ops = []
+    _diff(old_topo, new_topo, "", ops)
+    return ops
+
+
+def diff_configs(old_conf, new_conf, prefixes=False):
+    """
+    Return the JSON Patch that turns the topology of the old config into
+    that of the new config, without building either topology in full. See
+    topo.build_topology() for 'prefixes'.
+
+    """
+    return diff_topologies(build_topology(old_conf, lazy=True,
+                                          prefixes=prefixes),
+                           build_topology(new_conf, lazy=True,
+                                          prefixes=prefixes))
+
+
+def apply_patch(doc, patch):
+    """
+    Apply a JSON Patch, as returned by diff_configs(), to a topology of plain
+    dicts and lists. The topology is modified in place and returned.
+
+    """
+    for op in patch:
+        tokens = [_unescape(t) for t in op["path"].split("/")[1:]]
+        if not tokens:
+            doc = op["value"]
+            continue
+        parent = doc
+        for token in tokens[:-1]:
+            parent = parent[int(token) if isinstance(parent, list)
+                            else token]
+        key = tokens[-1]
+        if isinstance(parent, list):
+            key = len(parent) if key == "-" else int(key)
+            if op["op"] == "add":
+                parent.insert(key, op["value"])
+            elif op["op"] == "remove":
+                del parent[key]
+            else:
+                parent[key] = op["value"]
+        elif op["op"] == "remove":
+            del parent[key]
+        else:
+            parent[key] = op["value"]
+    return doc
@@ -0,0 +1,204 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# Cost estimates for topologies, calculated before anything is built.
+#
+# The lazy topology of a config (see model.py) describes each run of groups
+# by a single GroupRange, so it costs next to nothing to create. From it, the
+# number of groups, the depth and the serialized size are calculated level by
+# level: Every group of a range is serialized like the last one, except for
+# the digits of its index in the name and assignment, which are summed up in
+# closed form. The size is exact, except that with prefixes all CIDRs of a
+# range are assumed to be as long as those of its last group, which mostly
+# overestimates the size by a few percent.
+#
+
+from .model     import Group, GroupRange
+from .serialize import FORMATS, encode, iter_topology
+from .topo      import build_topology
+
+
+def format_lengths(label, start, count):
+    """
+    Return the total length of 'label % i' for i in range(start, start +
+    count), for a label with a single integer format such as '%d' or '%02d'.
+
+    The length only changes with the number of digits of i, so there is one
+    step per power of ten.
+
+    """
+    total = 0
+    i     = start
+    end   = start + count
+    while i < end:
+        next_power = 10 ** len(str(i))
+        run        = min(end, next_power) - i
+        total     += run * len(label % i)
+        i         += run
+    return total
+
+
+def _list_size(item_sizes, num_items, indent, level):
+    """
+    Size of a JSON list with the given total size of its items.
+
+    """
+    if num_items == 0:
+        return 2
+    size = 2 + item_sizes + (num_items - 1)
+    if indent is not None:
+        # A line break and indentation before each item and the closing
+        # bracket.
+        size += num_items * (1 + indent * (level + 1)) + 1 + indent * level
+    return size
+
+
+def _groups_size(groups, indent, level):
+    """
+    Serialized size of a sequence of groups at the given nesting level.
+
+    """
+    if isinstance(groups, GroupRange):
+        if groups.count == 0:
+            return 2
+        # With prefixes, the last group tends to have the longest CIDRs.
+        sample    = groups[-1]
+        # The name appears in the assignment as well, if there is one.
+        num_names = 1 + bool(groups.assignment_key)
+        per_group = _group_size(sample, indent, level + 1) - \
+            num_names * len(sample.name)
+        names     = format_lengths(groups.label, groups.start, groups.count)
+        return _list_size(per_group * groups.count + num_names * names,
+                          groups.count, indent, level)
+    groups = list(groups)
+    return _list_size(sum(_group_size(g, indent, level + 1) for g in groups),
+                      len(groups), indent, level)
+
+
+def _group_size(group, indent, level):
+    """
+    Serialized size of a single group, including its children.
+
+    """
+    shell = Group(group.name, group.assignment, (), group.groups_first,
+                  group.prefixes)
+    # The encoded shell has an empty list of groups, '[]', in their place.
+    return len(encode(shell, indent, level)) - 2 + \
+        _groups_size(group.groups, indent, level + 1)
+
+
+def _count(groups):
+    """
+    Return the number of groups and the depth of a sequence of groups.
+
+    """
+    if isinstance(groups, GroupRange):
+        if groups.count == 0:
+            return 0, 0
+        num, depth = _count(groups.children)
+        return groups.count * (1 + num), 1 + depth
+    num, depth = 0, 0
+    for g in groups:
+        n, d   = _count(g.groups)
+        num   += 1 + n
+        depth  = max(depth, 1 + d)
+    return num, depth
+
+
+def estimate_topology(topo, fmt="pretty"):
+    """
+    Return the estimates (see estimate()) for a lazy topology.
+
+    """
+    num_groups = 0
+    depth      = 0
+    for t in topo["topologies"]:
+        n, d        = _count(t["map"])
+        num_groups += n
+        depth       = max(depth, d)
+
+    if fmt == "ranges":
+        # The size of this format only depends on the depth.
+        size = len(b"".join(iter_topology(topo, fmt)))
+    else:
+        indent = FORMATS[fmt]
+        # The topology with empty maps, whose '[]' are then replaced by the
+        # size of the maps. Maps are at level 3: topologies, list, topology.
+        shell  = dict(topo, topologies=[dict(t, map=[])
+                                         for t in topo["topologies"]])
+        size   = len(encode(shell, indent).encode("utf-8"))
+        size  += sum(_groups_size(t["map"], indent, 3) - 2
+                     for t in topo["topologies"])
+    return {
+        "groups" : num_groups,
+        "depth"  : depth,
+        "bytes"  : size
+    }
+
+
+def estimate_group(group, fmt="pretty"):
+    """
+    Return the estimates (see estimate()) for a single group of a lazy
+    topology, including its children, serialized on its own.
+
+    """
+    num_groups, depth = _count([group])
+    if fmt == "ranges":
+        size = len(b"".join(iter_topology(group, fmt)))
+    else:
+        size = _group_size(group, FORMATS[fmt], 0)
+    return {
+        "groups" : num_groups,
+        "depth"  : depth,
+        "bytes"  : size
+    }
+
+
+def estimate(conf, prefixes=False, fmt="pretty"):
+    """
+    Estimate the cost of the topology for a user config, without building
+    it. Returns a dictionary with the total number of groups, the depth (the
+    largest number of nested levels of groups) and the size in bytes of the
+    topology, serialized in the given format (see serialize.FORMATS).
+
+    Raises an exception if the topology can't be built, as
+    topo.build_topology() would.
+
+    """
+    return estimate_topology(build_topology(conf, lazy=True,
+                                            prefixes=prefixes), fmt)
+
+
+class TopologyTooLarge(Exception):
+    pass
+
+
+def check_limits(cost, max_groups=None, max_bytes=None):
+    """
+    Raise TopologyTooLarge if the estimated cost from estimate() exceeds
+    either limit. A limit of None isn't checked.
+
+    """
+    if max_groups is not None and cost["groups"] > max_groups:
+        raise TopologyTooLarge("The topology would have %d groups, more "
+                               "than the limit of %d." %
+                               (cost["groups"], max_groups))
+    if max_bytes is not None and cost["bytes"] > max_bytes:
+        raise TopologyTooLarge("The topology would have a size of %d bytes, "
+                               "more than the limit of %d." %
+                               (cost["bytes"], max_bytes))
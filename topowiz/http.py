@@ -15,53 +15,83 @@ limitations under the License.
 
 """
 
-import base64
-import ipaddr
-import json
-import string
+# Imported first, so that the start up timer also covers the other imports.
+from .startup    import timer as startup_timer, defer_flask_s3, \
+                        use_precompiled_templates
 
-from flask     import Flask, render_template, request, redirect, url_for
-from wtforms   import RadioField, SelectMultipleField, StringField, \
-                      SubmitField, IntegerField, validators, widgets
-from flask_wtf import FlaskForm
-from flask_s3  import FlaskS3
+import functools
+import json
 
-from .topo     import calculate_num_groups, build_topology
+from flask       import Flask, Response, abort, render_template, request, \
+                        redirect, url_for, make_response
+from wtforms     import RadioField, SelectMultipleField, StringField, \
+                        SubmitField, IntegerField, TextAreaField, FileField, \
+                        validators, widgets
+from flask_wtf   import FlaskForm
+
+from .cache      import TopologyCache, config_hash, response_etag
+from .codec      import decode_conf, encode_conf
+from .compress   import available_encodings, compress, iter_compressed
+from .metrics    import metrics
+from .model      import find_group
+from .networks   import find_network_conflicts, network_cidr_error, \
+                        network_name_error, parse_network_list
+from .serialize  import FORMATS as TOPOLOGY_FORMATS, iter_topology
+from .topo       import build_topology, calculate_num_groups, is_routed, \
+                        topology_confs
+from .validation import AWS_REGIONS, AWS_ZONES, conf_errors
 
 
 app = Flask(__name__, static_url_path="/static")
 app.secret_key = "secret key, which we don't really need for this"
 app.config.from_object("topowiz.app_config")
 
-s3 = FlaskS3(app)
-
-
-AWS_REGIONS = [
-    "us-east-1",
-    "us-west-1",
-    "us-west-2",
-    "eu-west-1",
-    "eu-central-1",
-    "ap-southeast-1",
-    "ap-southeast-2",
-    "ap-northeast-1",
-    "sa-east-1"
-]
-
-
-AWS_ZONES = {
-    "us-east-1"      : ["us-east-1a", "us-east-1b", "us-east-1c",
-                        "us-east-1d", "us-east-1e"],
-    "us-west-1"      : ["us-west-1a", "us-west-1b"],
-    "us-west-2"      : ["us-west-2a", "us-west-2b", "us-west-2c"],
-    "eu-west-1"      : ["eu-west-1a", "eu-west-1b", "eu-west-1c"],
-    "eu-central-1"   : ["eu-central-1a", "eu-central-1b"],
-    "ap-southeast-1" : ["ap-southeast-1a", "ap-southeast-1b"],
-    "ap-southeast-2" : ["ap-southeast-2a", "ap-southeast-2b",
-                        "ap-southeast-2c"],
-    "ap-northeast-1" : ["ap-northeast-1a", "ap-northeast-1c"],
-    "sa-east-1"      : ["sa-east-1a", "sa-east-1b", "sa-east-1c"]
-}
+# Flask-S3 (and boto3) are only loaded once the first template is rendered.
+defer_flask_s3(app)
+use_precompiled_templates(app)
+
+metrics.configure(app.config['METRICS_ENABLED'],
+                  app.config['METRICS_TRACE_MEMORY'])
+
+
+class _TimedTemplate(app.jinja_env.template_class):
+    # Every template is rendered through this class (precompiled ones as
+    # well), so that rendering is recorded as a stage of the view.
+    def render(self, *args, **kwargs):
+        with metrics.stage("render"):
+            return super(_TimedTemplate, self).render(*args, **kwargs)
+
+
+app.jinja_env.template_class = _TimedTemplate
+
+# Server-side store for configs and topologies, or None, see store.py. The
+# modules of the routes that need them, or that are used by few requests,
+# are only imported when they are needed, to shorten the cold start.
+config_store = None
+if app.config['CONFIG_STORE_BACKEND']:
+    from .store import open_store
+    config_store = open_store(app.config['CONFIG_STORE_BACKEND'],
+                              app.config['CONFIG_STORE_PATH'],
+                              app.config['CONFIG_STORE_CACHE_ENTRIES'],
+                              app.config['CONFIG_STORE_MAX_BYTES'],
+                              app.config['CONFIG_STORE_MAX_AGE'])
+
+topo_cache = TopologyCache(max_entries=app.config['TOPO_CACHE_MAX_ENTRIES'],
+                           max_bytes=app.config['TOPO_CACHE_MAX_BYTES'],
+                           config_store=config_store)
+
+# Profiling of single requests, see profiler.py.
+profiling     = False
+profile_store = None
+if app.config['PROFILING_ENABLED']:
+    from .profiler import ProfileStore, profiling_allowed
+    profiling = profiling_allowed(True, app.config['PROFILING_ALLOW_LAMBDA'])
+    if profiling:
+        profile_store = ProfileStore(
+                            max_entries=app.config['PROFILING_MAX_ENTRIES'])
+    else:
+        app.logger.warning("Profiling is enabled in the config, but refused "
+                           "on AWS Lambda (see PROFILING_ALLOW_LAMBDA)")
 
 
 VALID_PARAMS = [
@@ -101,6 +131,13 @@ HELP_TEXT_NETWORK = \
      "networks to make it easier for you to keep track of them, or just "
      "accept the generated default name.")
 
+HELP_TEXT_BULK_NETWORKS = \
+    ("Instead of entering networks one by one, you can paste a list of "
+     "networks or upload a file with one network per line. Each line "
+     "contains a CIDR, optionally preceded by a name for the network. "
+     "Networks without a name are named automatically. Lines starting with "
+     "'#' are ignored.")
+
 HELP_TEXT_MORE_NETWORKS = \
     ("You can define more than one network for your topology. If you are "
      "done adding networks, press 'Finalize' to create the full topology "
@@ -147,15 +184,42 @@ def render_conf(conf):
 def conf_to_url(conf):
     """
     Provides a URL safe version of the config, which therefore can be included
-    in each request.
+    in each request. See codec.py for the encoding. With a config store, the
+    config is saved there, and its short ID is used instead.
 
     """
-    return base64.urlsafe_b64encode(json.dumps(conf).encode("utf=8")).decode()
+    if config_store is not None:
+        with metrics.stage("save"):
+            return config_store.put_conf(conf)
+    return encode_conf(conf)
+
+
+def load_conf(raw_conf):
+    """
+    Return the config for the config part of a URL, which is either an
+    encoded config or the ID of a config in the config store.
+
+    Raises an exception if there is no such config.
+
+    """
+    from .store import is_conf_id
+    if is_conf_id(raw_conf):
+        conf = None
+        if config_store is not None:
+            with metrics.stage("load"):
+                conf = config_store.get_conf(raw_conf)
+        if conf is None:
+            raise KeyError("Unknown config ID '%s'" % raw_conf)
+        return conf
+    with metrics.stage("decode"):
+        return decode_conf(raw_conf)
 
 
 def get_conf(raw_conf):
     """
-    Extract the configuration from the urlencoded version.
+    Extract the configuration from the urlencoded version. Configs in the
+    plain base64 encoding of older URLs, and IDs of configs in the config
+    store, are accepted as well.
 
     Returns tuple of (conf, error)
 
@@ -164,8 +228,7 @@ def get_conf(raw_conf):
 
     """
     try:
-        conf = json.loads(base64.urlsafe_b64decode(raw_conf).decode("utf-8"))
-        return conf, None
+        return load_conf(raw_conf), None
     except Exception:
         return None, render_template(
                             'error.html',
@@ -173,18 +236,186 @@ def get_conf(raw_conf):
                                         "configuration!")
 
 
+def want_prefixes():
+    """
+    Return True if the request asks for the address prefixes of the groups
+    to be included in the topology.
+
+    """
+    return request.args.get("prefixes", "") not in ("", "0", "false", "no")
+
+
+def want_dont_care():
+    """
+    Return True if the request allows the unassigned address space of the
+    networks to be covered by summary routes (see routes.py).
+
+    """
+    return request.args.get("dont_care", "") not in ("", "0", "false", "no")
+
+
+def want_format():
+    """
+    Return the format of the topology asked for by the 'format' query
+    parameter: 'pretty' (the default), 'min' or 'ranges'.
+
+    Raises an exception for unknown formats.
+
+    """
+    fmt = request.args.get("format", "pretty")
+    if fmt not in TOPOLOGY_FORMATS:
+        raise ValueError("Unknown format '%s', should be one of: %s" %
+                         (fmt, ", ".join(sorted(TOPOLOGY_FORMATS))))
+    return fmt
+
+
+def want_group():
+    """
+    Return the group of the topology asked for by the 'group' query
+    parameter, as (topology index, path) tuple for model.find_group(), or
+    None for the whole topology.
+
+    The path is given as names or indices separated by '/', such as
+    'rack-3/host-5' or '3/5'. The 'topology' query parameter selects one of
+    several topologies by its index (default: 0).
+
+    Raises an exception for an invalid topology index.
+
+    """
+    group = request.args.get("group", "").strip("/")
+    if not group:
+        return None
+    index = request.args.get("topology", "0")
+    if not index.isdigit():
+        raise ValueError("The topology should be given by its index")
+    path = [int(key) if key.isdigit() else key for key in group.split("/")]
+    return int(index), path
+
+
+def want_encoding():
+    """
+    Return the content encoding for the response ('br' or 'gzip'), chosen
+    from those accepted by the client, or None.
+
+    """
+    if not app.config['COMPRESSION_ENABLED']:
+        return None
+    return request.accept_encodings.best_match(available_encodings())
+
+
+def want_profile():
+    """
+    Return True if profiling is enabled and the request asks to be profiled,
+    with the 'profile' query parameter or the X-Topowiz-Profile header.
+
+    """
+    if not profiling:
+        return False
+    flag = request.args.get("profile") or \
+        request.headers.get("X-Topowiz-Profile", "")
+    return flag not in ("", "0", "false", "no")
+
+
+def request_conf_hash(view_args):
+    """
+    Return the config hash of the current request: For the views, that of
+    the config(s) in the URL, for the API that of the posted JSON.
+
+    """
+    if not view_args:
+        return config_hash(request.get_json(force=True, silent=True))
+    try:
+        confs = [load_conf(view_args[k]) for k in sorted(view_args)]
+    except Exception:
+        confs = [view_args[k] for k in sorted(view_args)]
+    return config_hash(confs[0] if len(confs) == 1 else confs)
+
+
+def profiled(view):
+    """
+    Decorator for views that can be profiled on request (see want_profile()).
+
+    The stats are stored by config hash and view, and the URL of their
+    summary is returned in the X-Topowiz-Profile header of the response. For
+    streamed responses, the profile continues until the last chunk is sent.
+
+    """
+    @functools.wraps(view)
+    def wrapper(**view_args):
+        if not want_profile():
+            return view(**view_args)
+        from .profiler import ProfiledChunks, profile_id
+        profile = profile_store.start()
+        if profile is None:
+            # Another request is profiled at the moment.
+            return view(**view_args)
+        pid = profile_id(request_conf_hash(view_args), request.endpoint)
+        try:
+            response = make_response(view(**view_args))
+        except Exception:
+            profile_store.finish(pid, profile)
+            raise
+        if response.is_streamed:
+            profile.disable()
+            response.response = ProfiledChunks(response.response,
+                                               profile_store, pid, profile)
+        else:
+            profile_store.finish(pid, profile)
+        response.headers['X-Topowiz-Profile'] = \
+            url_for('.profile_summary', pid=pid)
+        return response
+    return wrapper
+
+
+def not_modified(etag):
+    """
+    Return a 304 response if the client already has the response with the
+    given ETag, or None otherwise.
+
+    This is checked before any topology is built: The responses of the views
+    that use it depend on nothing but the URL, so a matching ETag means that
+    the client's copy is still valid.
+
+    """
+    if etag in request.if_none_match:
+        return cacheable(Response(status=304), etag)
+    return None
+
+
+def cacheable(response, etag):
+    """
+    Mark the response as cacheable forever, identified by the ETag.
+
+    """
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = "public, max-age=%d, immutable" % \
+        app.config['HTTP_CACHE_MAX_AGE']
+    return response
+
+
 # ------------------
 # Forms
 # ------------------
 
-class IsAwsForm(FlaskForm):
+class WizardForm(FlaskForm):
+    """
+    Base class of the forms of the wizard, which records the validation as a
+    stage of the view.
+
+    """
+    def validate(self, *args, **kwargs):
+        with metrics.stage("validate"):
+            return super(WizardForm, self).validate(*args, **kwargs)
+
+
+class IsAwsForm(WizardForm):
     is_aws = RadioField('Where is your deployment?',
                         choices=[("aws", 'In an AWS VPC'),
                                  ("dc",  'In my own datacenter')])
     submit = SubmitField(label='Submit')
 
 
-class DcOwnPrefixForm(FlaskForm):
+class DcOwnPrefixForm(WizardForm):
     dc_pg_per_host = RadioField('Should each host have its own CIDR prefix '
                                 'for endpoint addresses?',
                                  choices=[("yes", "Yes"), ("no", "No")],
@@ -192,7 +423,7 @@ class DcOwnPrefixForm(FlaskForm):
     submit = SubmitField(label='Submit')
 
 
-class DcFlatNetForm(FlaskForm):
+class DcFlatNetForm(WizardForm):
     dc_flat_net = RadioField('Do you have a flat network in your data '
                              'center? Are all hosts on a single L2 segment?',
                               choices=[("yes", "Yes"), ("no", "No")],
@@ -200,7 +431,7 @@ class DcFlatNetForm(FlaskForm):
     submit = SubmitField(label='Submit')
 
 
-class DcFlatNetNumHostsForm(FlaskForm):
+class DcFlatNetNumHostsForm(WizardForm):
     dc_flat_net_num_hosts = IntegerField(
                                 'Maximum number of hosts in cluster?',
                                 validators=[
@@ -212,7 +443,7 @@ class DcFlatNetNumHostsForm(FlaskForm):
     submit = SubmitField(label='Submit')
 
 
-class DcRacksForm(FlaskForm):
+class DcRacksForm(WizardForm):
     dc_num_racks = IntegerField('Maximum number of racks in data center?',
                                 validators=[
                                     validators.DataRequired(),
@@ -220,16 +451,65 @@ class DcRacksForm(FlaskForm):
                                         message="Should be between 1 and 256",
                                         min=1, max=256)
                                 ])
+    submit       = SubmitField(label='Submit')
+
+
+class DcRacksHostsForm(DcRacksForm):
+    # Need to ask for number of hosts per rack only if a PG per host was
+    # selected. The submit button is defined again, so that it comes after
+    # the additional field.
+    dc_num_hosts_per_rack = IntegerField(
+                                'Maximum number of hosts per rack?',
+                                validators=[
+                                    validators.DataRequired(),
+                                    validators.NumberRange(
+                                        message="Should be between 1 and 256",
+                                        min=1, max=1024)
+                                ])
+    submit                = SubmitField(label='Submit')
 
 
-class AwsRegionForm(FlaskForm):
+class AwsRegionForm(WizardForm):
     aws_region = RadioField('Select the AWS region of your cluster:',
                             choices=[(r, r) for r in AWS_REGIONS],
                             validators=[validators.DataRequired()])
     submit = SubmitField(label='Submit')
 
 
-class AddNetworkForm(FlaskForm):
+_AWS_ZONES_FORMS = {}
+
+
+def aws_zones_form_class(region):
+    """
+    Return the form class for selecting the zones of the given region.
+
+    The zones form needs to be dynamically created, because the zones depend
+    on the chosen region. The class for each region is created on first use
+    and then reused.
+
+    """
+    form_class = _AWS_ZONES_FORMS.get(region)
+    if form_class is None:
+        class _AwsZonesForm(WizardForm):
+            # Thank you to the explanation of how to get checkboxes with
+            # WTForms:
+            # http://www.ergo.io/tutorials/persuading-wtforms/
+            #                      persuading-wtforms-to-generate-checkboxes/
+            aws_zones = \
+                SelectMultipleField(
+                    'Select one or more availability zones for the cluster:',
+                    choices=[(r, r) for r in AWS_ZONES[region]],
+                    validators=[validators.DataRequired()],
+                    option_widget=widgets.CheckboxInput(),
+                    widget=widgets.ListWidget(prefix_label=False)
+                )
+            submit = SubmitField(label='Submit')
+
+        form_class = _AWS_ZONES_FORMS[region] = _AwsZonesForm
+    return form_class
+
+
+class AddNetworkForm(WizardForm):
     net_cidr   = StringField('Valid IPv4 CIDR for network address range:',
                              [validators.required()])
     net_name   = StringField('User friendly name of network:',
@@ -254,25 +534,9 @@ class AddNetworkForm(FlaskForm):
         Custom validator for the CIDR field.
 
         """
-        cidr    = field.data
-        err_msg = "Not a valid CIDR"
-        try:
-            net, host = cidr.split("/")
-            host = int(host)
-            if host < 1 or host > 32:
-                raise Exception()
-            ipaddr.IPNetwork(cidr)
-            other_cidrs = [n['cidr'] for n in self.conf.get('networks', [])]
-            if cidr in other_cidrs:
-                err_msg = "This CIDR is already in use."
-                raise Exception()
-            cidr_obj = ipaddr.IPNetwork(cidr)
-            for other_cidr in other_cidrs:
-                if cidr_obj.overlaps(ipaddr.IPNetwork(other_cidr)):
-                    err_msg = "CIDR '%s' overlaps with existing CIDR '%s'" % \
-                              (cidr, other_cidr)
-                    raise Exception()
-        except Exception:
+        err_msg = network_cidr_error(field.data,
+                                     self.conf.get('networks', []))
+        if err_msg:
             raise validators.ValidationError(err_msg)
 
     def validate_net_name(self, field):
@@ -280,27 +544,64 @@ class AddNetworkForm(FlaskForm):
         Custom validator for network name.
 
         """
-        name = field.data
-
-        valid_letters      = string.ascii_letters + string.digits + "_-"
-        valid_first_letter = string.ascii_letters
+        err_msg = network_name_error(field.data,
+                                     self.conf.get('networks', []))
+        if err_msg:
+            raise validators.ValidationError(err_msg)
 
-        if name[0] not in valid_first_letter or \
-                any(l for l in name[1:] if l not in valid_letters):
-            raise validators.ValidationError("Invalid name. Use letters, "
-                                             "digits, '_' and '-'. First "
-                                             "character has to be letter.")
-        if not 1 < len(name) < 40:
-            raise validators.ValidationError("Name should be between 1 and "
-                                             "40 chracters.")
 
-        other_names = [n['name'] for n in self.conf.get('networks', [])]
+class BulkNetworksForm(WizardForm):
+    networks      = TextAreaField('Networks, one per line, as '
+                                  '"<name> <cidr>" or "<cidr>":',
+                                  render_kw={"rows" : 12, "cols" : 40})
+    networks_file = FileField('... or upload a file with networks:')
+    submit        = SubmitField(label='Import')
 
-        if name and name in other_names:
-            raise validators.ValidationError("This name is already in use.")
+    def __init__(self, *args, **kwargs):
+        self.conf = kwargs['conf']
+        del kwargs['conf']
+        self.new_networks = []
+        super(BulkNetworksForm, self).__init__(*args, **kwargs)
 
+    def validate_networks(self, field):
+        """
+        Parse the pasted or uploaded networks and check them all at once.
+        All problems are reported, not just the first one.
 
-class AddMoreNetworksForm(FlaskForm):
+        """
+        text = field.data or ""
+        if self.networks_file.data:
+            # The request size is limited by MAX_CONTENT_LENGTH already, but
+            # the file is read with a limit anyway, in case that's disabled.
+            max_bytes = app.config['MAX_CONTENT_LENGTH'] or 1024 * 1024
+            data      = self.networks_file.data.read(max_bytes + 1)
+            if len(data) > max_bytes:
+                raise validators.ValidationError(
+                    "The file is too large, the limit is %d bytes." %
+                    max_bytes)
+            text += "\n" + data.decode("utf-8", "replace")
+        existing = self.conf.get('networks', [])
+        self.new_networks, errors = parse_network_list(text, len(existing))
+        if not self.new_networks and not errors:
+            errors.append("No networks were provided.")
+        errors += find_network_conflicts(self.new_networks, existing)
+
+        if self.conf.get('aws') and not errors:
+            try:
+                calculate_num_groups(
+                    self.conf,
+                    num_networks=len(existing) + len(self.new_networks))
+            except Exception as e:
+                errors.append(str(e))
+
+        if errors:
+            # Adding all but the last error directly, since a
+            # ValidationError can only carry a single message.
+            field.errors.extend(errors[:-1])
+            raise validators.ValidationError(errors[-1])
+
+
+class AddMoreNetworksForm(WizardForm):
     add_more = SubmitField(label='Add more')
     finalize = SubmitField(label='Finalize')
 
@@ -309,6 +610,55 @@ class AddMoreNetworksForm(FlaskForm):
 # Views
 # ------------------
 
+@app.before_request
+def _time_first_request():
+    startup_timer.request_started()
+
+
+@app.after_request
+def _report_first_request(response):
+    if startup_timer.first_request is not None and \
+            not any(m[0] == "first request done" for m in startup_timer.marks):
+        startup_timer.mark("first request done")
+        if app.config.get('STARTUP_REPORT'):
+            app.logger.info("Startup timing (ms): %s",
+                            json.dumps(startup_timer.report()))
+    return response
+
+
+@app.before_request
+def _limit_request_size():
+    # Flask only applies MAX_CONTENT_LENGTH to form data, not to the JSON
+    # bodies of the API.
+    max_bytes = app.config['MAX_CONTENT_LENGTH']
+    if max_bytes is not None and (request.content_length or 0) > max_bytes:
+        abort(413)
+
+
+@app.before_request
+def _begin_metrics():
+    if metrics.enabled:
+        metrics.begin_request(request.endpoint)
+
+
+@app.after_request
+def _record_metrics(response):
+    if metrics.enabled:
+        metrics.observe_request(request.endpoint, response.status_code)
+        # Streamed responses record their size as they are sent, see
+        # topology_response().
+        if not response.is_streamed:
+            metrics.observe_bytes(request.endpoint,
+                                  response.calculate_content_length() or 0)
+    return response
+
+
+@app.teardown_request
+def _end_metrics(exc):
+    if metrics.enabled:
+        metrics.end_request()
+
+
 @app.route('/', methods=['GET'])
 def home():
     return render_template('welcome.html', conf_url=conf_to_url({}))
@@ -407,27 +757,11 @@ def dc_racks(raw_conf):
     if err:
         return err
 
-    class _DcRacksForm(DcRacksForm):
-        pass
-
     cd = conf['datacenter']
     if cd['prefix_per_host']:
-        # Need to ask for number of hosts per rack only if a PG per host was
-        # selected.
-        dc_num_hosts_per_rack = IntegerField(
-                                'Maximum number of hosts per rack?',
-                                validators=[
-                                    validators.DataRequired(),
-                                    validators.NumberRange(
-                                        message="Should be between 1 and 256",
-                                        min=1, max=1024)
-                                ])
-        setattr(_DcRacksForm, "dc_num_hosts_per_rack", dc_num_hosts_per_rack)
-
-    submit = SubmitField(label='Submit')
-    setattr(_DcRacksForm, "submit", submit)
-
-    form = _DcRacksForm()
+        form = DcRacksHostsForm()
+    else:
+        form = DcRacksForm()
 
     if form.validate_on_submit():
         cd['num_racks'] = form.dc_num_racks.data
@@ -500,33 +834,15 @@ def aws_zones(raw_conf):
     """
     Asking for the AWS Zones in which the cluster is deployed.
 
-    Note that our form is generated dynamically within this function here
-    (closure), because the zones presented for selection depend on an earlier
-    choice (the region).
+    Note that the form class depends on an earlier choice (the region), see
+    aws_zones_form_class().
 
     """
     conf, err = get_conf(raw_conf)
     if err:
         return err
 
-    class _AwsZonesForm(FlaskForm):
-        # The zones form needs to be dynamically created, because the
-        # zones depend on the chosen region. That's why it is defined here in
-        # this function, rather with all the other forms.
-        # Thank you to the explanation of how to get checkboxes with WTForms:
-        # http://www.ergo.io/tutorials/persuading-wtforms/
-        #                          persuading-wtforms-to-generate-checkboxes/
-        aws_zones = \
-            SelectMultipleField(
-                'Select one or more availability zones for the cluster:',
-                choices=[(r, r) for r in AWS_ZONES[conf['aws']['region']]],
-                validators=[validators.DataRequired()],
-                option_widget=widgets.CheckboxInput(),
-                widget=widgets.ListWidget(prefix_label=False)
-            )
-        submit = SubmitField(label='Submit')
-
-    form = _AwsZonesForm()
+    form = aws_zones_form_class(conf['aws']['region'])()
 
     if form.validate_on_submit():
         conf['aws']['zones'] = form.aws_zones.data
@@ -596,9 +912,42 @@ def gen_networks(raw_conf):
                            render_conf=render_conf(conf),
                            help_text=HELP_TEXT_NETWORK,
                            done="80%",
+                           bulk_link=url_for('.gen_bulk_networks',
+                                             raw_conf=raw_conf),
                            action=url_for('.gen_networks',
                                           raw_conf=raw_conf))
 
+
+@app.route('/gen/bulk_nets/<path:raw_conf>', methods=['GET', 'POST'])
+def gen_bulk_networks(raw_conf):
+    """
+    Add many networks at once, pasted as a list or uploaded as a file.
+
+    """
+    conf, err = get_conf(raw_conf)
+    if err:
+        return err
+
+    if "networks" not in conf:
+        conf["networks"] = []
+
+    form = BulkNetworksForm(conf=conf)
+
+    if form.validate_on_submit():
+        conf["networks"].extend(form.new_networks)
+        return redirect(url_for('.gen_more_networks',
+                                raw_conf=conf_to_url(conf)))
+
+    return render_template('question.html',
+                           form=form,
+                           multipart=True,
+                           table_title="Import a list of networks:",
+                           render_conf=render_conf(conf),
+                           help_text=HELP_TEXT_BULK_NETWORKS,
+                           done="80%",
+                           action=url_for('.gen_bulk_networks',
+                                          raw_conf=raw_conf))
+
 @app.route('/gen/more_nets/<path:raw_conf>', methods=['GET', 'POST'])
 def gen_more_networks(raw_conf):
     """
@@ -630,41 +979,537 @@ def gen_more_networks(raw_conf):
 
 
 @app.route('/done/<path:raw_conf>', methods=['GET'])
+@profiled
 def done(raw_conf):
     """
     Calculates and displayes the full topology.
 
+    The response is cacheable forever, since it depends on nothing but the
+    URL. With the 'prefixes' query parameter set, the address prefixes of each
+    group are included.
+
     """
+    from .estimate import TopologyTooLarge
     conf, err = get_conf(raw_conf)
     if err:
         return err
 
-    topo = build_topology(conf)
+    prefixes = want_prefixes()
+    etag     = response_etag(conf, "done", prefixes)
+    response = not_modified(etag)
+    if response:
+        return response
+
+    try:
+        cost = topology_cost(conf, prefixes)
+        if cost["bytes"] < app.config['STREAM_MIN_BYTES']:
+            topo, topo_json = topo_cache.get(conf, prefixes)
+            topo_json = topo_json.decode("utf-8")
+        else:
+            # Too large for a page, it's only offered for download.
+            topo_json = None
+    except TopologyTooLarge as e:
+        return render_template('error.html', error_msg=str(e))
+    except Exception as e:
+        if not prefixes:
+            raise
+        return render_template('error.html', error_msg=str(e))
+    if metrics.enabled:
+        metrics.observe_groups(None, cost["groups"])
     # Making a safe encoding for the URL. Note the 'decode' in the very end.
     # That's to remove the annoying   b'...'  formatting around the utf-8
     # encoded byte sequence.
-    download_link = url_for(".download", raw_conf=raw_conf)
+    download_link = url_for(".download", raw_conf=raw_conf,
+                            **({"prefixes" : 1} if prefixes else {}))
+    routes_link   = None
+    if any(is_routed(c) for c in topology_confs(conf)):
+        routes_link = url_for(".routes", raw_conf=raw_conf)
+
+    return cacheable(make_response(
+                        render_template('done.html',
+                                        topo=topo_json,
+                                        topo_bytes=cost["bytes"],
+                                        render_conf=render_conf(conf),
+                                        download_link=download_link,
+                                        routes_link=routes_link)),
+                     etag)
+
+
+def check_cost(cost, fmt="pretty"):
+    """
+    Raise TopologyTooLarge if the estimated cost exceeds the limits of the
+    app config. Only the size is limited in the 'ranges' format, which
+    doesn't grow with the number of groups.
 
-    return render_template('done.html',
-                           topo=json.dumps(topo, indent=4),
-                           render_conf=render_conf(conf),
-                           download_link=download_link)
+    """
+    from .estimate import check_limits
+    max_groups = app.config['MAX_TOPOLOGY_GROUPS']
+    check_limits(cost, None if fmt == "ranges" else max_groups,
+                 app.config['MAX_TOPOLOGY_BYTES'])
+
+
+def topology_cost(conf, prefixes=False, fmt="pretty"):
+    """
+    Return the estimated cost of the topology for the config, in one of the
+    TOPOLOGY_FORMATS (see estimate.py).
+
+    Raises TopologyTooLarge if the topology exceeds the limits of the app
+    config.
+
+    """
+    from .estimate import estimate
+    with metrics.stage("estimate"):
+        cost = estimate(conf, prefixes, fmt)
+    check_cost(cost, fmt)
+    return cost
+
+
+def topology_response(conf, prefixes=False, fmt="pretty", encoding=None,
+                      group=None):
+    """
+    Return the response with the full topology for the config in JSON format,
+    in one of the TOPOLOGY_FORMATS and compressed with the given content
+    encoding, if any. With 'group' from want_group(), only that group is
+    returned (see group_response()).
+
+    Raises TopologyTooLarge, before anything is built, if the topology
+    exceeds the limits of the app config.
+
+    """
+    if group is not None:
+        return group_response(conf, prefixes, fmt, encoding, *group)
+
+    cost = topology_cost(conf, prefixes, fmt)
+    if metrics.enabled:
+        metrics.observe_groups(None, cost["groups"])
+
+    if fmt == "ranges":
+        # Its size only depends on the depth of the topology, so it's
+        # neither streamed nor cached.
+        with metrics.stage("build"):
+            topo = build_topology(conf, lazy=True, prefixes=prefixes)
+        with metrics.stage("serialize"):
+            topo_json = b"".join(iter_topology(topo, fmt))
+    elif cost["bytes"] >= app.config['STREAM_MIN_BYTES']:
+        # Large topologies are streamed while they are generated, rather
+        # than built and serialized in memory first.
+        with metrics.stage("build"):
+            topo = build_topology(conf, lazy=True, prefixes=prefixes)
+        return streamed_response(iter_topology(topo, fmt), encoding)
+    else:
+        topo, topo_json = topo_cache.get(conf, prefixes, fmt)
+    return body_response(topo_json, encoding)
+
+
+def group_response(conf, prefixes, fmt, encoding, index, path):
+    """
+    Return the response with a single group of the topology for the config,
+    such as a rack, with its children. The group is selected by the index of
+    the topology and its path (see model.find_group()), so that only the
+    groups on the path and below the group are built.
+
+    Raises KeyError if there is no such group, and TopologyTooLarge if the
+    group exceeds the limits of the app config.
+
+    """
+    with metrics.stage("build"):
+        topo = build_topology(conf, lazy=True, prefixes=prefixes)
+        if index >= len(topo["topologies"]):
+            raise KeyError("There is no topology %d" % index)
+        try:
+            group = find_group(topo["topologies"][index]["map"], path)
+        except KeyError:
+            raise KeyError("There is no group '%s' in the topology" %
+                           "/".join(str(key) for key in path))
+    from .estimate import estimate_group
+    with metrics.stage("estimate"):
+        cost = estimate_group(group, fmt)
+    check_cost(cost, fmt)
+    if metrics.enabled:
+        metrics.observe_groups(None, cost["groups"])
+
+    chunks = iter_topology(group, fmt)
+    if cost["bytes"] >= app.config['STREAM_MIN_BYTES']:
+        return streamed_response(chunks, encoding)
+    with metrics.stage("serialize"):
+        group_json = b"".join(chunks)
+    return body_response(group_json, encoding)
+
+
+def streamed_response(chunks, encoding):
+    """
+    Return the response for a JSON body that is streamed chunk by chunk, as
+    it is serialized, and compressed with the given content encoding.
+
+    """
+    if encoding:
+        chunks = iter_compressed(chunks, encoding)
+    if metrics.enabled:
+        chunks = metrics.iter_timed(chunks, "serialize")
+    return content_encoded(Response(chunks,
+                                    status=200,
+                                    mimetype='application/json'),
+                           encoding)
+
+
+def body_response(topo_json, encoding):
+    """
+    Return the response for a JSON body, compressed with the given content
+    encoding unless it's too small for that.
+
+    """
+    if len(topo_json) < app.config['COMPRESSION_MIN_BYTES']:
+        encoding = None
+    if encoding:
+        with metrics.stage("compress"):
+            topo_json = compress(topo_json, encoding)
+    response = app.response_class(
+        response=topo_json,
+        status=200,
+        mimetype='application/json'
+    )
+    return content_encoded(response, encoding)
+
+
+def content_encoded(response, encoding):
+    """
+    Set the headers of a response, whose body was compressed with the given
+    content encoding (or not at all, for None).
+
+    """
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
 
 
 @app.route('/download/<path:raw_conf>', methods=['GET'])
+@profiled
 def download(raw_conf):
     """
     Serves the full topology in downloadable JSON format.
 
+    The response is cacheable forever, since it depends on nothing but the
+    URL. With the 'prefixes' query parameter set, the address prefixes of each
+    group are included. The 'format' query parameter selects one of the
+    TOPOLOGY_FORMATS, and the response is compressed if the client accepts
+    it. With the 'group' query parameter, only that group of the topology
+    is served, such as a single rack (see want_group()).
+
     """
+    from .estimate import TopologyTooLarge
     conf, err = get_conf(raw_conf)
     if err:
         return err
 
-    topo = build_topology(conf)
-    response = app.response_class(
-        response=json.dumps(topo, indent=4),
+    try:
+        fmt   = want_format()
+        group = want_group()
+    except ValueError as e:
+        return render_template('error.html', error_msg=str(e))
+
+    prefixes = want_prefixes()
+    encoding = want_encoding()
+    variant  = [prefixes, fmt, encoding] + ([group] if group else [])
+    etag     = response_etag(conf, "download", *variant)
+    response = not_modified(etag)
+    if response:
+        return content_encoded(response, None)
+
+    try:
+        return cacheable(topology_response(conf, prefixes, fmt, encoding,
+                                           group),
+                         etag)
+    except TopologyTooLarge as e:
+        return render_template('error.html', error_msg=str(e))
+    except KeyError as e:
+        return render_template('error.html', error_msg=e.args[0]), 404
+    except Exception as e:
+        if not prefixes:
+            raise
+        return render_template('error.html', error_msg=str(e))
+
+
+def patch_response(patch):
+    with metrics.stage("serialize"):
+        body = json.dumps(patch, indent=4)
+    return app.response_class(
+        response=body,
         status=200,
+        mimetype='application/json-patch+json'
+    )
+
+
+@app.route('/diff/<raw_old_conf>/<path:raw_conf>', methods=['GET'])
+@profiled
+def diff(raw_old_conf, raw_conf):
+    """
+    Serves the changes from the topology of an old config to that of the
+    current config, as JSON Patch (see diff.py).
+
+    The response is cacheable forever, since it depends on nothing but the
+    URL. With the 'prefixes' query parameter set, the address prefixes of each
+    group are included.
+
+    """
+    from .diff import diff_configs
+    old_conf, err = get_conf(raw_old_conf)
+    if err:
+        return err
+    conf, err = get_conf(raw_conf)
+    if err:
+        return err
+
+    prefixes = want_prefixes()
+    etag     = response_etag([old_conf, conf], "diff", prefixes)
+    response = not_modified(etag)
+    if response:
+        return response
+
+    try:
+        for c in (old_conf, conf):
+            topology_cost(c, prefixes)
+        with metrics.stage("build"):
+            patch = diff_configs(old_conf, conf, prefixes)
+    except Exception as e:
+        return render_template('error.html', error_msg=str(e))
+    return cacheable(patch_response(patch), etag)
+
+
+@app.route('/routes/<path:raw_conf>', methods=['GET'])
+@profiled
+def routes(raw_conf):
+    """
+    Serves the summarized routes for the switches of a routed data center
+    (see routes.py) in JSON format. With the 'dont_care' query parameter
+    set, the unassigned address space may be covered by summary routes.
+
+    The response is cacheable forever, since it depends on nothing but the
+    URL.
+
+    """
+    from .routes import route_tables
+    conf, err = get_conf(raw_conf)
+    if err:
+        return err
+
+    dont_care = want_dont_care()
+    etag      = response_etag(conf, "routes", dont_care)
+    response  = not_modified(etag)
+    if response:
+        return response
+
+    try:
+        topology_cost(conf)
+        with metrics.stage("build"):
+            doc = route_tables(conf, dont_care)
+    except Exception as e:
+        return render_template('error.html', error_msg=str(e))
+    return cacheable(json_response(doc), etag)
+
+
+# ------------------
+# API
+# ------------------
+
+def json_response(doc):
+    with metrics.stage("serialize"):
+        body = json.dumps(doc, indent=4)
+    return app.response_class(
+        response=body,
+        status=200,
+        mimetype='application/json'
+    )
+
+
+def api_error(status, errors):
+    return app.response_class(
+        response=json.dumps({"errors" : errors}),
+        status=status,
         mimetype='application/json'
     )
+
+
+@app.route('/api/topology', methods=['POST'])
+@profiled
+def api_topology():
+    """
+    Calculates the full topology for a user config, which is posted as JSON.
+
+    This is for automation, which would otherwise need to go through the
+    wizard: The complete config is validated in one go, with the same rules
+    as in the wizard, and all errors are returned at once (status 400). There
+    is no CSRF protection, since no forms are involved.
+
+    With the 'prefixes' query parameter set, the address prefixes of each
+    group are included. The format, and a single group of the topology, can
+    be chosen with the 'format' and 'group' query parameters, as for
+    /download.
+
+    """
+    conf = request.get_json(force=True, silent=True)
+    if conf is None:
+        return api_error(400, ["The request body should be a JSON object"])
+
+    with metrics.stage("validate"):
+        errors = conf_errors(conf)
+    try:
+        fmt = want_format()
+    except ValueError as e:
+        errors.append(str(e))
+    try:
+        group = want_group()
+    except ValueError as e:
+        errors.append(str(e))
+    if errors:
+        return api_error(400, errors)
+
+    try:
+        return topology_response(conf, want_prefixes(), fmt, want_encoding(),
+                                 group)
+    except KeyError as e:
+        return api_error(404, [e.args[0]])
+    except Exception as e:
+        return api_error(400, [str(e)])
+
+
+@app.route('/api/diff', methods=['POST'])
+@profiled
+def api_diff():
+    """
+    Calculates the changes from the topology of an old config to that of a
+    new config, as JSON Patch. The configs are posted as JSON object of the
+    form {"old" : <config>, "new" : <config>}, and validated as for
+    /api/topology.
+
+    With the 'prefixes' query parameter set, the address prefixes of each
+    group are included.
+
+    """
+    from .diff import diff_configs
+    body = request.get_json(force=True, silent=True)
+    if not isinstance(body, dict) or set(body) != {"old", "new"}:
+        return api_error(400, ["The request body should be a JSON object "
+                               "with the keys 'old' and 'new'"])
+
+    with metrics.stage("validate"):
+        errors = ["%s: %s" % (which, e) for which in ("old", "new")
+                  for e in conf_errors(body[which])]
+    if errors:
+        return api_error(400, errors)
+
+    prefixes = want_prefixes()
+    try:
+        for which in ("old", "new"):
+            topology_cost(body[which], prefixes)
+        with metrics.stage("build"):
+            patch = diff_configs(body["old"], body["new"], prefixes)
+    except Exception as e:
+        return api_error(400, [str(e)])
+    return patch_response(patch)
+
+
+@app.route('/api/routes', methods=['POST'])
+@profiled
+def api_routes():
+    """
+    Calculates the summarized routes for the switches of a routed data
+    center, for a user config that is posted as JSON, and validated as for
+    /api/topology. The 'dont_care' query parameter works as for /routes.
+
+    """
+    from .routes import route_tables
+    conf = request.get_json(force=True, silent=True)
+    if conf is None:
+        return api_error(400, ["The request body should be a JSON object"])
+
+    with metrics.stage("validate"):
+        errors = conf_errors(conf)
+    if errors:
+        return api_error(400, errors)
+
+    try:
+        topology_cost(conf)
+        with metrics.stage("build"):
+            doc = route_tables(conf, want_dont_care())
+    except Exception as e:
+        return api_error(400, [str(e)])
+    return json_response(doc)
+
+
+# ------------------
+# Metrics
+# ------------------
+
+@app.route('/metrics', methods=['GET'])
+def metrics_view():
+    """
+    Serves the request metrics (see metrics.py) in the Prometheus text
+    format, if METRICS_ENABLED is set in the app config.
+
+    """
+    if not metrics.enabled:
+        abort(404)
+    gauges = dict(("topowiz_topology_cache_%s" % key, value)
+                  for key, value in topo_cache.stats().items())
+    return Response(metrics.render(gauges), status=200,
+                    mimetype='text/plain; version=0.0.4')
+
+
+# ------------------
+# Profiling
+# ------------------
+
+@app.route('/profile', methods=['GET'])
+def profile_list():
+    """
+    Lists the IDs of the stored profiles, one per line.
+
+    """
+    if not profiling:
+        abort(404)
+    return Response("".join(pid + "\n" for pid in profile_store.ids()),
+                    status=200, mimetype='text/plain')
+
+
+@app.route('/profile/<pid>', methods=['GET'])
+def profile_summary(pid):
+    """
+    Serves the hottest functions of a stored profile as text. The number of
+    functions and the sort order can be given with the 'top' and 'sort'
+    query parameters.
+
+    """
+    if not profiling:
+        abort(404)
+    try:
+        text = profile_store.summary(pid,
+                                     request.args.get("top", 30, type=int),
+                                     request.args.get("sort", "cumulative"))
+    except ValueError as e:
+        return api_error(400, [str(e)])
+    if text is None:
+        abort(404)
+    return Response(text, status=200, mimetype='text/plain')
+
+
+@app.route('/profile/<pid>/pstats', methods=['GET'])
+def profile_pstats(pid):
+    """
+    Serves a stored profile as pstats file, for 'python -m pstats' or other
+    profile viewers.
+
+    """
+    if not profiling:
+        abort(404)
+    data = profile_store.pstats_data(pid)
+    if data is None:
+        abort(404)
+    response = Response(data, status=200,
+                        mimetype='application/octet-stream')
+    response.headers['Content-Disposition'] = \
+        'attachment; filename="%s.pstats"' % pid
     return response
+
+
+startup_timer.mark("app ready")
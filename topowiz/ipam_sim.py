@@ -0,0 +1,292 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# Simulation of Romana's IPAM block allocation on a generated topology.
+#
+# Romana assigns pod addresses in blocks (of the network's block mask size):
+# A host takes its addresses from the first of its blocks with a free
+# address, and gets a new block from the prefix of its group once all of its
+# blocks are full. Blocks are returned to the group when they become empty,
+# and each block in use needs a route to its host.
+#
+# The simulation creates the pods of all hosts, then replays a number of
+# churn steps, in which each pod is deleted with the churn probability and
+# the same number of pods is created again, each on a host chosen at random
+# (as by a scheduler), so that the pods move between hosts and blocks over
+# time. The state of all hosts
+# is held in one NumPy array with the number of used addresses of each
+# block, so that every step is a handful of vectorized operations, no matter
+# how many allocate and release events it contains.
+#
+# Usage:
+#
+#    $ python -m topowiz.ipam_sim <config or topology file> [options]
+#
+# The file can be a user config, or a topology with prefixes as offered for
+# download by /download/<config>?prefixes=1.
+#
+
+import argparse
+import json
+import sys
+
+from .model import iter_groups
+
+
+def leaf_prefix_lens(topo, network):
+    """
+    Return the prefix lengths of the leaf groups in the given network, in the
+    order of the groups in the topologies that use the network.
+
+    """
+    plens = []
+    for t in topo["topologies"]:
+        if network not in t["networks"]:
+            continue
+        for _, g in iter_groups(t["map"]):
+            if not g["groups"]:
+                if "prefixes" not in g:
+                    raise Exception("The topology has no prefixes. Build it "
+                                    "with prefixes, or download it with "
+                                    "'?prefixes=1'.")
+                plens.append(int(g["prefixes"][network].split("/")[1]))
+    return plens
+
+
+class _Simulation(object):
+    """
+    The state of the simulation: 'occ' holds the number of used addresses in
+    each block slot of each host (one row per host), or -1 for a slot
+    without block. 'group_free' holds the number of free blocks of each
+    group.
+
+    """
+    def __init__(self, np, rng, group_blocks, hosts_per_group, block_size,
+                 width):
+        self.np              = np
+        self.rng             = rng
+        self.block_size      = block_size
+        self.group_blocks    = group_blocks
+        self.group_free      = group_blocks.copy()
+        self.group_of_host   = np.repeat(np.arange(len(group_blocks)),
+                                         hosts_per_group)
+        self.occ             = np.full((len(self.group_of_host), width), -1,
+                                       dtype=np.int32)
+        self.allocations     = 0
+        self.releases        = 0
+
+    def release(self, churn):
+        """
+        Delete each pod with probability 'churn' and return the blocks that
+        became empty to their groups. Returns the number of deleted pods.
+
+        """
+        np      = self.np
+        used    = self.occ > 0
+        deleted = self.rng.binomial(np.where(used, self.occ, 0), churn)
+        self.occ      -= deleted.astype(np.int32)
+        self.releases += int(deleted.sum())
+        emptied = used & (self.occ == 0)
+        self.occ[emptied] = -1
+        self.group_free += np.bincount(self.group_of_host,
+                                       emptied.sum(axis=1),
+                                       len(self.group_free)).astype(np.int64)
+        return int(deleted.sum())
+
+    def allocate(self, need):
+        """
+        Create 'need' pods on each host: First in the free addresses of the
+        host's blocks, in order, then in new blocks from its group, as long
+        as the group has free blocks. Returns the number of pods that could
+        not be created on each host.
+
+        """
+        np  = self.np
+        bs  = self.block_size
+        occ = self.occ
+
+        free = np.where(occ >= 0, bs - occ, 0)
+        fill = np.clip(need[:, None] - (free.cumsum(axis=1) - free), 0, free)
+        occ += fill.astype(np.int32)
+        rem  = need - fill.sum(axis=1)
+
+        # New blocks are granted to the hosts of a group in order, as long as
+        # the group has free blocks.
+        req        = -(-rem // bs)
+        cum_req    = req.cumsum()
+        first_host = np.searchsorted(self.group_of_host,
+                                     np.arange(len(self.group_free)))
+        group_base = np.concatenate([[0], cum_req])[first_host]
+        before     = cum_req - req - group_base[self.group_of_host]
+        granted    = np.clip(self.group_free[self.group_of_host] - before,
+                             0, req)
+        self.group_free -= np.bincount(self.group_of_host, granted,
+                                       len(self.group_free)).astype(np.int64)
+
+        # Place the new blocks in the first empty slots of each host.
+        empty = occ < 0
+        short = int((granted - empty.sum(axis=1)).max(initial=0))
+        if short > 0:
+            occ = self.occ = np.pad(occ, ((0, 0), (0, short)),
+                                    constant_values=-1)
+            empty = occ < 0
+        rank   = empty.cumsum(axis=1)
+        take   = empty & (rank <= granted[:, None])
+        amount = np.clip(rem[:, None] - (rank - 1) * bs, 0, bs)
+        occ[take] = amount[take]
+
+        failed = rem - np.minimum(rem, granted * bs)
+        self.allocations += int((need - failed).sum())
+        return failed
+
+    def stats(self, step, failed):
+        np     = self.np
+        blocks = int((self.occ >= 0).sum())
+        pods   = int(np.maximum(self.occ, 0).sum())
+        groups = self.group_blocks > 0
+        used   = 1 - self.group_free[groups] / self.group_blocks[groups]
+        return {
+            "step"                  : step,
+            "failed"                : int(failed.sum()),
+            "pods"                  : pods,
+            "blocks"                : blocks,
+            "routes"                : blocks,
+            "utilization"           : round(pods / (blocks * self.block_size)
+                                            if blocks else 0.0, 4),
+            "max_group_utilization" : round(float(used.max(initial=0)), 4)
+        }
+
+
+def simulate(topo, pods_per_host, churn=0.1, steps=10, hosts_per_group=1,
+             network=None, seed=None):
+    """
+    Simulate the block allocation for the topology (as returned by
+    topo.build_topology() with prefixes) and return a report.
+
+    Every leaf group of the topology has 'hosts_per_group' hosts, which each
+    start with 'pods_per_host' pods. After all pods were created, 'steps'
+    churn steps follow, in which every pod is deleted with the probability
+    'churn', and as many pods are created on randomly chosen hosts. The
+    addresses are taken from the given network, or the first network of the
+    topology.
+
+    The report contains the totals of the simulation and, for the initial
+    allocation (step 0) and every churn step, the pods, the blocks in use
+    (each of which needs a route), the utilization of the addresses in those
+    blocks, the highest share of blocks used in any group, and the number of
+    pods that could not be created because their group ran out of blocks.
+
+    """
+    # Imported only here, since it noticeably adds to the start up time.
+    try:
+        import numpy as np
+    except ImportError:
+        raise Exception("The IPAM simulation requires NumPy.")
+
+    networks = dict((n['name'], n) for n in topo["networks"])
+    if network is None:
+        network = topo["networks"][0]['name']
+    block_mask = networks[network].get('block_mask', 29)
+    block_size = 1 << (32 - block_mask)
+
+    plens        = np.array(leaf_prefix_lens(topo, network), dtype=np.int64)
+    if not len(plens):
+        raise Exception("Network '%s' isn't used by any topology." % network)
+    group_blocks = np.where(plens <= block_mask,
+                            np.left_shift(1, np.maximum(block_mask - plens,
+                                                        0)), 0)
+    sim = _Simulation(np, np.random.default_rng(seed), group_blocks,
+                      hosts_per_group, block_size,
+                      -(-pods_per_host // block_size) + 1)
+
+    history     = []
+    exhausted   = np.zeros(len(group_blocks), dtype=bool)
+    first_steps = []
+    need        = np.full(len(sim.group_of_host), pods_per_host,
+                          dtype=np.int64)
+    failed      = np.zeros_like(need)
+    for step in range(steps + 1):
+        if step:
+            # The deleted pods, and those that couldn't be created before,
+            # are created on random hosts.
+            retry = int(failed.sum())
+            need  = sim.rng.multinomial(sim.release(churn) + retry,
+                                        np.full(len(need), 1.0 / len(need)))
+        failed = sim.allocate(need)
+
+        failed_groups = np.bincount(sim.group_of_host, failed,
+                                    len(group_blocks)) > 0
+        if failed_groups.any() and not first_steps:
+            first_steps.append(step)
+        exhausted |= failed_groups
+
+        history.append(sim.stats(step, failed))
+
+    return {
+        "network"           : network,
+        "groups"            : len(group_blocks),
+        "hosts"             : len(sim.group_of_host),
+        "block_size"        : block_size,
+        "events"            : sim.allocations + sim.releases,
+        "allocations"       : sim.allocations,
+        "releases"          : sim.releases,
+        "exhausted_groups"  : int(exhausted.sum()),
+        "first_exhaustion"  : first_steps[0] if first_steps else None,
+        "steps"             : history
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+                    description="Simulate Romana's IPAM block allocation "
+                                "on a topology.")
+    parser.add_argument("file",
+                        help="user config or topology (with prefixes), "
+                             "as JSON")
+    parser.add_argument("-p", "--pods-per-host", type=int, default=110,
+                        help="initial pods per host (default: 110)")
+    parser.add_argument("-c", "--churn", type=float, default=0.1,
+                        help="share of pods replaced per step "
+                             "(default: 0.1)")
+    parser.add_argument("-s", "--steps", type=int, default=10,
+                        help="churn steps (default: 10)")
+    parser.add_argument("--hosts-per-group", type=int, default=1,
+                        help="hosts in each leaf group (default: 1)")
+    parser.add_argument("-n", "--network",
+                        help="network to allocate from "
+                             "(default: the first one)")
+    parser.add_argument("--seed", type=int,
+                        help="seed of the random number generator")
+    args = parser.parse_args(argv)
+
+    with open(args.file) as f:
+        topo = json.load(f)
+    # Configs with several topologies have a 'topologies' list as well, but
+    # without a 'map' in each topology.
+    if not all("map" in t for t in topo.get("topologies", [{}])):
+        from .topo import build_topology
+        topo = build_topology(topo, lazy=True, prefixes=True)
+
+    report = simulate(topo, args.pods_per_host, args.churn, args.steps,
+                      args.hosts_per_group, args.network, args.seed)
+    json.dump(report, sys.stdout, indent=4)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
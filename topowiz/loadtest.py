@@ -0,0 +1,377 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# Load test with complete wizard sessions.
+#
+# Each session walks through the wizard like a browser would: It loads each
+# question page, answers it with a randomly chosen value (including the CSRF
+# token of the form) and follows the redirect to the next question, until
+# the final topology page. AWS and data center sessions are mixed, with
+# random regions, zones, rack and host counts and networks. Sessions run
+# concurrently, against the app in the same process or against a server.
+#
+# Usage:
+#
+#    $ python -m topowiz.loadtest -n 200 -c 8         # in-process
+#    $ python -m topowiz.loadtest -n 200 -c 8 --url http://localhost:5000
+#
+# The report has the sessions per second, the error rate and the latency
+# percentiles of each step (the GET and the POST of each question page).
+#
+
+import argparse
+import http.cookiejar
+import json
+import random
+import re
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .validation import AWS_REGIONS, AWS_ZONES
+
+
+# The steps of the wizard by URL prefix, named after their views. Longer
+# prefixes come first, since '/dc/flat_net/' is a prefix of
+# '/dc/flat_net_num_hosts/'.
+STEPS = [
+    ("/dc/flat_net_num_hosts/", "dc_flat_net_num_hosts"),
+    ("/dc/own_prefix/",         "dc_own_prefix"),
+    ("/dc/flat_net/",           "dc_flat_net"),
+    ("/dc/racks/",              "dc_racks"),
+    ("/aws/region/",            "aws_region"),
+    ("/aws/zones/",             "aws_zones"),
+    ("/gen/more_nets/",         "gen_more_networks"),
+    ("/gen/nets/",              "gen_networks"),
+    ("/download/",              "download"),
+    ("/done/",                  "done"),
+    ("/is_aws",                 "is_aws")
+]
+
+# A session that hasn't reached the final page after this many pages is
+# counted as an error, rather than being followed forever.
+MAX_PAGES = 50
+
+PERCENTILES = (50, 90, 99)
+
+_CSRF_RE = re.compile(r'name="csrf_token"[^>]*value="([^"]*)"')
+
+
+class StepError(Exception):
+    pass
+
+
+def step_name(path):
+    for prefix, name in STEPS:
+        if path.startswith(prefix):
+            return name
+    return path
+
+
+def _local_path(location):
+    """
+    Return the path and query of a (possibly absolute) redirect location.
+
+    """
+    parts = urllib.parse.urlsplit(location)
+    return parts.path + ("?" + parts.query if parts.query else "")
+
+
+class InProcessClient(object):
+    """
+    Sends the requests of a session to the app, through a Flask test client.
+
+    """
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        """
+        Return the status, the redirect location and the body of the
+        response.
+
+        """
+        resp = self.client.open(path, method=method, data=data)
+        return resp.status_code, resp.headers.get("Location"), \
+            resp.get_data(as_text=True)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpClient(object):
+    """
+    Sends the requests of a session to a server, with its own cookies.
+
+    """
+    def __init__(self, base_url, timeout=60):
+        self.base_url = base_url.rstrip("/")
+        self.timeout  = timeout
+        self.opener   = urllib.request.build_opener(
+                            urllib.request.HTTPCookieProcessor(
+                                http.cookiejar.CookieJar()),
+                            _NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = None
+        if data is not None:
+            body = urllib.parse.urlencode(data, doseq=True).encode("ascii")
+        req = urllib.request.Request(self.base_url + path, data=body,
+                                     method=method)
+        try:
+            with self.opener.open(req, timeout=self.timeout) as resp:
+                return resp.status, resp.headers.get("Location"), \
+                    resp.read().decode("utf-8", "replace")
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get("Location"), \
+                e.read().decode("utf-8", "replace")
+
+
+class SessionPlan(object):
+    """
+    The random answers of one session to the questions of the wizard.
+
+    """
+    def __init__(self, rng, aws_ratio=0.5, max_racks=32, max_hosts=32,
+                 max_networks=3):
+        self.rng          = rng
+        self.is_aws       = rng.random() < aws_ratio
+        self.max_racks    = max_racks
+        self.max_hosts    = max_hosts
+        self.num_networks = rng.randint(1, max_networks)
+        self.networks     = 0
+        self.region       = rng.choice(AWS_REGIONS)
+
+    def answer(self, step):
+        """
+        Return the form data for the question page of the given step.
+
+        """
+        rng = self.rng
+        if step == "is_aws":
+            return {"is_aws" : "aws" if self.is_aws else "dc"}
+        if step == "aws_region":
+            return {"aws_region" : self.region}
+        if step == "aws_zones":
+            zones = AWS_ZONES[self.region]
+            return {"aws_zones" : rng.sample(zones,
+                                             rng.randint(1, len(zones)))}
+        if step == "dc_own_prefix":
+            return {"dc_pg_per_host" : rng.choice(["yes", "no"])}
+        if step == "dc_flat_net":
+            return {"dc_flat_net" : rng.choice(["yes", "no"])}
+        if step == "dc_flat_net_num_hosts":
+            return {"dc_flat_net_num_hosts" :
+                    rng.randint(1, self.max_racks * self.max_hosts)}
+        if step == "dc_racks":
+            return {"dc_num_racks"          : rng.randint(1, self.max_racks),
+                    "dc_num_hosts_per_rack" : rng.randint(1, self.max_hosts)}
+        if step == "gen_networks":
+            self.networks += 1
+            return {"net_cidr" : "10.%d.0.0/16" % self.networks,
+                    "net_name" : "net-%d" % self.networks}
+        if step == "gen_more_networks":
+            if self.networks < self.num_networks:
+                return {"add_more" : "Add more"}
+            return {"finalize" : "Finalize"}
+        raise StepError("unexpected page '%s'" % step)
+
+
+def run_session(client, plan, download=False):
+    """
+    Walk through the wizard with the answers of the plan. Returns the list
+    of (step, seconds, ok) tuples of the requests, where the step is the
+    method and the name of the page. The session ends with the first
+    request that fails.
+
+    """
+    results = []
+
+    def timed(method, path, data=None):
+        step  = "%s %s" % (method, step_name(path))
+        start = time.perf_counter()
+        try:
+            status, location, body = client.request(method, path, data)
+        except Exception:
+            results.append((step, time.perf_counter() - start, False))
+            raise StepError(step)
+        results.append((step, time.perf_counter() - start, status < 400))
+        if status >= 400:
+            raise StepError(step)
+        return status, location, body
+
+    path = "/is_aws"
+    try:
+        for _ in range(MAX_PAGES):
+            status, location, body = timed("GET", path)
+            if status in (301, 302, 303):
+                # For example gen_networks, once the route limit of AWS
+                # doesn't allow another network.
+                path = _local_path(location)
+                continue
+            step = step_name(path)
+            if step == "done":
+                if download:
+                    timed("GET", path.replace("/done/", "/download/", 1))
+                return results
+            data  = plan.answer(step)
+            token = _CSRF_RE.search(body)
+            if token:
+                data["csrf_token"] = token.group(1)
+            status, location, _ = timed("POST", path, data)
+            if status not in (301, 302, 303):
+                # The form was shown again, with validation errors.
+                results[-1] = results[-1][:2] + (False,)
+                return results
+            path = _local_path(location)
+        results.append(("GET " + step_name(path), 0, False))
+    except StepError:
+        pass
+    return results
+
+
+def _percentile(values, p):
+    """
+    The p-th percentile of the sorted values, by the nearest rank method.
+
+    """
+    rank = max(0, int(round(p / 100.0 * len(values) + 0.5)) - 1)
+    return values[min(rank, len(values) - 1)]
+
+
+def run(num_sessions, concurrency=4, base_url=None, seed=None,
+        download=False, **plan_args):
+    """
+    Run the sessions and return the report as a dictionary.
+
+    Without a 'base_url' the sessions run against the app in this process.
+
+    """
+    if base_url:
+        make_client = lambda: HttpClient(base_url)  # noqa: E731
+    else:
+        from .http import app
+        make_client = lambda: InProcessClient(app)  # noqa: E731
+
+    seeds = random.Random(seed).sample(range(2 ** 31), num_sessions)
+
+    def session(session_seed):
+        plan = SessionPlan(random.Random(session_seed), **plan_args)
+        return plan.is_aws, run_session(make_client(), plan, download)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        sessions = list(executor.map(session, seeds))
+    duration = time.perf_counter() - start
+
+    steps  = {}
+    failed = 0
+    for _, results in sessions:
+        if not results or not results[-1][2]:
+            failed += 1
+        for step, seconds, ok in results:
+            entry = steps.setdefault(step, {"times" : [], "errors" : 0})
+            entry["times"].append(seconds)
+            entry["errors"] += not ok
+
+    report = {
+        "sessions"       : num_sessions,
+        "aws_sessions"   : sum(1 for is_aws, _ in sessions if is_aws),
+        "failed"         : failed,
+        "error_rate"     : failed / float(num_sessions or 1),
+        "duration_s"     : duration,
+        "sessions_per_s" : num_sessions / duration if duration else 0,
+        "concurrency"    : concurrency,
+        "steps"          : {}
+    }
+    for step, entry in steps.items():
+        times = sorted(entry["times"])
+        stats = {"count" : len(times), "errors" : entry["errors"]}
+        for p in PERCENTILES:
+            stats["p%d_ms" % p] = _percentile(times, p) * 1000
+        report["steps"][step] = stats
+    return report
+
+
+def print_report(report, out=sys.stdout):
+    out.write("sessions: %d (aws %d, dc %d), failed: %d (%.1f%%)\n" %
+              (report["sessions"], report["aws_sessions"],
+               report["sessions"] - report["aws_sessions"],
+               report["failed"], report["error_rate"] * 100))
+    out.write("duration: %.2f s, concurrency %d, %.1f sessions/s\n\n" %
+              (report["duration_s"], report["concurrency"],
+               report["sessions_per_s"]))
+    columns = ["p%d_ms" % p for p in PERCENTILES]
+    out.write("%-28s %7s %7s %10s %10s %10s\n" %
+              (("step", "count", "errors") + tuple(columns)))
+    for step, stats in sorted(report["steps"].items(),
+                              key=lambda s: (s[0].split()[1], s[0])):
+        out.write("%-28s %7d %7d %10.2f %10.2f %10.2f\n" %
+                  ((step, stats["count"], stats["errors"]) +
+                   tuple(stats[c] for c in columns)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+                    description="Load test topowiz with complete wizard "
+                                "sessions.")
+    parser.add_argument("-n", "--sessions", type=int, default=100,
+                        help="number of sessions (default: 100)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4,
+                        help="concurrently running sessions (default: 4)")
+    parser.add_argument("--url",
+                        help="base URL of a running server (default: run "
+                             "the app in this process)")
+    parser.add_argument("--seed", type=int,
+                        help="seed for the random answers, to repeat a run")
+    parser.add_argument("--aws-ratio", type=float, default=0.5,
+                        help="share of AWS sessions (default: 0.5)")
+    parser.add_argument("--max-racks", type=int, default=32,
+                        help="largest number of racks (default: 32)")
+    parser.add_argument("--max-hosts", type=int, default=32,
+                        help="largest number of hosts per rack "
+                             "(default: 32)")
+    parser.add_argument("--max-networks", type=int, default=3,
+                        help="largest number of networks (default: 3)")
+    parser.add_argument("--download", action="store_true",
+                        help="also download the topology at the end of "
+                             "each session")
+    parser.add_argument("--json", action="store_true",
+                        help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = run(args.sessions, args.concurrency, args.url, args.seed,
+                 args.download, aws_ratio=args.aws_ratio,
+                 max_racks=args.max_racks, max_hosts=args.max_hosts,
+                 max_networks=args.max_networks)
+    if args.json:
+        print(json.dumps(report, indent=4, sort_keys=True))
+    else:
+        print_report(report)
+    if report["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# Instrumentation of the stages of a request.
+#
+# The time spent in each stage of a view (decoding the config, validating
+# forms, building the topology, serializing it and rendering templates) is
+# recorded in a latency histogram per view and stage, together with the
+# output size and the number of groups of the topologies. Optionally, the
+# peak of the memory allocated during each stage is tracked with tracemalloc.
+# The metrics are exported in the Prometheus text format, by the /metrics
+# endpoint of the app.
+#
+# The stages are marked with 'with metrics.stage("build"):', which is
+# attributed to the view set for the current thread by begin_request(). When
+# the metrics are disabled (the default), stage() returns a shared object
+# that does nothing, so the instrumentation costs about an attribute lookup
+# and a function call per stage.
+#
+
+import threading
+import time
+import tracemalloc
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS   = tuple(1024 * 4 ** i for i in range(11))
+GROUPS_BUCKETS  = tuple(10 ** i for i in range(7))
+
+
+class Histogram(object):
+    """
+    Cumulative histogram with fixed bucket bounds, as in Prometheus.
+
+    """
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum    = 0
+        self.count  = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum   += value
+        self.count += 1
+
+    def buckets(self):
+        """
+        Return (upper bound, cumulative count) tuples, ending with '+Inf'.
+
+        """
+        result = []
+        total  = 0
+        for bound, n in zip(self.bounds, self.counts):
+            total += n
+            result.append((_format_value(bound), total))
+        result.append(("+Inf", self.count))
+        return result
+
+
+class _NullStage(object):
+    """
+    The stage returned while the metrics are disabled.
+
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage(object):
+    """
+    Context manager that records the latency (and memory peak) of a stage.
+
+    """
+    __slots__ = ("metrics", "view", "name", "start", "mem_start")
+
+    def __init__(self, metrics, view, name):
+        self.metrics = metrics
+        self.view    = view
+        self.name    = name
+
+    def __enter__(self):
+        self.mem_start = None
+        if self.metrics.trace_memory and tracemalloc.is_tracing():
+            self.mem_start = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        peak    = None
+        if self.mem_start is not None:
+            peak = max(0, tracemalloc.get_traced_memory()[1] -
+                       self.mem_start)
+        self.metrics.observe_stage(self.view, self.name, elapsed, peak)
+        return False
+
+
+class Metrics(object):
+    """
+    Thread safe registry of the per view and stage measurements.
+
+    Memory peaks are measured for the whole process, so with concurrent
+    requests they are an upper bound for the stage.
+
+    """
+    def __init__(self, enabled=False, trace_memory=False):
+        self.enabled      = False
+        self.trace_memory = False
+        self._lock        = threading.Lock()
+        self._local       = threading.local()
+        self.reset()
+        self.configure(enabled, trace_memory)
+
+    def configure(self, enabled, trace_memory=False):
+        """
+        Enable or disable the metrics, and the tracking of memory peaks,
+        which slows down all allocations while it is on.
+
+        """
+        self.enabled      = bool(enabled)
+        self.trace_memory = self.enabled and bool(trace_memory)
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def reset(self):
+        with self._lock:
+            self._stages    = {}
+            self._peaks     = {}
+            self._bytes     = {}
+            self._groups    = {}
+            self._requests  = {}
+
+    def begin_request(self, view):
+        """
+        Attribute the following stages of the current thread to the view.
+
+        """
+        self._local.view = view
+
+    def end_request(self):
+        self._local.view = None
+
+    def current_view(self):
+        return getattr(self._local, "view", None)
+
+    def stage(self, name, view=None):
+        """
+        Return a context manager that records the latency of the stage for
+        the given view, or the view of the current request.
+
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, view or self.current_view() or "-", name)
+
+    def observe_stage(self, view, name, seconds, peak=None):
+        key = (view, name)
+        with self._lock:
+            hist = self._stages.get(key)
+            if hist is None:
+                hist = self._stages[key] = Histogram(LATENCY_BUCKETS)
+            hist.observe(seconds)
+            if peak is not None and peak > self._peaks.get(key, -1):
+                self._peaks[key] = peak
+
+    def observe_request(self, view, status):
+        if not self.enabled:
+            return
+        key = (view or "-", str(status))
+        with self._lock:
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def observe_bytes(self, view, num_bytes):
+        self._observe(self._bytes, BYTES_BUCKETS, view, num_bytes)
+
+    def observe_groups(self, view, num_groups):
+        self._observe(self._groups, GROUPS_BUCKETS, view, num_groups)
+
+    def _observe(self, hists, bounds, view, value):
+        if not self.enabled:
+            return
+        view = view or self.current_view() or "-"
+        with self._lock:
+            hist = hists.get(view)
+            if hist is None:
+                hist = hists[view] = Histogram(bounds)
+            hist.observe(value)
+
+    def iter_timed(self, chunks, name, view=None):
+        """
+        Pass on the chunks of a streamed response, recording the time spent
+        producing them as the stage and their total size as output bytes.
+
+        The view is determined on the call, since the chunks are produced after
+        the view has returned.
+
+        """
+        return self._iter_timed(iter(chunks), name,
+                                view or self.current_view() or "-")
+
+    def _iter_timed(self, it, name, view):
+        elapsed = 0
+        size    = 0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    chunk = next(it)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - start
+                size += len(chunk)
+                yield chunk
+        finally:
+            self.observe_stage(view, name, elapsed)
+            self.observe_bytes(view, size)
+
+    def render(self, gauges=None):
+        """
+        Return the metrics in the Prometheus text exposition format. The
+        optional 'gauges' is a dictionary of further name to value.
+
+        """
+        with self._lock:
+            lines = []
+            _render_counter(lines, "topowiz_requests_total",
+                            "Handled requests.", ("view", "status"),
+                            self._requests)
+            _render_histograms(lines, "topowiz_stage_seconds",
+                               "Latency of the stages of the views.",
+                               ("view", "stage"), self._stages)
+            _render_gauges(lines, "topowiz_stage_memory_peak_bytes",
+                           "Largest memory peak during a stage.",
+                           ("view", "stage"), self._peaks)
+            _render_histograms(lines, "topowiz_output_bytes",
+                               "Size of the response bodies.", ("view",),
+                               dict(((v,), h) for v, h in
+                                    self._bytes.items()))
+            _render_histograms(lines, "topowiz_topology_groups",
+                               "Number of groups of the served topologies.",
+                               ("view",),
+                               dict(((v,), h) for v, h in
+                                    self._groups.items()))
+        for name, value in sorted((gauges or {}).items()):
+            lines.append("# TYPE %s gauge" % name)
+            lines.append("%s %s" % (name, _format_value(value)))
+        return "\n".join(lines) + "\n"
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _labels(names, values, extra=""):
+    pairs = ['%s="%s"' % (n, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+             for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{%s}" % ",".join(pairs)
+
+
+def _render_counter(lines, name, help_text, label_names, values):
+    lines.append("# HELP %s %s" % (name, help_text))
+    lines.append("# TYPE %s counter" % name)
+    for key, value in sorted(values.items()):
+        lines.append("%s%s %d" % (name, _labels(label_names, key), value))
+
+
+def _render_gauges(lines, name, help_text, label_names, values):
+    lines.append("# HELP %s %s" % (name, help_text))
+    lines.append("# TYPE %s gauge" % name)
+    for key, value in sorted(values.items()):
+        lines.append("%s%s %d" % (name, _labels(label_names, key), value))
+
+
+def _render_histograms(lines, name, help_text, label_names, hists):
+    lines.append("# HELP %s %s" % (name, help_text))
+    lines.append("# TYPE %s histogram" % name)
+    for key, hist in sorted(hists.items()):
+        for bound, count in hist.buckets():
+            lines.append("%s_bucket%s %d" % (
+                name, _labels(label_names, key, 'le="%s"' % bound), count))
+        lines.append("%s_sum%s %s" % (name, _labels(label_names, key),
+                                      _format_value(hist.sum)))
+        lines.append("%s_count%s %d" % (name, _labels(label_names, key),
+                                        hist.count))
+
+
+# The registry of the app. Disabled until configured, see METRICS_ENABLED.
+metrics = Metrics()
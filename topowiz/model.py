@@ -0,0 +1,451 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# A lazy object model for topologies.
+#
+# Groups are compact records, and runs of groups that only differ by their
+# index (such as 'rack-0' ... 'rack-255') are represented by a single
+# GroupRange, which creates its groups on access. The model can be walked,
+# counted and serialized (see serialize.iter_json) without ever holding all
+# groups in memory. to_dict() converts it to the plain dict/list structure
+# returned by topo.build_topology().
+#
+# Identical subtrees, such as the hosts of each rack, are created once and
+# shared by reference. Shared subtrees are always immutable sequences
+# (GroupRange or tuple), and groups are never changed once they are built.
+#
+# to_ranges() converts the model to a compact document, in which each
+# GroupRange appears as a single 'range' object, rather than as its groups:
+#
+#     {"name" : "rack-%d", "range" : [0, 256],
+#      "assignment" : {"rack" : "rack-%d"},
+#      "prefix_lengths" : {"net-0" : 24},
+#      "groups" : [...]}
+#
+# stands for the groups with the index i from 0 to 255, named "rack-%d" % i,
+# with the assignment {"rack" : "rack-%d" % i} and the child groups given by
+# 'groups' (which may again contain ranges). With 'prefix_lengths', the group
+# with index i has the prefix (P + i * 2 ** (32 - L)) / L in each network,
+# where L is the given length and P the address of the prefix of the
+# enclosing group in that network (or the address of the network at the top
+# level). expand_ranges() is the reference for expanding such a document.
+#
+# find_group() picks a single group, such as a rack, out of the model. In a
+# GroupRange, it's found by the index in its name, so that only the groups on
+# the way to it are created.
+#
+
+import re
+
+from collections.abc import Mapping, Sequence
+
+from .prefixes import child_prefixes, cidr_range, format_cidr, nth_prefixes, \
+                      parse_cidr, range_cidrs
+
+
+class Group(Mapping):
+    """
+    A single prefix group.
+
+    Behaves like the (read-only) dict that represents the group in the
+    topology, so that it can be walked and serialized like one.
+
+    Most groups in a topology have the 'name' key before the 'groups' key. The
+    top level groups of a data center topology are the exception, which is
+    what 'groups_first' is for.
+
+    If prefixes were calculated for the topology, 'prefixes' is a tuple of
+    (network name, address, prefix length) tuples, which appear as the
+    'prefixes' dict of the group.
+
+    """
+    __slots__ = ("name", "assignment", "groups", "groups_first", "prefixes")
+
+    def __init__(self, name=None, assignment=None, groups=(),
+                 groups_first=False, prefixes=None):
+        self.name         = name
+        self.assignment   = assignment
+        self.groups       = groups
+        self.groups_first = groups_first
+        self.prefixes     = prefixes
+
+    def __iter__(self):
+        if self.groups_first:
+            yield "groups"
+        if self.name is not None:
+            yield "name"
+        if self.assignment is not None:
+            yield "assignment"
+        if self.prefixes is not None:
+            yield "prefixes"
+        if not self.groups_first:
+            yield "groups"
+
+    def __len__(self):
+        return 1 + (self.name is not None) + \
+               (self.assignment is not None) + (self.prefixes is not None)
+
+    def __getitem__(self, key):
+        if key == "groups":
+            return self.groups
+        if key == "name" and self.name is not None:
+            return self.name
+        if key == "assignment" and self.assignment is not None:
+            return self.assignment
+        if key == "prefixes" and self.prefixes is not None:
+            return self.cidrs()
+        raise KeyError(key)
+
+    def cidrs(self):
+        """
+        Return the prefixes of the group as dictionary of network name to
+        CIDR.
+
+        """
+        return dict((name, format_cidr(addr, plen))
+                    for name, addr, plen in self.prefixes)
+
+    def __repr__(self):
+        return "Group(%r)" % self.name
+
+    def items(self):
+        # Faster than the generic Mapping.items(), which matters when walking
+        # or serializing large topologies.
+        return [(key, self[key]) for key in self]
+
+    def to_dict(self, convert=None):
+        """
+        Return the group as dict. The child groups are converted with the
+        function 'convert', by default to_dict().
+
+        """
+        convert = convert or to_dict
+        d = {}
+        if self.groups_first:
+            d["groups"] = convert(self.groups)
+        if self.name is not None:
+            d["name"] = self.name
+        if self.assignment is not None:
+            d["assignment"] = dict(self.assignment)
+        if self.prefixes is not None:
+            d["prefixes"] = self.cidrs()
+        if not self.groups_first:
+            d["groups"] = convert(self.groups)
+        return d
+
+
+class GroupRange(Sequence):
+    """
+    The groups named 'label % i' for i in range(start, start + count).
+
+    Each group optionally carries an assignment of the form {key : name} and
+    the same, shared sequence of child groups. Groups are only created when
+    accessed.
+
+    If prefixes are calculated, 'prefixes' holds the (network name, address,
+    prefix length) tuples from which the prefix of the group with index i is
+    derived (see prefixes.child_prefixes). In that case the child groups
+    can't be shared, since their prefixes differ: 'children' then is the
+    GroupRange from which the children of each group are derived.
+
+    """
+    __slots__ = ("label", "count", "start", "assignment_key", "children",
+                 "groups_first", "prefixes")
+
+    def __init__(self, label, count, start=0, assignment_key=None,
+                 children=(), groups_first=False, prefixes=None):
+        self.label          = label
+        self.count          = count
+        self.start          = start
+        self.assignment_key = assignment_key
+        self.children       = children
+        self.groups_first   = groups_first
+        self.prefixes       = prefixes
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.count)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return GroupRange(self.label, max(0, stop - start),
+                              self.start + start, self.assignment_key,
+                              self.children, self.groups_first,
+                              self.prefixes)
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("group index out of range")
+        return self._group(self.start + index)
+
+    def __iter__(self):
+        for i in range(self.start, self.start + self.count):
+            yield self._group(i)
+
+    def __repr__(self):
+        return "GroupRange(%r, %d)" % (self.label, self.count)
+
+    def with_prefixes(self, parent_prefixes):
+        """
+        Return a copy of this range, with prefixes derived from those of the
+        parent group.
+
+        """
+        return GroupRange(self.label, self.count, self.start,
+                          self.assignment_key, self.children,
+                          self.groups_first,
+                          child_prefixes(parent_prefixes, self.count))
+
+    def _group(self, i):
+        name     = self.label % i
+        children = self.children
+        prefixes = None
+        if self.prefixes is not None:
+            prefixes = nth_prefixes(self.prefixes, i)
+            if children:
+                children = children.with_prefixes(prefixes)
+        return Group(name,
+                     {self.assignment_key : name} if self.assignment_key
+                     else None,
+                     children, self.groups_first, prefixes)
+
+    def to_list(self):
+        """
+        Return the groups as list of dicts, like Group.to_dict() would.
+
+        The names and prefixes of all groups are calculated at once, rather
+        than by creating each group, which makes this several times faster.
+
+        """
+        end      = self.start + self.count
+        names    = [self.label % i for i in range(self.start, end)]
+        prefixes = None
+        if self.prefixes is not None:
+            nets     = [name for name, _, _ in self.prefixes]
+            cidrs    = [range_cidrs(addr, plen, self.start, self.count)
+                        for _, addr, plen in self.prefixes]
+            if len(nets) == 1:
+                prefixes = [{nets[0] : c} for c in cidrs[0]]
+            else:
+                prefixes = [dict(zip(nets, c)) for c in zip(*cidrs)]
+        result   = []
+        for k, name in enumerate(names):
+            children = self.children
+            if not children:
+                children = []
+            elif prefixes is not None:
+                children = to_dict(children.with_prefixes(
+                                nth_prefixes(self.prefixes, self.start + k)))
+            else:
+                children = to_dict(children)
+            d = {}
+            if self.groups_first:
+                d["groups"] = children
+            d["name"] = name
+            if self.assignment_key:
+                d["assignment"] = {self.assignment_key : name}
+            if prefixes is not None:
+                d["prefixes"] = prefixes[k]
+            if not self.groups_first:
+                d["groups"] = children
+            result.append(d)
+        return result
+
+    def to_range(self):
+        """
+        Return the 'range' object that stands for all groups of this range
+        (see to_ranges()).
+
+        """
+        d = {"name" : self.label, "range" : [self.start, self.count]}
+        if self.assignment_key:
+            d["assignment"] = {self.assignment_key : self.label}
+        children = self.children
+        if self.prefixes is not None:
+            d["prefix_lengths"] = dict((name, plen)
+                                       for name, _, plen in self.prefixes)
+            if children:
+                # Only the prefix lengths of the children matter here, which
+                # are the same for all groups.
+                children = children.with_prefixes(self.prefixes)
+        d["groups"] = to_ranges(children)
+        return d
+
+
+def to_dict(obj):
+    """
+    Convert a (partially) lazy topology to plain dicts and lists.
+
+    """
+    if isinstance(obj, (str, int, float, bool)) or obj is None:
+        return obj
+    if isinstance(obj, Group):
+        return obj.to_dict()
+    if isinstance(obj, GroupRange):
+        return obj.to_list()
+    if isinstance(obj, Mapping):
+        return dict((k, to_dict(v)) for k, v in obj.items())
+    return [to_dict(v) for v in obj]
+
+
+def to_ranges(obj):
+    """
+    Convert a (partially) lazy topology to plain dicts and lists, in which
+    each GroupRange is represented by a single 'range' object. The size of
+    the result only depends on the number of levels of the topology, not on
+    the number of groups.
+
+    """
+    if isinstance(obj, (str, int, float, bool)) or obj is None:
+        return obj
+    if isinstance(obj, Group):
+        return obj.to_dict(to_ranges)
+    if isinstance(obj, GroupRange):
+        return [obj.to_range()]
+    if isinstance(obj, Mapping):
+        return dict((k, to_ranges(v)) for k, v in obj.items())
+    return [to_ranges(v) for v in obj]
+
+
+def _expand_groups(groups, parent_addrs):
+    result = []
+    for g in groups:
+        if "range" not in g:
+            addrs = parent_addrs
+            if "prefixes" in g:
+                addrs = dict((net, parse_cidr(cidr)[0])
+                             for net, cidr in g["prefixes"].items())
+            result.append(dict(g, groups=_expand_groups(g["groups"], addrs)))
+            continue
+        start, count = g["range"]
+        lengths      = g.get("prefix_lengths")
+        for i in range(start, start + count):
+            name  = g["name"] % i
+            group = {"name" : name}
+            if "assignment" in g:
+                group["assignment"] = dict((key, value % i) for key, value
+                                           in g["assignment"].items())
+            addrs = parent_addrs
+            if lengths is not None:
+                addrs = dict((net, parent_addrs[net] + (i << (32 - plen)))
+                             for net, plen in lengths.items())
+                group["prefixes"] = dict((net, format_cidr(addrs[net], plen))
+                                         for net, plen in lengths.items())
+            group["groups"] = _expand_groups(g["groups"], addrs)
+            result.append(group)
+    return result
+
+
+def expand_ranges(topo):
+    """
+    Expand the 'range' objects in a topology document from to_ranges(),
+    returning the plain topology. The order of the keys in the groups may
+    differ from that of topo.build_topology().
+
+    """
+    network_addrs = dict((n['name'], cidr_range(n['cidr'])[0])
+                         for n in topo['networks'])
+    return dict(topo, topologies=[
+                    dict(t, map=_expand_groups(t['map'], network_addrs))
+                    for t in topo['topologies']])
+
+
+def iter_groups(groups, depth=0):
+    """
+    Walk a sequence of groups depth first, producing (depth, group) tuples.
+
+    """
+    for g in groups:
+        yield depth, g
+        yield from iter_groups(g["groups"], depth + 1)
+
+
+def count_groups(groups):
+    """
+    Count all groups in a sequence of groups, including the nested ones.
+
+    For a GroupRange the count is calculated from its children, without
+    creating any of its groups.
+
+    """
+    if isinstance(groups, GroupRange):
+        return groups.count * (1 + count_groups(groups.children))
+    return sum(1 + count_groups(g["groups"]) for g in groups)
+
+
+_INDEX_FORMAT = re.compile(r"%0?\d*d")
+
+
+def group_index(label, name):
+    """
+    Return the index i for which 'label % i' is the given name, or None if
+    there is none. Only the name is parsed, so this takes constant time.
+
+    """
+    m = _INDEX_FORMAT.search(label)
+    if m is None:
+        return None
+    prefix = label[:m.start()].replace("%%", "%")
+    suffix = label[m.end():].replace("%%", "%")
+    if len(name) <= len(prefix) + len(suffix) or \
+            not name.startswith(prefix) or not name.endswith(suffix):
+        return None
+    digits = name[len(prefix):len(name) - len(suffix)]
+    if not digits.isdigit():
+        return None
+    i = int(digits)
+    # Rejects leading zeros that the label wouldn't produce, and non-ASCII
+    # digits, for example.
+    return i if label % i == name else None
+
+
+def find_group(groups, path):
+    """
+    Return the group at the given path in a sequence of (lazy) groups, such
+    as the map of a topology. Each element of the path selects a child of
+    the group selected so far, by its index (an int) or by its name.
+
+    In a GroupRange, the group is derived from its index, or from the index
+    in its name (see group_index()), so only the groups along the path are
+    created. Raises KeyError if there is no such group.
+
+    """
+    group = None
+    for key in path:
+        if group is not None:
+            groups = group["groups"]
+        if isinstance(key, int):
+            try:
+                group = groups[key]
+            except IndexError:
+                raise KeyError(key)
+        elif isinstance(groups, GroupRange):
+            i = group_index(groups.label, key)
+            if i is None or not \
+                    groups.start <= i < groups.start + groups.count:
+                raise KeyError(key)
+            group = groups._group(i)
+        else:
+            group = next((g for g in groups if g.get("name") == key), None)
+            if group is None:
+                raise KeyError(key)
+    if group is None:
+        raise KeyError("empty path")
+    return group
@@ -0,0 +1,179 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# Validation of user defined networks: names and CIDRs, either one at a time
+# (as they are entered in the wizard) or in bulk.
+#
+# CIDRs are compared as integer address ranges. Since two CIDRs are either
+# disjoint or one contains the other, all duplicates and overlaps within a
+# list of networks are found with a single sweep over the ranges sorted by
+# start address, in O(n log n) plus the number of conflicts.
+#
+
+import re
+import string
+
+from .prefixes import cidr_range
+
+
+VALID_NAME_LETTERS       = string.ascii_letters + string.digits + "_-"
+VALID_NAME_FIRST_LETTERS = string.ascii_letters
+
+
+def network_name_error(name, networks):
+    """
+    Check a network name against the naming rules and the names of the
+    already defined networks.
+
+    Returns an error message, or None if the name is fine.
+
+    """
+    if not name or name[0] not in VALID_NAME_FIRST_LETTERS or \
+            any(c for c in name[1:] if c not in VALID_NAME_LETTERS):
+        return "Invalid name. Use letters, digits, '_' and '-'. First " \
+               "character has to be letter."
+    if not 1 < len(name) < 40:
+        return "Name should be between 1 and 40 chracters."
+    if name in (n['name'] for n in networks):
+        return "This name is already in use."
+    return None
+
+
+def _parse_range(cidr):
+    """
+    Return the address range of a CIDR, or None if it isn't valid.
+
+    """
+    try:
+        if not 1 <= int(cidr.split("/")[1]) <= 32:
+            return None
+        return cidr_range(cidr)
+    except Exception:
+        return None
+
+
+def network_cidr_error(cidr, networks):
+    """
+    Check a CIDR for validity and against the CIDRs of the already defined
+    networks.
+
+    Returns an error message, or None if the CIDR is fine.
+
+    """
+    rng = _parse_range(cidr)
+    if rng is None:
+        return "Not a valid CIDR"
+    first, last = rng
+    for n in networks:
+        if n['cidr'] == cidr:
+            return "This CIDR is already in use."
+    for n in networks:
+        other_first, other_last = cidr_range(n['cidr'])
+        if first <= other_last and other_first <= last:
+            return "CIDR '%s' overlaps with existing CIDR '%s'" % \
+                   (cidr, n['cidr'])
+    return None
+
+
+def find_network_conflicts(new_networks, networks=()):
+    """
+    Check a list of new networks (dicts with 'name' and 'cidr') against each
+    other and against the already defined networks.
+
+    Returns a list of all error messages, which is empty if there are no
+    conflicts.
+
+    """
+    errors = []
+    names  = set(n['name'] for n in networks)
+    ranges = [(first, -last, 0, i, n['cidr'])
+              for i, n in enumerate(networks)
+              for first, last in [cidr_range(n['cidr'])]]
+
+    for i, n in enumerate(new_networks):
+        err = network_name_error(n['name'], ())
+        if err:
+            errors.append("%s: %s" % (n['name'], err))
+        elif n['name'] in names:
+            errors.append("%s: This name is already in use." % n['name'])
+        names.add(n['name'])
+
+        rng = _parse_range(n['cidr'])
+        if rng is None:
+            errors.append("%s: Not a valid CIDR" % n['cidr'])
+        else:
+            ranges.append((rng[0], -rng[1], 1, i, n['cidr']))
+
+    # Sorted by start address and, for the same start, largest range first.
+    # The stack holds the ranges that contain the current one, from the
+    # widest down: those that end before the current range are dropped, the
+    # rest contain it. Existing networks sort before new ones with the same
+    # range, so that a new network is reported as the duplicate. Each
+    # conflict is reported for the new network of the two, and conflicts
+    # between existing networks aren't reported at all.
+    ranges.sort()
+    stack = []
+    for rng in ranges:
+        first, neg_last, is_new, _, cidr = rng
+        while stack and -stack[-1][1] < first:
+            stack.pop()
+        for outer in stack:
+            if not is_new and not outer[2]:
+                continue
+            if (first, neg_last) == outer[:2]:
+                msg = "%s: Duplicate of CIDR '%s'"
+            elif is_new:
+                msg = "%s: Overlaps with CIDR '%s'"
+            else:
+                msg = "%s: Contains CIDR '%s'"
+            new, other = (rng, outer) if is_new else (outer, rng)
+            msg %= (new[4], other[4])
+            if not other[2]:
+                msg += " (existing network)"
+            errors.append(msg)
+        stack.append(rng)
+    return errors
+
+
+def parse_network_list(text, first_index=0):
+    """
+    Parse a list of networks, one per line, as '<cidr>' or '<name> <cidr>'
+    (separated by whitespace or a comma). Empty lines and anything after a
+    '#' are ignored. Networks without a name are named 'net-<n>', counting
+    from 'first_index'.
+
+    Returns a tuple of (list of networks, list of errors).
+
+    """
+    networks = []
+    errors   = []
+    for lineno, line in enumerate(text.splitlines(), 1):
+        fields = re.split(r"[\s,]+", line.split("#")[0].strip())
+        fields = [f for f in fields if f]
+        if not fields:
+            continue
+        if len(fields) == 1:
+            name, cidr = "net-%d" % (first_index + len(networks)), fields[0]
+        elif len(fields) == 2:
+            name, cidr = fields if "/" in fields[1] else fields[::-1]
+        else:
+            errors.append("Line %d: Expected '<name> <cidr>' or '<cidr>'" %
+                          lineno)
+            continue
+        networks.append({"cidr" : cidr, "name" : name})
+    return networks, errors
@@ -0,0 +1,156 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# Calculation of the address prefixes of the groups in a topology.
+#
+# The address range of each network is split evenly between the groups at
+# each level of the topology: With n groups at a level, each group gets a
+# prefix that is ceil(log2(n)) bits longer than the prefix of its parent.
+# All calculations are done on plain integers. range_cidrs() formats the
+# prefixes of a whole range of groups at once, which is much faster than
+# formatting them one by one.
+#
+
+
+def parse_cidr(cidr):
+    """
+    Parse an IPv4 CIDR into a tuple of (address as integer, prefix length).
+
+    Raises an exception if the CIDR is malformed.
+
+    """
+    addr, plen = cidr.split("/")
+    plen       = int(plen)
+    octets     = addr.split(".")
+    if len(octets) != 4 or not 0 <= plen <= 32:
+        raise ValueError("Not a valid CIDR: %s" % cidr)
+    value = 0
+    for o in octets:
+        if not o.isdigit() or int(o) > 255:
+            raise ValueError("Not a valid CIDR: %s" % cidr)
+        value = (value << 8) | int(o)
+    return value, plen
+
+
+def cidr_range(cidr):
+    """
+    Return the first and last address (as integers) of the network described
+    by the CIDR. Any host bits of the address are ignored.
+
+    """
+    addr, plen = parse_cidr(cidr)
+    size  = 1 << (32 - plen)
+    first = addr & ~(size - 1) & 0xffffffff
+    return first, first + size - 1
+
+
+def format_cidr(addr, plen):
+    """
+    Format an integer address and prefix length as CIDR.
+
+    """
+    return "%d.%d.%d.%d/%d" % (addr >> 24, (addr >> 16) & 0xff,
+                               (addr >> 8) & 0xff, addr & 0xff, plen)
+
+
+def split_bits(num_groups):
+    """
+    Number of prefix bits needed to give each of the groups its own prefix.
+
+    """
+    return max(0, num_groups - 1).bit_length()
+
+
+def network_prefixes(networks):
+    """
+    Return a tuple of (name, network address, prefix length, block mask) for
+    each network, which is where the prefix calculation starts.
+
+    """
+    result = []
+    for n in networks:
+        first, _ = cidr_range(n['cidr'])
+        _, plen  = parse_cidr(n['cidr'])
+        result.append((n['name'], first, plen, n.get('block_mask', 29)))
+    return tuple(result)
+
+
+def child_prefixes(parent_prefixes, num_groups):
+    """
+    From the (name, address, prefix length) tuples of a group, return those
+    from which the prefixes of its 'num_groups' child groups are derived: The
+    child with index i gets address + (i << (32 - prefix length)).
+
+    """
+    bits = split_bits(num_groups)
+    return tuple((name, addr, plen + bits)
+                 for name, addr, plen in parent_prefixes)
+
+
+def nth_prefixes(prefixes, i):
+    """
+    Return the prefixes of the group with index i, from the tuples returned
+    by child_prefixes().
+
+    """
+    return tuple((name, addr + (i << (32 - plen)), plen)
+                 for name, addr, plen in prefixes)
+
+
+def check_prefix_lens(networks, levels):
+    """
+    Raise an exception if any of the networks is too small to give every
+    group its own prefix of at most the block mask length. 'levels' is the
+    list of group counts at each level of the topology.
+
+    """
+    bits = sum(split_bits(n) for n in levels)
+    for name, _, plen, block_mask in network_prefixes(networks):
+        if plen + bits > block_mask:
+            raise Exception("Network '%s' is too small: Groups need /%d "
+                            "prefixes, which is longer than the block "
+                            "mask /%d." % (name, plen + bits, block_mask))
+
+
+def range_cidrs(addr, plen, start, count):
+    """
+    Return the CIDRs of the groups with index start ... start + count - 1,
+    where the group with index i has the prefix (addr + (i << (32 - plen))) /
+    plen, as for nth_prefixes().
+
+    """
+    step  = 1 << (32 - plen)
+    first = addr + start * step
+    end   = first + count * step
+    if step > 0xff or first % step:
+        fmt = "%d.%d.%d.%d/" + str(plen)
+        return [fmt % (a >> 24, (a >> 16) & 0xff, (a >> 8) & 0xff, a & 0xff)
+                for a in range(first, end, step)]
+    # Prefixes of /24 or longer: The first three octets only change every
+    # 256 addresses, and the rest is taken from a list.
+    tails  = ["%d/%d" % (a, plen) for a in range(0, 0x100, step)]
+    result = []
+    a      = first
+    while a < end:
+        block_end = min(end, (a | 0xff) + 1)
+        head      = "%d.%d.%d." % (a >> 24, (a >> 16) & 0xff, (a >> 8) & 0xff)
+        result   += [head + tail for tail in
+                     tails[(a & 0xff) // step:
+                           ((block_end - 1) & 0xff) // step + 1]]
+        a         = block_end
+    return result
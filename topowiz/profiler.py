@@ -0,0 +1,198 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# Opt-in profiling of single requests.
+#
+# With PROFILING_ENABLED set in the app config, a request to one of the
+# topology views with the 'profile' query parameter (or the X-Topowiz-Profile
+# header) is run under cProfile. The stats are kept in a small in-memory
+# store, keyed by the config hash and the view, and can be fetched as a
+# summary of the hottest functions or as a pstats file:
+#
+#    $ curl -D - 'http://localhost:5000/download/<config>?profile=1'
+#    ...
+#    X-Topowiz-Profile: /profile/<id>
+#
+#    $ curl 'http://localhost:5000/profile/<id>?top=20&sort=tottime'
+#    $ curl -o topo.pstats 'http://localhost:5000/profile/<id>/pstats'
+#    $ python -m pstats topo.pstats
+#
+# Profiling is never active on AWS Lambda (the Zappa deployment), even if
+# it was enabled by accident, unless PROFILING_ALLOW_LAMBDA is set as well.
+#
+
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import threading
+
+from collections import OrderedDict
+
+
+SORT_KEYS = ("cumulative", "tottime", "calls", "ncalls", "time")
+
+
+def on_lambda():
+    """
+    Return True when running in AWS Lambda.
+
+    """
+    return bool(os.environ.get("AWS_LAMBDA_FUNCTION_NAME"))
+
+
+def profiling_allowed(enabled, allow_lambda=False):
+    """
+    Return True if profiling was enabled and may run here.
+
+    """
+    return bool(enabled) and (allow_lambda or not on_lambda())
+
+
+class ProfileStore(object):
+    """
+    LRU store of the pstats.Stats of profiled requests, by profile ID.
+
+    Only one request is profiled at a time: cProfile can't run in several
+    threads at once on all versions of Python. Requests that arrive while
+    another request is profiled are served without profiling.
+
+    """
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries    = OrderedDict()
+        self._lock       = threading.Lock()
+        self._busy       = threading.Lock()
+
+    def start(self):
+        """
+        Return a started cProfile.Profile, or None if another request is
+        profiled at the moment. finish() must be called for a started
+        profile.
+
+        """
+        if not self._busy.acquire(False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except Exception:
+            self._busy.release()
+            raise
+        return profile
+
+    def finish(self, profile_id, profile):
+        """
+        Stop the profile and store its stats under the given ID, merging
+        them with those of earlier runs under the same ID.
+
+        """
+        try:
+            profile.disable()
+        finally:
+            self._busy.release()
+        stats = pstats.Stats(profile)
+        with self._lock:
+            old = self._entries.pop(profile_id, None)
+            if old is not None:
+                stats.add(old)
+            self._entries[profile_id] = stats
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, profile_id):
+        with self._lock:
+            return self._entries.get(profile_id)
+
+    def ids(self):
+        with self._lock:
+            return list(self._entries)
+
+    def pstats_data(self, profile_id):
+        """
+        Return the stats in the format of pstats files, or None.
+
+        """
+        stats = self.get(profile_id)
+        if stats is None:
+            return None
+        return marshal.dumps(stats.stats)
+
+    def summary(self, profile_id, top=30, sort="cumulative"):
+        """
+        Return the 'top' hottest functions as text, or None.
+
+        """
+        stats = self.get(profile_id)
+        if stats is None:
+            return None
+        if sort not in SORT_KEYS:
+            raise ValueError("Sort key should be one of: %s" %
+                             ", ".join(SORT_KEYS))
+        out = io.StringIO()
+        with self._lock:
+            stats.stream = out
+            stats.sort_stats(sort).print_stats(top)
+        return out.getvalue()
+
+
+def profile_id(conf_hash, view):
+    """
+    Return the ID of the profiles of a view for a config hash.
+
+    """
+    return "%s-%s" % (conf_hash[:16], view)
+
+
+class ProfiledChunks(object):
+    """
+    Passes on the chunks of a streamed response, continuing the profile
+    while they are produced. The profile is finished once the response is
+    done or closed, even if it was never iterated.
+
+    """
+    def __init__(self, chunks, store, pid, profile):
+        self._it     = iter(chunks)
+        self._chunks = chunks
+        self.store   = store
+        self.pid     = pid
+        self.profile = profile
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.profile is None:
+            raise StopIteration
+        self.profile.enable()
+        try:
+            return next(self._it)
+        except StopIteration:
+            self.close()
+            raise
+        finally:
+            if self.profile is not None:
+                self.profile.disable()
+
+    def close(self):
+        if self.profile is not None:
+            profile, self.profile = self.profile, None
+            self.store.finish(self.pid, profile)
+        if hasattr(self._chunks, "close"):
+            self._chunks.close()
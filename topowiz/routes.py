@@ -0,0 +1,244 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# The routes to install on the switches of a routed data center.
+#
+# The spine switches need a route to each rack, and (with a prefix group per
+# host) the top-of-rack switches need a route to each host, for the prefixes
+# of the groups in every network. These routes are summarized with the ORTC
+# algorithm (Draves et al., "Constructing Optimal IP Routing Tables") on a
+# binary prefix trie, which yields the smallest set of routes with the same
+# forwarding behaviour. Address space inside the networks that isn't
+# assigned to any group stays without route, unless it is asked to be
+# treated as "don't care", so that it can be covered by a summary route.
+#
+
+from .model    import iter_groups
+from .prefixes import format_cidr, network_prefixes
+from .topo     import build_topology, is_routed, topology_confs
+
+
+# Next hop of the address space that may be forwarded anywhere
+DONT_CARE = object()
+
+
+class _Node(object):
+    __slots__ = ("children", "hop", "hops")
+
+    def __init__(self):
+        self.children = None
+        self.hop      = None
+        self.hops     = None
+
+
+def _insert(root, root_plen, addr, plen, hop):
+    node = root
+    for bit in range(root_plen, plen):
+        if node.children is None:
+            node.children = [_Node(), _Node()]
+        node = node.children[(addr >> (31 - bit)) & 1]
+    node.hop = hop
+
+
+def _expand(node, inherited):
+    """
+    First ORTC pass: Every node gets either no or two children, and every
+    leaf the next hop that applies to it. Don't care ranges only apply to
+    addresses that have no route.
+
+    """
+    hop = inherited
+    if node.hop is not None and \
+            (node.hop is not DONT_CARE or inherited is None):
+        hop = node.hop
+    if node.children is None:
+        node.hops = hop
+        return
+    for child in node.children:
+        _expand(child, hop)
+
+
+def _merge(node):
+    """
+    Second ORTC pass: Calculate the set of candidate next hops of each node,
+    bottom up. A set of None stands for 'any next hop'.
+
+    """
+    if node.children is None:
+        node.hops = None if node.hops is DONT_CARE else {node.hops}
+        return node.hops
+    left, right = [_merge(child) for child in node.children]
+    if left is None or right is None:
+        node.hops = right if left is None else left
+    else:
+        node.hops = (left & right) or (left | right)
+    return node.hops
+
+
+def _choose(hops):
+    # None (no route) is preferred, since it needs no route, then the first
+    # hop in name order, so that the result is deterministic.
+    if None in hops:
+        return None
+    return min(hops, key=str)
+
+
+def _select(node, addr, plen, inherited, result):
+    """
+    Third ORTC pass: Top down, a node gets a route only if the next hop that
+    it inherits isn't one of its candidates.
+
+    """
+    hop = inherited
+    if node.hops is not None and inherited not in node.hops:
+        hop = _choose(node.hops)
+        result.append((addr, plen, hop))
+    if node.children is not None:
+        _select(node.children[0], addr, plen + 1, hop, result)
+        _select(node.children[1], addr | (1 << (31 - plen)), plen + 1, hop,
+                result)
+
+
+def summarize(routes, dont_care=()):
+    """
+    Return the smallest list of (address, prefix length, next hop) routes
+    that forwards every address like the given routes do, sorted by address.
+
+    Addresses in the (address, prefix length) ranges of 'dont_care' that are
+    not covered by any route may be forwarded anywhere. All other addresses
+    without route stay without route. In rare layouts, this requires a route
+    with next hop None, which means that the traffic is discarded.
+
+    """
+    # The trie starts at the longest prefix that is common to all routes, to
+    # save the walk down to it for each route.
+    prefixes  = [(addr, plen) for addr, plen, _ in routes] + list(dont_care)
+    first     = prefixes[0][0] if prefixes else 0
+    root_plen = min([plen for _, plen in prefixes] or [0])
+    for addr, _ in prefixes:
+        root_plen = min(root_plen, 32 - (addr ^ first).bit_length())
+    root_addr = first & ~((1 << (32 - root_plen)) - 1)
+
+    root = _Node()
+    # Shorter prefixes first, so that a route to a prefix within a don't
+    # care range isn't overwritten.
+    for addr, plen in sorted(dont_care, key=lambda r: r[1]):
+        _insert(root, root_plen, addr, plen, DONT_CARE)
+    for addr, plen, hop in routes:
+        _insert(root, root_plen, addr, plen, hop)
+
+    _expand(root, None)
+    _merge(root)
+    result = []
+    _select(root, root_addr, root_plen, None, result)
+    return sorted(result, key=lambda r: (r[0], r[1]))
+
+
+def _route_list(routes):
+    return [{"prefix" : format_cidr(addr, plen), "via" : hop}
+            for addr, plen, hop in routes]
+
+
+def _group_routes(groups):
+    """
+    Return the (address, prefix length, group name) routes to the prefixes of
+    the (lazy) groups.
+
+    """
+    return [(addr, plen, g.name)
+            for g in groups for _, addr, plen in g.prefixes]
+
+
+def route_tables(conf, dont_care=False):
+    """
+    Return the document with the summarized routes for the switches of a
+    routed data center, for the given user config (see _route_tables()).
+
+    With 'dont_care' set, the address space of the networks (and racks) that
+    isn't assigned to any group may be forwarded anywhere, which gives fewer
+    routes. Otherwise it stays without route, as without summarization.
+
+    For a config with several 'topologies', the document has a list of
+    'topologies' instead, with the routes of each topology that is a routed
+    data center, or null for the others:
+
+        {"topologies" : [null, {"spine" : [...], ...}]}
+
+    Raises an exception if none of the topologies is a routed data center.
+
+    """
+    confs = topology_confs(conf)
+    if not any(is_routed(c) for c in confs):
+        raise Exception("Routes are only calculated for routed data center "
+                        "networks.")
+    if 'topologies' not in conf:
+        return _route_tables(conf, dont_care)
+    return {"topologies" : [_route_tables(c, dont_care) if is_routed(c)
+                            else None for c in confs]}
+
+
+def _route_tables(conf, dont_care=False):
+    """
+    Return the document with the summarized routes for the switches of a
+    routed data center, for a config with a single topology:
+
+        {
+            "spine" : [<route>, ...],
+            "racks" : [{"name" : <rack>, "routes" : [<route>, ...]}, ...],
+            "stats" : {...}
+        }
+
+    Each route is a dictionary with the 'prefix' and the group it leads to
+    ('via'). The routes of the racks are only there with a prefix group per
+    host. The statistics give the number of routes before and after
+    summarization, and the number of address blocks, which each would need
+    a route if there was no aggregation at all.
+
+    """
+    cd       = conf['datacenter']
+    topo     = build_topology(conf, lazy=True, prefixes=True)
+    networks = [(addr, plen) for _, addr, plen, _ in
+                network_prefixes(topo["networks"])]
+    racks    = topo["topologies"][0]["map"]
+
+    spine_routes = _group_routes(racks)
+    spine_space  = networks if dont_care else ()
+    doc = {"spine" : _route_list(summarize(spine_routes, spine_space))}
+    num_routes = len(spine_routes)
+    num_summarized = len(doc["spine"])
+
+    if cd['prefix_per_host']:
+        doc["racks"] = []
+        for rack in racks:
+            host_routes = _group_routes(rack["groups"])
+            rack_space  = [(addr, plen) for _, addr, plen in rack.prefixes
+                           if dont_care]
+            routes      = _route_list(summarize(host_routes, rack_space))
+            doc["racks"].append({"name" : rack["name"], "routes" : routes})
+            num_routes     += len(host_routes)
+            num_summarized += len(routes)
+
+    num_blocks = sum(1 << max(0, n['block_mask'] - plen)
+                     for n, (_, plen) in zip(topo["networks"], networks))
+    doc["stats"] = {
+        "groups"            : sum(1 for _ in iter_groups(racks)),
+        "routes"            : num_routes,
+        "summarized_routes" : num_summarized,
+        "blocks"            : num_blocks
+    }
+    return doc
@@ -0,0 +1,210 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# Streaming JSON serialization.
+#
+# The output is identical to json.dumps(obj, indent=...) (or, without indent,
+# to json.dumps(obj, separators=(",", ":"))), but it is produced
+# in chunks, any mapping is accepted in place of a dict and any iterable (such
+# as a generator or a lazy GroupRange) in place of a list. That way, very
+# large topologies can be sent while they are still being generated, without
+# ever being held in memory.
+#
+# Subtrees that are shared by many groups (see model.py) are only encoded
+# once per indentation level. Parts of a document can be encoded separately
+# with encode() (for example to measure their size), and are then inserted
+# as they are.
+#
+
+import json
+
+from json.encoder import encode_basestring_ascii as _encode_str
+
+from collections.abc import Mapping
+
+from .model import Group, GroupRange, count_groups, to_ranges
+
+
+CHUNK_SIZE = 64 * 1024
+
+# Group ranges with up to this many groups (including nested ones) are
+# encoded in one piece and remembered, so that repeated occurrences of the
+# same, shared range are not encoded again. Larger ones, and ranges with
+# prefixes, which are never shared, are always streamed.
+MEMO_MAX_GROUPS = 4096
+
+# The formats in which topologies are offered, with the indentation of the
+# JSON. The 'ranges' format represents ranges of groups by a single object
+# (see model.to_ranges()).
+FORMATS = {
+    "pretty" : 4,
+    "min"    : None,
+    "ranges" : None
+}
+
+
+def _newline(indent, level):
+    """
+    The line break and indentation before an element at the given level, or
+    nothing for compact output.
+
+    """
+    if indent is None:
+        return ""
+    return "\n" + indent * level
+
+
+def _colon(indent):
+    return ":" if indent is None else ": "
+
+
+class Encoded(str):
+    """
+    JSON that was already encoded by encode().
+
+    """
+    __slots__ = ()
+
+
+def _iter_tokens(obj, indent, level, memo):
+    """
+    Recursively produce the string fragments for the given object.
+
+    """
+    # Ranges with prefixes are created per parent group (see
+    # GroupRange._group()), so they never occur twice and aren't memoized.
+    if isinstance(obj, GroupRange) and obj.prefixes is None and \
+            count_groups(obj) <= MEMO_MAX_GROUPS:
+        key = (id(obj), level)
+        if key not in memo:
+            # Holding on to the object as well, so that its id can't be
+            # reused while the memo exists.
+            memo[key] = (obj, "".join(_iter_list_tokens(obj, indent, level,
+                                                        memo)))
+        yield memo[key][1]
+    elif isinstance(obj, Group) and not obj.groups:
+        # Leaf groups make up most of a topology. Encoding them in one go is
+        # much faster than walking them token by token.
+        yield _encode(obj, indent, level)
+    elif isinstance(obj, (dict, Mapping)):
+        if not obj:
+            yield "{}"
+            return
+        inner = _newline(indent, level + 1)
+        colon = _colon(indent)
+        sep   = "{" + inner
+        for key, value in obj.items():
+            yield sep
+            yield _encode_str(key)
+            yield colon
+            yield from _iter_tokens(value, indent, level + 1, memo)
+            sep = "," + inner
+        yield _newline(indent, level) + "}"
+    elif isinstance(obj, str):
+        yield obj if type(obj) is Encoded else _encode_str(obj)
+    elif isinstance(obj, (int, float, bool)) or obj is None:
+        yield json.dumps(obj)
+    else:
+        yield from _iter_list_tokens(obj, indent, level, memo)
+
+
+def _iter_list_tokens(obj, indent, level, memo):
+    """
+    Produce the string fragments for lists, tuples and any other iterable,
+    such as generators.
+
+    """
+    # We can't know up front if the iterable is empty, so the opening bracket
+    # is only emitted with the first element.
+    inner = _newline(indent, level + 1)
+    sep   = "[" + inner
+    for value in obj:
+        yield sep
+        yield from _iter_tokens(value, indent, level + 1, memo)
+        sep = "," + inner
+    if sep[0] == "[":
+        yield "[]"
+    else:
+        yield _newline(indent, level) + "]"
+
+
+def _encode(obj, indent, level):
+    """
+    Return the complete encoding of a (small) object as a single string.
+
+    """
+    if isinstance(obj, str):
+        return _encode_str(obj)
+    if isinstance(obj, (dict, Mapping)):
+        if not obj:
+            return "{}"
+        inner = _newline(indent, level + 1)
+        colon = _colon(indent)
+        items = [_encode_str(key) + colon + _encode(value, indent, level + 1)
+                 for key, value in obj.items()]
+        return "{%s%s%s}" % (inner, ("," + inner).join(items),
+                             _newline(indent, level))
+    if isinstance(obj, (int, float, bool)) or obj is None:
+        return json.dumps(obj)
+    return "".join(_iter_list_tokens(obj, indent, level, {}))
+
+
+def encode(obj, indent=4, level=0):
+    """
+    Serialize the object to JSON, for inclusion as it is at the given nesting
+    level of a document that is serialized with iter_json().
+
+    """
+    if indent is not None:
+        indent = " " * indent
+    return Encoded("".join(_iter_tokens(obj, indent, level, {})))
+
+
+def iter_json(obj, indent=4, chunk_size=CHUNK_SIZE):
+    """
+    Serialize the object to JSON, yielding utf-8 encoded chunks of roughly
+    'chunk_size' bytes. With 'indent' set to None, the output is compact,
+    without any whitespace.
+
+    """
+    if indent is not None:
+        indent = " " * indent
+    buf    = []
+    size   = 0
+    for token in _iter_tokens(obj, indent, 0, {}):
+        buf.append(token)
+        size += len(token)
+        if size >= chunk_size:
+            yield "".join(buf).encode("utf-8")
+            buf  = []
+            size = 0
+    if buf:
+        yield "".join(buf).encode("utf-8")
+
+
+def iter_topology(topo, fmt="pretty", chunk_size=CHUNK_SIZE):
+    """
+    Serialize a (lazy) topology in one of the FORMATS, yielding utf-8
+    encoded chunks.
+
+    """
+    if fmt == "ranges":
+        yield json.dumps(to_ranges(topo),
+                         separators=(",", ":")).encode("utf-8")
+    else:
+        yield from iter_json(topo, FORMATS[fmt], chunk_size)
@@ -0,0 +1,157 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# Support for fast cold starts, for example on AWS Lambda.
+#
+# - StartupTimer records how long the imports and the first request took, so
+#   that cold start latency can be tracked over time.
+# - defer_flask_s3() postpones the import of Flask-S3 (and with it boto3)
+#   until the first template is rendered.
+# - Templates can be precompiled into Python modules, which are then loaded
+#   instead of parsing the templates on first use:
+#
+#      $ python -m topowiz.startup compile-templates <directory>
+#
+#   and set PRECOMPILED_TEMPLATES in the app config to that directory.
+#
+# This module is imported before anything else by the app, so it must not
+# import anything heavy itself.
+#
+
+import json
+import sys
+import time
+
+
+class StartupTimer(object):
+    """
+    Records named points in time, relative to the creation of the timer.
+
+    """
+    def __init__(self):
+        self.start         = time.perf_counter()
+        self.marks         = []
+        self.first_request = None
+
+    def mark(self, label):
+        self.marks.append((label, time.perf_counter()))
+
+    def request_started(self):
+        """
+        To be called at the start of every request. Returns True for the
+        first request.
+
+        """
+        if self.first_request is not None:
+            return False
+        self.first_request = time.perf_counter()
+        return True
+
+    def report(self):
+        """
+        Return a dictionary with the milliseconds from the start until each
+        mark. For the first request, its duration is included as well.
+
+        """
+        result = dict((label, round((t - self.start) * 1000, 2))
+                      for label, t in self.marks)
+        if "first request done" in result and self.first_request:
+            done = dict(self.marks)["first request done"]
+            result["first request duration"] = \
+                round((done - self.first_request) * 1000, 2)
+        return result
+
+
+timer = StartupTimer()
+
+
+def defer_flask_s3(app):
+    """
+    Set up Flask-S3 for the app only when the first template calls url_for().
+
+    Flask-S3 replaces the url_for() function of the templates, so that static
+    assets are served from S3. Since importing it pulls in boto3, which takes
+    a good part of the start up time, we install a url_for() that sets up
+    Flask-S3 on first use. Requests that don't render templates never pay for
+    it, and neither does local development, where Flask-S3 isn't active.
+
+    """
+    import flask
+
+    state = {}
+
+    def url_for(*args, **kwargs):
+        real = state.get("url_for")
+        if real is None:
+            app.jinja_env.globals['url_for'] = flask.url_for
+            s3_active = app.config.get('FLASKS3_ACTIVE', True) and \
+                (not app.debug or app.config.get('FLASKS3_DEBUG', False))
+            if s3_active:
+                from flask_s3 import FlaskS3
+                FlaskS3(app)
+            real = state["url_for"] = app.jinja_env.globals['url_for']
+        return real(*args, **kwargs)
+
+    app.jinja_env.globals['url_for'] = url_for
+
+
+def use_precompiled_templates(app):
+    """
+    Load the templates from the precompiled modules in the directory given by
+    PRECOMPILED_TEMPLATES, if that is set.
+
+    The loader of the Jinja environment is replaced directly, since Flask's
+    own loader expects to read template sources, which a ModuleLoader can't
+    provide.
+
+    """
+    path = app.config.get('PRECOMPILED_TEMPLATES')
+    if path:
+        from jinja2 import ModuleLoader
+        app.jinja_env.loader = ModuleLoader(path)
+
+
+def compile_templates(app, target):
+    """
+    Compile all templates of the app into Python modules in 'target'.
+
+    """
+    app.jinja_env.compile_templates(target, zip=None,
+                                    ignore_errors=False)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) == 2 and argv[0] == "compile-templates":
+        from .http import app
+        compile_templates(app, argv[1])
+    elif argv == ["report"]:
+        # Import the app and run a first request, to see the cold start
+        # timings of a fresh process.
+        from .http    import app
+        from .startup import timer as app_timer
+        app.test_client().get("/")
+        print(json.dumps(app_timer.report(), indent=4))
+    else:
+        print("Usage: python -m topowiz.startup "
+              "(compile-templates <directory> | report)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# Optional server-side store for user configs and serialized topologies.
+#
+# Without the store, each URL of the wizard carries the complete encoded
+# config (see codec.py), which grows with every network. With the store
+# enabled (CONFIG_STORE_BACKEND in app_config.py), configs are saved under a
+# short ID derived from their content, and the URLs carry the ID instead:
+#
+#    /done/~Xa3kQ9_fLp2c
+#
+# IDs start with '~', which never occurs in encoded configs, so URLs with
+# encoded configs continue to work. The same config always gets the same ID,
+# so the URLs stay cacheable. The serialized topologies of the configs are
+# saved as well (see cache.TopologyCache), so that revisiting a config after
+# a restart doesn't serialize it again.
+#
+# Two backends are available: 'sqlite', a single SQLite database file, and
+# 'files', a directory with one file per config or topology. Both can be
+# shared by several processes on the same host. A small in-memory LRU cache
+# of configs sits in front of the backend, and writes go through it to the
+# backend. Entries that weren't used for CONFIG_STORE_MAX_AGE are removed,
+# as are the least recently used ones once the store exceeds
+# CONFIG_STORE_MAX_BYTES. Their URLs then no longer work, which is why this
+# store suits a private deployment rather than a public one.
+#
+
+import base64
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from collections import OrderedDict
+
+
+ID_MARKER = "~"
+
+# Lengths of the IDs (in characters, after the marker). Longer IDs of the
+# same config hash are only used in the unlikely event of a collision.
+ID_LENGTHS = (12, 24, 43)
+
+BACKENDS = ("sqlite", "files")
+
+# The limits of the backends are checked whenever this fraction of their
+# size limit was written.
+_CHECK_FRACTION = 64
+
+# The time of last use of an entry is only updated if it's older than this
+# (in seconds), rather than on every read.
+_TOUCH_INTERVAL = 3600
+
+_ID_RE  = re.compile(r"^[A-Za-z0-9_-]+$")
+_KEY_RE = re.compile(r"^[A-Za-z0-9_+-][A-Za-z0-9_.+-]*$")
+
+
+def is_conf_id(raw_conf):
+    """
+    Return True if the config part of a URL is a store ID, rather than an
+    encoded config.
+
+    """
+    return raw_conf.startswith(ID_MARKER)
+
+
+class _Backend(object):
+    """
+    Common part of the backends: Entries that weren't used for 'max_age'
+    seconds are removed, as are the least recently used entries once all
+    entries together exceed 'max_bytes'. None means no limit.
+
+    The limits are checked after a put, once the data written since the
+    last check adds up to a fraction of 'max_bytes', since a check has to
+    look at all entries.
+
+    """
+    def __init__(self, max_bytes=None, max_age=None):
+        self.max_bytes = max_bytes
+        self.max_age   = max_age
+        self._written  = None
+
+    def put(self, kind, key, data):
+        self._put(kind, key, data)
+        if self.max_bytes is None and self.max_age is None:
+            return
+        if self._written is not None:
+            self._written += len(data)
+            if self.max_bytes is None or \
+                    self._written < self.max_bytes // _CHECK_FRACTION:
+                return
+        self._written = 0
+        self.evict()
+
+    def _oldest_first(self, entries, now):
+        """
+        Return the entries to remove, from a list of (last used, size, entry)
+        tuples.
+
+        """
+        entries.sort(key=lambda e: e[0])
+        total   = sum(size for _, size, _ in entries)
+        removed = []
+        for used, size, entry in entries:
+            expired = self.max_age is not None and used < now - self.max_age
+            if not expired and \
+                    (self.max_bytes is None or total <= self.max_bytes):
+                break
+            removed.append(entry)
+            total -= size
+        return removed
+
+
+class SqliteBackend(_Backend):
+    """
+    Stores the data in a table of a SQLite database, by kind and key.
+
+    The database is opened on first use in each process, since a connection
+    must not be shared with processes forked from this one (as by pre-fork
+    servers). The sqlite3 module is only imported then as well.
+
+    """
+    def __init__(self, path, max_bytes=None, max_age=None):
+        super(SqliteBackend, self).__init__(max_bytes, max_age)
+        self.path  = path
+        self._lock = threading.Lock()
+        self._db   = None
+        self._pid  = None
+
+    def _connection(self):
+        # Called with the lock held.
+        if self._pid != os.getpid():
+            import sqlite3
+            self._db  = sqlite3.connect(self.path, check_same_thread=False)
+            self._pid = os.getpid()
+            self._db.execute("CREATE TABLE IF NOT EXISTS store ("
+                             "kind TEXT, key TEXT, data BLOB, size INTEGER, "
+                             "used REAL, PRIMARY KEY (kind, key))")
+            self._db.commit()
+        return self._db
+
+    def get(self, kind, key):
+        now = time.time()
+        with self._lock:
+            db  = self._connection()
+            row = db.execute("SELECT data, used FROM store "
+                             "WHERE kind = ? AND key = ?",
+                             (kind, key)).fetchone()
+            if row and row[1] < now - _TOUCH_INTERVAL:
+                db.execute("UPDATE store SET used = ? "
+                           "WHERE kind = ? AND key = ?", (now, kind, key))
+                db.commit()
+        return bytes(row[0]) if row else None
+
+    def _put(self, kind, key, data):
+        with self._lock:
+            db = self._connection()
+            db.execute("INSERT OR REPLACE INTO store VALUES (?, ?, ?, ?, ?)",
+                       (kind, key, bytes(data), len(data),
+                        time.time()))
+            db.commit()
+
+    def evict(self):
+        with self._lock:
+            db      = self._connection()
+            entries = [(used, size, (kind, key)) for kind, key, size, used
+                       in db.execute("SELECT kind, key, size, used "
+                                     "FROM store")]
+            removed = self._oldest_first(entries, time.time())
+            db.executemany("DELETE FROM store WHERE kind = ? AND key = ?",
+                           removed)
+            db.commit()
+
+
+class FileBackend(_Backend):
+    """
+    Stores the data in files named <directory>/<kind>/<key>. The time of
+    last use is the modification time of the file.
+
+    """
+    def __init__(self, directory, max_bytes=None, max_age=None):
+        super(FileBackend, self).__init__(max_bytes, max_age)
+        self.directory = directory
+
+    def _path(self, kind, key):
+        return os.path.join(self.directory, kind, key)
+
+    def get(self, kind, key):
+        path = self._path(kind, key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+                if os.fstat(f.fileno()).st_mtime < \
+                        time.time() - _TOUCH_INTERVAL:
+                    os.utime(path)
+                return data
+        except FileNotFoundError:
+            return None
+
+    def _put(self, kind, key, data):
+        path = self._path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written to a temporary file first, so that readers in other
+        # processes never see a partial file.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def evict(self):
+        entries = []
+        for kind in ("configs", "topologies"):
+            try:
+                files = list(os.scandir(os.path.join(self.directory, kind)))
+            except FileNotFoundError:
+                continue
+            for f in files:
+                try:
+                    st = f.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, f.path))
+        for path in self._oldest_first(entries, time.time()):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                # Removed by another process in the meantime.
+                pass
+
+
+class ConfigStore(object):
+    """
+    Configs by ID and serialized topologies by key, in a backend with an
+    in-memory LRU cache of up to 'max_entries' configs in front of it.
+
+    The ID of a config is derived from its JSON form as entered, since the
+    order of its keys is shown to the user. The cache holds the JSON form as
+    well, so that each caller gets a config of its own to modify.
+
+    """
+    def __init__(self, backend, max_entries=256):
+        self.backend     = backend
+        self.max_entries = max_entries
+        self._entries    = OrderedDict()
+        self._lock       = threading.Lock()
+
+    def _remember(self, conf_id, data):
+        with self._lock:
+            self._entries[conf_id] = data
+            self._entries.move_to_end(conf_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _cached(self, conf_id):
+        with self._lock:
+            data = self._entries.get(conf_id)
+            if data is not None:
+                self._entries.move_to_end(conf_id)
+            return data
+
+    def put_conf(self, conf):
+        """
+        Save the config, if it isn't saved already, and return its ID
+        (including the ID_MARKER).
+
+        """
+        data   = json.dumps(conf).encode("utf-8")
+        digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest())
+        digest = digest.decode("ascii").rstrip("=")
+        for length in ID_LENGTHS:
+            conf_id = ID_MARKER + digest[:length]
+            if self._cached(conf_id) == data:
+                return conf_id
+            stored = self.backend.get("configs", conf_id[1:])
+            if stored is None:
+                self.backend.put("configs", conf_id[1:], data)
+            elif stored != data:
+                # Another config with the same short ID.
+                continue
+            self._remember(conf_id, data)
+            return conf_id
+        raise ValueError("Config ID collision")
+
+    def get_conf(self, conf_id):
+        """
+        Return the config with the given ID, or None if there is none.
+
+        """
+        data = self._cached(conf_id)
+        if data is None:
+            if not is_conf_id(conf_id) or not _ID_RE.match(conf_id[1:]):
+                return None
+            data = self.backend.get("configs", conf_id[1:])
+            if data is None:
+                return None
+            self._remember(conf_id, data)
+        return json.loads(data.decode("utf-8"))
+
+    def get_topology(self, key):
+        """
+        Return the serialized topology saved under the given key, or None.
+
+        """
+        return self.backend.get("topologies", key)
+
+    def put_topology(self, key, serialized):
+        if not _KEY_RE.match(key):
+            raise ValueError("Invalid topology key '%s'" % key)
+        self.backend.put("topologies", key, serialized)
+
+
+def open_store(backend, path, max_entries=256, max_bytes=None,
+               max_age=None):
+    """
+    Return the ConfigStore for one of the BACKENDS, at the given path (the
+    database file or the directory), or None if no backend is given. See
+    the backends for the limits.
+
+    """
+    if not backend:
+        return None
+    if backend == "sqlite":
+        return ConfigStore(SqliteBackend(path, max_bytes, max_age),
+                           max_entries)
+    if backend == "files":
+        return ConfigStore(FileBackend(path, max_bytes, max_age),
+                           max_entries)
+    raise ValueError("Unknown config store backend '%s', should be one of: "
+                     "%s" % (backend, ", ".join(BACKENDS)))
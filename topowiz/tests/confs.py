@@ -0,0 +1,87 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# Configs for the tests. Each call returns a new config, which the test may
+# modify. The keys are in the order in which the wizard adds them.
+#
+
+
+def dc_conf(num_racks=4, num_hosts=8, cidr="10.0.0.0/8"):
+    """
+    A routed data center with a prefix per host.
+
+    """
+    return {
+        "networks"   : [{"cidr" : cidr, "name" : "net-0"}],
+        "datacenter" : {"prefix_per_host"    : True,
+                        "flat_network"       : False,
+                        "num_racks"          : num_racks,
+                        "num_hosts_per_rack" : num_hosts}
+    }
+
+
+def flat_conf(num_hosts=5, prefix_per_host=False):
+    """
+    A flat data center with two networks, one of them with a block mask.
+
+    """
+    return {
+        "networks"   : [{"cidr" : "10.0.0.0/8", "name" : "net-0"},
+                        {"cidr" : "172.16.0.0/12", "name" : "net-1",
+                         "block_mask" : 32}],
+        "datacenter" : {"prefix_per_host" : prefix_per_host,
+                        "flat_network"    : True,
+                        "num_hosts"       : num_hosts}
+    }
+
+
+def aws_conf(zones=("us-west-2a", "us-west-2b", "us-west-2c")):
+    return {
+        "networks" : [{"cidr" : "10.1.0.0/16", "name" : "net-0"}],
+        "aws"      : {"region" : "us-west-2",
+                      "zones"  : list(zones)}
+    }
+
+
+def multi_conf():
+    """
+    A config with an AWS and a data center topology.
+
+    """
+    return {
+        "networks"   : [{"cidr" : "10.1.0.0/16", "name" : "net-0"},
+                        {"cidr" : "10.2.0.0/16", "name" : "net-1"}],
+        "topologies" : [
+            {"aws"      : {"region" : "us-east-1",
+                           "zones"  : ["us-east-1a", "us-east-1b"]},
+             "networks" : [0]},
+            {"datacenter" : {"prefix_per_host"    : True,
+                             "flat_network"       : False,
+                             "num_racks"          : 4,
+                             "num_hosts_per_rack" : 8},
+             "networks"   : [1]}
+        ]
+    }
+
+
+def all_confs():
+    """
+    One config of each kind.
+
+    """
+    return [dc_conf(), flat_conf(), aws_conf(), multi_conf()]
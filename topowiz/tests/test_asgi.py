@@ -0,0 +1,160 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import asyncio
+import itertools
+import unittest
+
+from topowiz.asgi import AsgiAdapter
+
+
+class _Chunks(object):
+    # The response of the WSGI app below, which records what was produced.
+
+    def __init__(self, count):
+        self.count    = count
+        self.produced = 0
+        self.closed   = False
+
+    def __iter__(self):
+        for i in itertools.count() if self.count is None \
+                else range(self.count):
+            self.produced += 1
+            yield b"%d\n" % i
+
+    def close(self):
+        self.closed = True
+
+
+class TestAsgiAdapter(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.count = 3
+
+    def wsgi_app(self, environ, start_response):
+        body = environ["wsgi.input"].read()
+        self.calls.append(body)
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        self.chunks = _Chunks(self.count)
+        return self.chunks
+
+    def request(self, messages, headers=(), max_body=10, send=None,
+                disconnect=None):
+        """
+        Run a POST request with the given 'http.request' messages, and
+        return the messages that were sent. The client disconnects after the
+        messages, once 'disconnect' (an asyncio.Event) is set.
+
+        """
+        sent    = []
+        adapter = AsgiAdapter(self.wsgi_app, max_body=max_body)
+        scope   = {"type" : "http", "method" : "POST", "path" : "/",
+                   "headers" : list(headers)}
+
+        async def run():
+            queue = list(messages)
+
+            async def receive():
+                if queue:
+                    return queue.pop(0)
+                if disconnect is not None:
+                    await disconnect.wait()
+                else:
+                    await asyncio.Event().wait()
+                return {"type" : "http.disconnect"}
+
+            async def default_send(message):
+                sent.append(message)
+
+            await adapter(scope, receive, send or default_send)
+
+        try:
+            asyncio.run(run())
+        finally:
+            adapter.executor.shutdown()
+        return sent
+
+    def assertTooLarge(self, sent):
+        self.assertEqual(sent[0]["status"], 413)
+        self.assertEqual(sent[1]["body"], b"Request body too large")
+        self.assertEqual(self.calls, [])
+
+    def test_response(self):
+        sent = self.request([{"type" : "http.request", "body" : b"abc",
+                              "more_body" : True},
+                             {"type" : "http.request", "body" : b"def"}])
+        self.assertEqual(self.calls, [b"abcdef"])
+        self.assertEqual(sent[0]["status"], 200)
+        self.assertEqual(sent[0]["headers"],
+                         [(b"content-type", b"text/plain")])
+        self.assertEqual(b"".join(m["body"] for m in sent[1:]),
+                         b"0\n1\n2\n")
+        self.assertFalse(sent[-1].get("more_body"))
+        self.assertTrue(self.chunks.closed)
+
+    def test_content_length(self):
+        # Refused before the body is read.
+        sent = self.request([], headers=[(b"content-length", b"11")])
+        self.assertTooLarge(sent)
+        self.request([{"type" : "http.request", "body" : b"x" * 10}],
+                     headers=[(b"content-length", b"10")])
+        self.assertEqual(self.calls, [b"x" * 10])
+
+    def test_streamed_body(self):
+        # Without Content-Length, the limit applies to the body received.
+        sent = self.request([{"type" : "http.request", "body" : b"x" * 6,
+                              "more_body" : True},
+                             {"type" : "http.request", "body" : b"x" * 6}])
+        self.assertTooLarge(sent)
+
+    def test_no_limit(self):
+        self.request([{"type" : "http.request", "body" : b"x" * 100}],
+                     max_body=None)
+        self.assertEqual(self.calls, [b"x" * 100])
+
+    def test_disconnect_before_body(self):
+        sent = self.request([{"type" : "http.disconnect"}])
+        self.assertEqual(sent, [])
+        self.assertEqual(self.calls, [])
+
+    def test_disconnect(self):
+        # An endless response stops once the client is gone.
+        self.count = None
+        disconnect = asyncio.Event()
+
+        async def send(message):
+            if message.get("body", b"").startswith(b"5\n"):
+                disconnect.set()
+            await asyncio.sleep(0.001)
+
+        self.request([{"type" : "http.request", "body" : b""}], send=send,
+                     disconnect=disconnect)
+        self.assertTrue(self.chunks.closed)
+        self.assertLess(self.chunks.produced, 100)
+
+    def test_send_error(self):
+        # Servers raise OSError for a send to a closed connection.
+        self.count = None
+
+        async def send(message):
+            if message["type"] == "http.response.body":
+                raise OSError("Connection closed")
+
+        self.request([{"type" : "http.request", "body" : b""}], send=send)
+        self.assertTrue(self.chunks.closed)
+        self.assertLess(self.chunks.produced, 10)
@@ -0,0 +1,166 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+from unittest import mock
+
+from topowiz.cache       import TopologyCache, config_hash, response_etag, \
+                                serialize_topology
+from topowiz.store       import open_store
+from topowiz.tests.confs import dc_conf
+from topowiz.topo        import build_topology
+
+
+class TestEtags(unittest.TestCase):
+
+    def test_config_hash(self):
+        self.assertEqual(config_hash(dc_conf()), config_hash(dc_conf()))
+        self.assertNotEqual(config_hash(dc_conf()), config_hash(dc_conf(5)))
+
+    def test_key_order(self):
+        # The keys of the networks keep their order in the topology, so
+        # configs that only differ by it get hashes of their own.
+        conf  = dc_conf()
+        other = dc_conf()
+        other["networks"] = [dict(reversed(list(n.items())))
+                             for n in other["networks"]]
+        self.assertNotEqual(json.dumps(build_topology(conf)),
+                            json.dumps(build_topology(other)))
+        self.assertNotEqual(config_hash(conf), config_hash(other))
+        self.assertNotEqual(response_etag(conf, "download"),
+                            response_etag(other, "download"))
+
+    def test_etag(self):
+        etag = response_etag(dc_conf(), "download", False, "pretty")
+        self.assertEqual(etag,
+                         response_etag(dc_conf(), "download", False, "pretty"))
+        for other in [response_etag(dc_conf(5), "download", False, "pretty"),
+                      response_etag(dc_conf(), "done", False, "pretty"),
+                      response_etag(dc_conf(), "download", True, "pretty"),
+                      response_etag(dc_conf(), "download", False, "min")]:
+            self.assertNotEqual(etag, other)
+        with mock.patch("topowiz.cache.__version__", "0.0.1"):
+            self.assertNotEqual(etag, response_etag(dc_conf(), "download",
+                                                    False, "pretty"))
+
+
+class TestTopologyCache(unittest.TestCase):
+
+    def test_get(self):
+        cache      = TopologyCache()
+        topo, data = cache.get(dc_conf())
+        self.assertEqual(json.loads(data), build_topology(dc_conf()))
+        self.assertIs(cache.get(dc_conf())[0], topo)
+        # Each variant is an entry of its own.
+        sizes = [len(data)]
+        for prefixes, fmt in [(True, "pretty"), (False, "min")]:
+            other = cache.get(dc_conf(), prefixes, fmt)[1]
+            self.assertNotEqual(other, data)
+            sizes.append(len(other))
+        self.assertEqual(cache.stats(),
+                         {"entries" : 3, "bytes" : sum(sizes), "hits" : 1,
+                          "misses" : 3, "evictions" : 0})
+
+    def test_lru(self):
+        cache = TopologyCache(max_entries=2)
+        cache.store("a", None, b"a")
+        cache.store("b", None, b"b")
+        self.assertIsNotNone(cache.lookup("a"))
+        cache.store("c", None, b"c")
+        # 'b' was used least recently.
+        self.assertIsNone(cache.lookup("b"))
+        self.assertIsNotNone(cache.lookup("a"))
+        self.assertIsNotNone(cache.lookup("c"))
+        cache.store("a", None, b"a")
+        self.assertEqual(cache.stats(),
+                         {"entries" : 2, "bytes" : 2, "hits" : 3,
+                          "misses" : 1, "evictions" : 1})
+
+    def test_max_bytes(self):
+        cache = TopologyCache(max_bytes=10)
+        for key in "abc":
+            cache.store(key, None, b"x" * 4)
+        self.assertEqual([cache.lookup(key) is not None for key in "abc"],
+                         [False, True, True])
+        # Replacing an entry counts only its new size.
+        cache.store("c", None, b"x" * 6)
+        self.assertEqual(cache.stats()["bytes"], 10)
+        self.assertEqual(len(cache), 2)
+        # Too large to be cached at all, without evicting anything.
+        cache.store("d", None, b"x" * 11)
+        self.assertIsNone(cache.lookup("d"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertEqual(len(cache), 2)
+
+    def test_disabled(self):
+        cache = TopologyCache(max_entries=0)
+        cache.get(dc_conf())
+        cache.get(dc_conf())
+        self.assertEqual(cache.stats(),
+                         {"entries" : 0, "bytes" : 0, "hits" : 0,
+                          "misses" : 2, "evictions" : 0})
+
+    def test_config_store(self):
+        directory = tempfile.mkdtemp()
+        try:
+            store = open_store("files", directory)
+            _, data = TopologyCache(config_store=store).get(dc_conf())
+            # A new cache loads the topology from the store, rather than
+            # serializing it again.
+            with mock.patch("topowiz.cache.serialize_topology") as serialize:
+                cache = TopologyCache(config_store=store)
+                self.assertEqual(cache.get(dc_conf())[1], data)
+                self.assertFalse(serialize.called)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_threads(self):
+        # Concurrent lookups and evictions keep the counters and the size
+        # consistent.
+        cache  = TopologyCache(max_entries=3)
+        confs  = [dc_conf(i + 1) for i in range(5)]
+        errors = []
+
+        def work(n):
+            try:
+                for i in range(40):
+                    conf = confs[(n + i) % len(confs)]
+                    self.assertEqual(cache.get(conf)[1],
+                                     serialize_topology(
+                                        build_topology(conf, lazy=True)))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(n,))
+                   for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        stats = cache.stats()
+        self.assertEqual(stats["hits"] + stats["misses"], 8 * 40)
+        self.assertEqual(stats["entries"], 3)
+        self.assertEqual(stats["bytes"], sum(len(data) for _, data in
+                                             cache._entries.values()))
+        # Concurrent misses of the same config replace each other's entry.
+        self.assertGreaterEqual(stats["misses"] - stats["evictions"], 3)
@@ -0,0 +1,92 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from topowiz.cli         import run
+from topowiz.tests.confs import all_confs, dc_conf
+from topowiz.topo        import build_topology
+
+
+class TestRun(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # Valid configs of all kinds, and some that fail, in between.
+        confs = [dc_conf(i % 7 + 1, i % 5 + 1) for i in range(40)] + \
+            all_confs()
+        lines = [json.dumps(c) for c in confs]
+        lines[3]  = "{"
+        lines[17] = json.dumps(dc_conf(num_racks=0))
+        self.confs = confs
+        self.fname = os.path.join(self.directory, "confs.jsonl")
+        with open(self.fname, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_cli(self, **kwargs):
+        out    = io.BytesIO()
+        err    = io.StringIO()
+        failed = run([self.fname], out=out, err=err, **kwargs)
+        return failed, out.getvalue(), err.getvalue()
+
+    def test_lines(self):
+        failed, out, err = self.run_cli(prefixes=True)
+        self.assertEqual(failed, 2)
+        lines = out.splitlines()
+        self.assertEqual(len(lines), len(self.confs))
+        self.assertEqual(json.loads(lines[0]),
+                         build_topology(self.confs[0], prefixes=True))
+        self.assertIn("errors", json.loads(lines[3]))
+        self.assertEqual(err.splitlines()[0][:9], "confs-3: ")
+
+    def test_jobs(self):
+        # The same output, in the same order, as without jobs.
+        for fmt in ["pretty", "ranges"]:
+            expected = self.run_cli(prefixes=True, fmt=fmt)
+            for jobs in [2, 3]:
+                self.assertEqual(self.run_cli(prefixes=True, fmt=fmt,
+                                              jobs=jobs),
+                                 expected)
+
+    def read_dir(self, directory):
+        files = {}
+        for name in os.listdir(directory):
+            with open(os.path.join(directory, name), "rb") as f:
+                files[name] = f.read()
+        return files
+
+    def test_out_dir(self):
+        results = []
+        for jobs in [1, 3]:
+            out_dir = os.path.join(self.directory, "out-%d" % jobs)
+            os.mkdir(out_dir)
+            out     = io.BytesIO()
+            failed  = run([self.fname], out_dir, jobs=jobs, out=out,
+                          err=io.StringIO())
+            self.assertEqual(failed, 2)
+            self.assertEqual(out.getvalue(), b"")
+            results.append(self.read_dir(out_dir))
+        self.assertEqual(len(results[0]), len(self.confs) - 2)
+        self.assertEqual(results[0], results[1])
@@ -0,0 +1,102 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import base64
+import json
+import os
+import struct
+import unittest
+import zlib
+
+from topowiz.codec       import FORMAT_JSON_ZLIB, FORMAT_PACKED, \
+                                FORMAT_PACKED_ZLIB, MAX_CONF_BYTES, \
+                                decode_conf, encode_conf
+from topowiz.tests.confs import all_confs, dc_conf
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+def _data_confs():
+    for name in sorted(os.listdir(DATA_DIR)):
+        with open(os.path.join(DATA_DIR, name)) as f:
+            yield json.load(f)
+
+
+def _format(raw_conf):
+    return base64.urlsafe_b64decode(raw_conf + "=" * (-len(raw_conf) % 4))[0]
+
+
+def _raw(fmt, payload):
+    data = struct.pack("B", fmt) + payload
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+class TestCodec(unittest.TestCase):
+
+    def test_round_trip(self):
+        for conf in all_confs() + list(_data_confs()):
+            raw_conf = encode_conf(conf)
+            # The order of the keys is shown to the user, so it has to
+            # survive as well.
+            self.assertEqual(json.dumps(decode_conf(raw_conf)),
+                             json.dumps(conf))
+
+    def test_url_safe(self):
+        for conf in all_confs():
+            raw_conf = encode_conf(conf)
+            self.assertTrue(all(c.isalnum() or c in "-_" for c in raw_conf),
+                            raw_conf)
+
+    def test_packed_format(self):
+        # Configs as entered with the wizard are packed, which is shorter
+        # than the compressed JSON.
+        conf     = dc_conf()
+        raw_conf = encode_conf(conf)
+        js       = json.dumps(conf, separators=(",", ":")).encode("utf-8")
+        self.assertIn(_format(raw_conf), (FORMAT_PACKED, FORMAT_PACKED_ZLIB))
+        self.assertLess(len(raw_conf),
+                        len(_raw(FORMAT_JSON_ZLIB, zlib.compress(js, 9))))
+
+    def test_unpackable_conf(self):
+        # Anything the packed format can't reproduce exactly is kept as JSON.
+        conf     = dict(dc_conf(), comment="not part of the schema")
+        raw_conf = encode_conf(conf)
+        self.assertEqual(_format(raw_conf), FORMAT_JSON_ZLIB)
+        self.assertEqual(decode_conf(raw_conf), conf)
+
+    def test_old_urls(self):
+        # URLs of older versions carry the plain base64 encoded JSON, with
+        # padding.
+        for conf in all_confs() + list(_data_confs()):
+            raw_conf = base64.urlsafe_b64encode(
+                                json.dumps(conf).encode("utf-8")).decode()
+            self.assertEqual(decode_conf(raw_conf), conf)
+            self.assertEqual(decode_conf(raw_conf.rstrip("=")), conf)
+
+    def test_decompressed_size_limit(self):
+        js       = json.dumps({"padding" : " " * MAX_CONF_BYTES})
+        raw_conf = _raw(FORMAT_JSON_ZLIB, zlib.compress(js.encode(), 9))
+        # Small enough for a URL, but too large once decompressed.
+        self.assertLess(len(raw_conf), 2048)
+        self.assertRaises(ValueError, decode_conf, raw_conf)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, decode_conf, _raw(99, b"x"))
+        self.assertRaises(Exception, decode_conf,
+                          _raw(FORMAT_JSON_ZLIB, b"xyz"))
+        self.assertRaises(Exception, decode_conf, "")
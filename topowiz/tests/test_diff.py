@@ -0,0 +1,78 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import copy
+import json
+import unittest
+
+from topowiz.diff        import apply_patch, diff_configs
+from topowiz.tests.confs import all_confs, aws_conf, dc_conf, flat_conf
+from topowiz.topo        import build_topology
+
+
+def _with_networks(conf, *cidrs):
+    conf = copy.deepcopy(conf)
+    conf["networks"] = [{"cidr" : cidr, "name" : "net-%d" % i}
+                        for i, cidr in enumerate(cidrs)]
+    return conf
+
+
+class TestDiff(unittest.TestCase):
+
+    def assertRoundTrip(self, old_conf, new_conf):
+        for prefixes in (False, True):
+            patch = diff_configs(old_conf, new_conf, prefixes)
+            # The patch is plain JSON.
+            patch = json.loads(json.dumps(patch))
+            self.assertEqual(apply_patch(build_topology(old_conf,
+                                                        prefixes=prefixes),
+                                         patch),
+                             build_topology(new_conf, prefixes=prefixes))
+
+    def test_same(self):
+        for conf in all_confs():
+            self.assertEqual(diff_configs(conf, copy.deepcopy(conf), True),
+                             [])
+
+    def test_datacenter(self):
+        self.assertRoundTrip(dc_conf(4, 8), dc_conf(5, 8))
+        self.assertRoundTrip(dc_conf(5, 8), dc_conf(4, 8))
+        self.assertRoundTrip(dc_conf(4, 8), dc_conf(4, 16))
+        self.assertRoundTrip(dc_conf(4, 8), flat_conf())
+        self.assertRoundTrip(flat_conf(5), flat_conf(7))
+        conf = dc_conf()
+        conf["datacenter"]["prefix_per_host"] = False
+        self.assertRoundTrip(dc_conf(), conf)
+
+    def test_networks(self):
+        old = _with_networks(dc_conf(), "10.0.0.0/8", "11.0.0.0/8")
+        for cidrs in [("10.0.0.0/8", "11.0.0.0/8", "12.0.0.0/16"),
+                      ("10.0.0.0/8",),
+                      ("11.0.0.0/8", "10.0.0.0/8"),
+                      ("10.0.0.0/9", "11.0.0.0/8")]:
+            self.assertRoundTrip(old, _with_networks(old, *cidrs))
+            self.assertRoundTrip(_with_networks(old, *cidrs), old)
+
+    def test_aws(self):
+        self.assertRoundTrip(aws_conf(["us-west-2a", "us-west-2b"]),
+                             aws_conf())
+        self.assertRoundTrip(aws_conf(), dc_conf())
+
+    def test_small_patch(self):
+        # Adding a rack adds a single group.
+        patch = diff_configs(dc_conf(255, 16), dc_conf(256, 16))
+        self.assertEqual([op["op"] for op in patch], ["add"])
@@ -0,0 +1,86 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import unittest
+
+from topowiz.estimate    import TopologyTooLarge, check_limits, estimate, \
+                                estimate_group, format_lengths
+from topowiz.model       import count_groups, find_group
+from topowiz.serialize   import FORMATS, iter_topology
+from topowiz.tests.confs import aws_conf, dc_conf, flat_conf, multi_conf
+from topowiz.topo        import build_topology
+
+
+CONFS = [dc_conf(12, 120), flat_conf(1000, prefix_per_host=True),
+         aws_conf(), multi_conf()]
+
+
+def _size(conf, prefixes, fmt):
+    topo = build_topology(conf, lazy=True, prefixes=prefixes)
+    return len(b"".join(iter_topology(topo, fmt)))
+
+
+class TestEstimate(unittest.TestCase):
+
+    def test_format_lengths(self):
+        for label, start, count in [("rack-%d", 0, 1000), ("host-%d", 7, 4),
+                                    ("h%02d", 0, 150), ("x-%d", 99, 0)]:
+            self.assertEqual(format_lengths(label, start, count),
+                             sum(len(label % i)
+                                 for i in range(start, start + count)))
+
+    def test_groups(self):
+        for conf in CONFS:
+            topo = build_topology(conf, lazy=True)
+            self.assertEqual(estimate(conf)["groups"],
+                             sum(count_groups(t["map"])
+                                 for t in topo["topologies"]))
+        self.assertEqual(estimate(CONFS[0])["groups"], 12 + 12 * 120)
+        self.assertEqual(estimate(CONFS[0])["depth"], 2)
+
+    def test_size(self):
+        # Exact without prefixes, and an upper bound with them.
+        for conf in CONFS:
+            for fmt in FORMATS:
+                self.assertEqual(estimate(conf, False, fmt)["bytes"],
+                                 _size(conf, False, fmt), fmt)
+                size      = _size(conf, True, fmt)
+                estimated = estimate(conf, True, fmt)["bytes"]
+                self.assertTrue(size <= estimated <= size * 1.1, fmt)
+
+    def test_group(self):
+        topo  = build_topology(CONFS[0], lazy=True)
+        group = find_group(topo["topologies"][0]["map"], ["rack-11"])
+        for fmt in FORMATS:
+            cost = estimate_group(group, fmt)
+            self.assertEqual(cost["groups"], 121)
+            self.assertEqual(cost["bytes"],
+                             len(b"".join(iter_topology(group, fmt))))
+
+    def test_limits(self):
+        cost = estimate(CONFS[0])
+        check_limits(cost)
+        check_limits(cost, cost["groups"], cost["bytes"])
+        self.assertRaises(TopologyTooLarge, check_limits, cost,
+                          max_groups=cost["groups"] - 1)
+        self.assertRaises(TopologyTooLarge, check_limits, cost,
+                          max_bytes=cost["bytes"] - 1)
+
+    def test_invalid_conf(self):
+        # Too small for a prefix per host.
+        conf = dc_conf(12, 120, "10.0.0.0/24")
+        self.assertRaises(Exception, estimate, conf, True)
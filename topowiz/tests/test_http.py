@@ -0,0 +1,283 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import base64
+import gzip
+import io
+import json
+import unittest
+
+from topowiz.codec       import decode_conf, encode_conf
+from topowiz.http        import app
+from topowiz.tests.confs import dc_conf, multi_conf
+from topowiz.topo        import build_topology
+
+
+class _AppTests(unittest.TestCase):
+    # Requests to the app, without CSRF protection of the forms.
+
+    def setUp(self):
+        self.client = app.test_client()
+        self.config = dict(app.config)
+        app.config['WTF_CSRF_ENABLED'] = False
+
+    def tearDown(self):
+        app.config.clear()
+        app.config.update(self.config)
+
+
+class TestBulkNetworks(_AppTests):
+
+    def post(self, text, data=b""):
+        url = "/gen/bulk_nets/" + encode_conf(dc_conf(cidr="10.0.0.0/16"))
+        return self.client.post(
+                    url, content_type="multipart/form-data",
+                    data={"networks"      : text,
+                          "networks_file" : (io.BytesIO(data), "nets.txt")})
+
+    def test_import(self):
+        response = self.post("blue 11.0.0.0/8", b"12.0.0.0/8\n")
+        self.assertEqual(response.status_code, 302)
+        raw_conf = response.headers["Location"].rsplit("/", 1)[1]
+        self.assertEqual(decode_conf(raw_conf)["networks"][1:],
+                         [{"cidr" : "11.0.0.0/8", "name" : "blue"},
+                          {"cidr" : "12.0.0.0/8", "name" : "net-2"}])
+
+    def test_conflicts(self):
+        response = self.post("10.0.0.0/8\n10.0.1.0/24")
+        self.assertEqual(response.status_code, 200)
+        for msg in [b"10.0.0.0/8: Contains CIDR &#39;10.0.0.0/16&#39; "
+                    b"(existing network)",
+                    b"10.0.1.0/24: Overlaps with CIDR &#39;10.0.0.0/8&#39;",
+                    b"10.0.1.0/24: Overlaps with CIDR &#39;10.0.0.0/16&#39; "
+                    b"(existing network)"]:
+            self.assertIn(msg, response.data)
+
+    def test_upload_size(self):
+        data = b"11.0.0.0/8\n" * (app.config['MAX_CONTENT_LENGTH'] // 10)
+        self.assertEqual(self.post("", data).status_code, 413)
+
+
+class TestApiTopology(_AppTests):
+
+    def post(self, body):
+        return self.client.post("/api/topology", data=body)
+
+    def assertErrors(self, response, status, num_errors=1):
+        self.assertEqual(response.status_code, status)
+        self.assertEqual(len(json.loads(response.data)["errors"]),
+                         num_errors)
+
+    def test_valid(self):
+        response = self.post(json.dumps(dc_conf()))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data),
+                         build_topology(dc_conf()))
+
+    def test_malformed(self):
+        self.assertErrors(self.post("{"), 400)
+        self.assertErrors(self.post("[]"), 400)
+        conf = dc_conf(num_racks=0)
+        conf["networks"][0]["cidr"] = "10.0.0.0"
+        self.assertErrors(self.post(json.dumps(conf)), 400, 2)
+
+    def test_too_large(self):
+        app.config['MAX_TOPOLOGY_GROUPS'] = 100
+        response = self.post(json.dumps(dc_conf(16, 16)))
+        self.assertErrors(response, 400)
+        self.assertIn(b"more than the limit", response.data)
+
+    def test_body_size(self):
+        conf = dc_conf()
+        conf["padding"] = " " * app.config['MAX_CONTENT_LENGTH']
+        self.assertEqual(self.post(json.dumps(conf)).status_code, 413)
+
+
+class TestCompression(_AppTests):
+
+    def get(self, url, encoding):
+        return self.client.get(url, headers={"Accept-Encoding" : encoding})
+
+    def assertCompressed(self, url):
+        plain    = self.get(url, "identity")
+        response = self.get(url, "gzip, deflate")
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertLess(len(response.data), len(plain.data))
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+
+    def test_body(self):
+        # The ranges format is only a few hundred bytes.
+        app.config['COMPRESSION_MIN_BYTES'] = 100
+        raw_conf = encode_conf(dc_conf())
+        for url in ["/download/%s", "/download/%s?prefixes=1&format=min",
+                    "/download/%s?format=ranges"]:
+            self.assertCompressed(url % raw_conf)
+
+    def test_streamed(self):
+        app.config['STREAM_MIN_BYTES'] = 1024
+        self.assertCompressed("/download/" + encode_conf(dc_conf()))
+
+    def test_small(self):
+        app.config['COMPRESSION_MIN_BYTES'] = 1 << 20
+        response = self.get("/download/" + encode_conf(dc_conf()), "gzip")
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(json.loads(response.data), build_topology(dc_conf()))
+
+
+class TestGroups(_AppTests):
+
+    def get(self, conf, query):
+        return self.client.get("/download/%s?%s" % (encode_conf(conf), query))
+
+    def test_hit(self):
+        for prefixes in ["0", "1"]:
+            topo  = build_topology(dc_conf(), prefixes=prefixes == "1")
+            racks = topo["topologies"][0]["map"]
+            for group, expected in [("rack-0", racks[0]), ("3", racks[3]),
+                                    ("rack-3/host-7", racks[3]["groups"][7]),
+                                    ("/3/7/", racks[3]["groups"][7])]:
+                response = self.get(dc_conf(), "group=%s&prefixes=%s" %
+                                    (group, prefixes))
+                self.assertEqual(response.status_code, 200, group)
+                self.assertEqual(json.loads(response.data), expected, group)
+
+    def test_topology(self):
+        response = self.get(multi_conf(), "group=rack-3&topology=1")
+        self.assertEqual(json.loads(response.data)["name"], "rack-3")
+
+    def test_miss(self):
+        for conf, query in [(dc_conf(), "group=rack-4"),
+                            (dc_conf(), "group=4"),
+                            (dc_conf(), "group=rack-3/host-8"),
+                            (dc_conf(), "group=rack-03"),
+                            (multi_conf(), "group=rack-0&topology=2")]:
+            self.assertEqual(self.get(conf, query).status_code, 404, query)
+        response = self.client.post("/api/topology?group=rack-4",
+                                    data=json.dumps(dc_conf()))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.data)["errors"],
+                         ["There is no group 'rack-4' in the topology"])
+        response = self.client.post("/api/topology?group=0&topology=x",
+                                    data=json.dumps(dc_conf()))
+        self.assertEqual(response.status_code, 400)
+
+
+class TestCaching(_AppTests):
+
+    def test_not_modified(self):
+        url      = "/download/" + encode_conf(dc_conf())
+        response = self.client.get(url)
+        etag     = response.headers["ETag"].strip('"')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("immutable", response.headers["Cache-Control"])
+
+        response = self.client.get(url, headers={"If-None-Match" :
+                                                 '"%s"' % etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+        self.assertEqual(response.headers["ETag"].strip('"'), etag)
+
+        response = self.client.get(url, headers={"If-None-Match" : '"x"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_variants(self):
+        raw_conf = encode_conf(dc_conf())
+        etags    = set()
+        for url in ["/done/%s", "/done/%s?prefixes=1", "/download/%s",
+                    "/download/%s?prefixes=1", "/download/%s?format=min"]:
+            response = self.client.get(url % raw_conf)
+            etags.add(response.headers["ETag"])
+        self.assertEqual(len(etags), 5)
+        # Any encoding of the same config gets the same ETag.
+        old_conf = base64.urlsafe_b64encode(
+                            json.dumps(dc_conf()).encode("utf-8")).decode()
+        self.assertEqual(self.client.get("/download/" + old_conf).headers,
+                         self.client.get("/download/" + raw_conf).headers)
+
+
+class TestApiDiff(_AppTests):
+
+    def post(self, body):
+        return self.client.post("/api/diff", data=json.dumps(body))
+
+    def test_diff(self):
+        response = self.post({"old" : dc_conf(4), "new" : dc_conf(5)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([op["op"] for op in json.loads(response.data)],
+                         ["add"])
+
+    def test_errors(self):
+        for body in [[], {"old" : dc_conf()},
+                     {"old" : dc_conf(), "new" : dc_conf(), "x" : 1}]:
+            response = self.post(body)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(json.loads(response.data)["errors"],
+                             ["The request body should be a JSON object "
+                              "with the keys 'old' and 'new'"])
+        response = self.post({"old" : dc_conf(0), "new" : []})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data)["errors"],
+                         ["old: datacenter.num_racks: Should be an integer "
+                          "between 1 and 256",
+                          "new: The config should be an object"])
+
+
+class TestLimits(_AppTests):
+    # Topologies over the limits are refused before they are built.
+
+    def setUp(self):
+        super(TestLimits, self).setUp()
+        app.config['MAX_TOPOLOGY_GROUPS'] = 100
+        self.small = dc_conf(4, 8)
+        self.large = dc_conf(16, 16)
+
+    def test_views(self):
+        for view in ["done", "download", "routes"]:
+            response = self.client.get("/%s/%s" %
+                                       (view, encode_conf(self.small)))
+            self.assertEqual(response.status_code, 200, view)
+            response = self.client.get("/%s/%s" %
+                                       (view, encode_conf(self.large)))
+            self.assertIn(b"more than the limit", response.data, view)
+
+    def test_api(self):
+        for view in ["topology", "routes"]:
+            response = self.client.post("/api/" + view,
+                                        data=json.dumps(self.small))
+            self.assertEqual(response.status_code, 200, view)
+            response = self.client.post("/api/" + view,
+                                        data=json.dumps(self.large))
+            self.assertEqual(response.status_code, 400, view)
+            self.assertIn("more than the limit",
+                          json.loads(response.data)["errors"][0], view)
+
+    def test_diff(self):
+        response = self.client.post("/api/diff",
+                                    data=json.dumps({"old" : self.small,
+                                                     "new" : self.large}))
+        self.assertEqual(response.status_code, 400)
+
+    def test_bytes(self):
+        # The size limit depends on the format.
+        url = "/download/" + encode_conf(self.small)
+        app.config['MAX_TOPOLOGY_BYTES'] = \
+            len(self.client.get(url + "?format=min").data)
+        self.assertEqual(self.client.get(url + "?format=min").status_code,
+                         200)
+        self.assertIn(b"more than the limit", self.client.get(url).data)
@@ -0,0 +1,114 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import re
+import unittest
+
+from topowiz.metrics import LATENCY_BUCKETS, Metrics
+
+
+# A line of the Prometheus text exposition format.
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)'
+                     r'(?:\{((?:[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*",?)*)'
+                     r'\})? (\S+)$')
+_LABEL  = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def _parse(text):
+    """
+    Parse the exposition format, return the types of the metric families and
+    the (name, labels, value) samples. Fails on malformed lines.
+
+    """
+    types   = {}
+    samples = []
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            assert kind in ("counter", "gauge", "histogram"), line
+            types[name] = kind
+        elif not line.startswith("# HELP "):
+            match = _SAMPLE.match(line)
+            assert match, line
+            name, labels, value = match.groups()
+            samples.append((name, dict(_LABEL.findall(labels or "")),
+                            float(value)))
+    return types, samples
+
+
+class TestRender(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics(enabled=True)
+
+    def test_disabled(self):
+        metrics = Metrics()
+        with metrics.stage("build", view="done"):
+            pass
+        metrics.observe_request("done", 200)
+        types, samples = _parse(metrics.render())
+        self.assertEqual(samples, [])
+        self.assertEqual(types["topowiz_requests_total"], "counter")
+
+    def test_format(self):
+        for seconds in [0.0005, 0.003, 0.003, 20]:
+            self.metrics.observe_stage("download", "build", seconds, 1000)
+        self.metrics.observe_request("download", 200)
+        self.metrics.observe_request("download", 200)
+        self.metrics.observe_request('we"ird\\', 404)
+        self.metrics.observe_bytes("download", 5000)
+        self.metrics.observe_groups("download", 12)
+        text = self.metrics.render({"topowiz_cache_entries" : 3})
+        self.assertTrue(text.endswith("\n"))
+
+        types, samples = _parse(text)
+        # Every sample belongs to a declared family.
+        for name, _, _ in samples:
+            family = re.sub("_(bucket|sum|count)$", "", name)
+            self.assertTrue(name in types or types.get(family) == "histogram",
+                            name)
+        self.assertEqual(types["topowiz_stage_seconds"], "histogram")
+        self.assertEqual(types["topowiz_cache_entries"], "gauge")
+        self.assertIn(("topowiz_requests_total",
+                       {"view" : "download", "status" : "200"}, 2), samples)
+        self.assertIn(("topowiz_requests_total",
+                       {"view" : 'we\\"ird\\\\', "status" : "404"}, 1),
+                      samples)
+        self.assertIn(("topowiz_stage_memory_peak_bytes",
+                       {"view" : "download", "stage" : "build"}, 1000),
+                      samples)
+        self.assertIn(("topowiz_cache_entries", {}, 3), samples)
+
+    def test_histogram(self):
+        for seconds in [0.0005, 0.003, 0.003, 20]:
+            self.metrics.observe_stage("download", "build", seconds)
+        _, samples = _parse(self.metrics.render())
+        labels  = {"view" : "download", "stage" : "build"}
+        buckets = [(s[1]["le"], s[2]) for s in samples
+                   if s[0] == "topowiz_stage_seconds_bucket"]
+        # Cumulative counts, with a bucket for each bound and +Inf last.
+        self.assertEqual([le for le, _ in buckets],
+                         [repr(b) for b in LATENCY_BUCKETS] + ["+Inf"])
+        counts = [count for _, count in buckets]
+        self.assertEqual(counts, sorted(counts))
+        self.assertEqual(dict(buckets)["0.001"], 1)
+        self.assertEqual(dict(buckets)["0.005"], 3)
+        self.assertEqual(dict(buckets)["10.0"], 3)
+        self.assertEqual(dict(buckets)["+Inf"], 4)
+        self.assertIn(("topowiz_stage_seconds_count", labels, 4), samples)
+        self.assertIn(("topowiz_stage_seconds_sum", labels,
+                       0.0005 + 0.003 + 0.003 + 20), samples)
@@ -0,0 +1,91 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import json
+import unittest
+
+from topowiz.model       import GroupRange, expand_ranges, find_group, \
+                                group_index, to_dict
+from topowiz.serialize   import iter_topology
+from topowiz.tests.confs import all_confs, aws_conf, dc_conf
+from topowiz.topo        import build_topology
+
+
+class TestRanges(unittest.TestCase):
+
+    def test_expand_ranges(self):
+        confs = all_confs() + [dc_conf(256, 1), dc_conf(3, 200, "10.0.0.0/16"),
+                               aws_conf(["us-west-2a"])]
+        for conf in confs:
+            for prefixes in [False, True]:
+                topo = build_topology(conf, lazy=True, prefixes=prefixes)
+                doc  = json.loads(b"".join(iter_topology(topo, "ranges")))
+                self.assertEqual(expand_ranges(doc),
+                                 build_topology(conf, prefixes=prefixes))
+
+
+class TestFindGroup(unittest.TestCase):
+
+    def test_group_index(self):
+        for label, name, index in [("rack-%d", "rack-0", 0),
+                                   ("rack-%d", "rack-255", 255),
+                                   ("h%02d", "h07", 7),
+                                   ("h%02d", "h100", 100),
+                                   ("%d-x", "12-x", 12),
+                                   ("100%%-%d", "100%-3", 3)]:
+            self.assertEqual(group_index(label, name), index, name)
+        for label, name in [("rack-%d", "rack-"), ("rack-%d", "rack-01"),
+                            ("rack-%d", "rack--1"), ("rack-%d", "host-1"),
+                            ("h%02d", "h7"), ("%d-x", "12-y"),
+                            ("rack-%d", "rack-\u0661"), ("rack", "rack")]:
+            self.assertIsNone(group_index(label, name), name)
+
+    def test_range_boundaries(self):
+        topo  = build_topology(dc_conf(256, 4), lazy=True, prefixes=True)
+        racks = topo["topologies"][0]["map"]
+        full  = build_topology(dc_conf(256, 4), prefixes=True)
+        full  = full["topologies"][0]["map"]
+        for path, rack, host in [(["rack-0"], 0, None), ([0], 0, None),
+                                 (["rack-255"], 255, None),
+                                 ([255], 255, None),
+                                 (["rack-255", "host-3"], 255, 3),
+                                 ([255, 3], 255, 3), (["rack-0", 0], 0, 0)]:
+            expected = full[rack] if host is None else \
+                full[rack]["groups"][host]
+            self.assertEqual(to_dict(find_group(racks, path)), expected)
+        for path in [["rack-256"], [256], ["rack-0", "host-4"], [0, 4],
+                     ["rack-00"], ["host-0"], []]:
+            self.assertRaises(KeyError, find_group, racks, path)
+
+    def test_offset(self):
+        # A range that doesn't start at 0: Indices count from its start,
+        # names are checked against the range.
+        groups = GroupRange("g-%d", 3, start=10)
+        self.assertEqual(find_group(groups, [0])["name"], "g-10")
+        self.assertEqual(find_group(groups, ["g-12"])["name"], "g-12")
+        for key in ["g-9", "g-13", 3]:
+            self.assertRaises(KeyError, find_group, groups, [key])
+
+    def test_lists(self):
+        # The zones of AWS are a list of groups, each with a range.
+        topo  = build_topology(aws_conf(), lazy=True)
+        zones = topo["topologies"][0]["map"]
+        group = find_group(zones, ["us-west-2b", "us-west-2b-15"])
+        self.assertEqual(group["name"], "us-west-2b-15")
+        self.assertEqual(find_group(zones, [2, 0])["name"], "us-west-2c-00")
+        for path in [["us-west-2d"], [3], ["us-west-2b", "us-west-2b-16"]]:
+            self.assertRaises(KeyError, find_group, zones, path)
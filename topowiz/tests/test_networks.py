@@ -0,0 +1,135 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import unittest
+
+from topowiz.networks import find_network_conflicts, network_cidr_error, \
+                             network_name_error, parse_network_list
+
+
+def _nets(*cidrs, **kwargs):
+    prefix = kwargs.get("prefix", "new")
+    return [{"name" : "%s-%d" % (prefix, i), "cidr" : cidr}
+            for i, cidr in enumerate(cidrs)]
+
+
+class TestNetworks(unittest.TestCase):
+
+    def test_name_error(self):
+        existing = _nets("10.0.0.0/8", prefix="net")
+        self.assertIsNone(network_name_error("net-1", existing))
+        self.assertIsNotNone(network_name_error("net-0", existing))
+        for name in ["", "1net", "-net", "net 0", "n", "n" * 40]:
+            self.assertIsNotNone(network_name_error(name, ()), name)
+
+    def test_cidr_error(self):
+        existing = _nets("10.0.0.0/8", prefix="net")
+        self.assertIsNone(network_cidr_error("11.0.0.0/8", existing))
+        for cidr in ["10.0.0.0/8", "10.1.0.0/16", "8.0.0.0/6", "10.0.0.0",
+                     "10.0.0.0/0", "10.0.0.0/33"]:
+            self.assertIsNotNone(network_cidr_error(cidr, existing), cidr)
+
+    def test_no_conflicts(self):
+        self.assertEqual(find_network_conflicts(
+                            _nets("10.0.0.0/16", "10.1.0.0/16", "11.0.0.0/8"),
+                            _nets("12.0.0.0/8", "10.2.0.0/16",
+                                  prefix="net")),
+                         [])
+
+    def test_duplicates(self):
+        self.assertEqual(find_network_conflicts(
+                            _nets("10.0.0.0/8", "10.0.0.0/8"),
+                            _nets("10.0.0.0/8", prefix="net")),
+                         ["10.0.0.0/8: Duplicate of CIDR '10.0.0.0/8' "
+                          "(existing network)",
+                          "10.0.0.0/8: Duplicate of CIDR '10.0.0.0/8' "
+                          "(existing network)",
+                          "10.0.0.0/8: Duplicate of CIDR '10.0.0.0/8'"])
+
+    def test_overlaps(self):
+        # Every conflict names the new network first, whether it contains
+        # the other network or is contained in it, and is reported against
+        # all enclosing networks.
+        new      = _nets("10.0.0.0/8", "10.1.1.0/24", "10.2.0.0/16",
+                         "192.168.0.0/16")
+        existing = _nets("10.1.0.0/16", "10.2.0.0/16", "10.3.0.0/16",
+                         "10.3.1.0/24", prefix="net")
+        expected = [
+            "10.0.0.0/8: Contains CIDR '10.1.0.0/16' (existing network)",
+            "10.0.0.0/8: Contains CIDR '10.2.0.0/16' (existing network)",
+            "10.0.0.0/8: Contains CIDR '10.3.0.0/16' (existing network)",
+            "10.0.0.0/8: Contains CIDR '10.3.1.0/24' (existing network)",
+            "10.1.1.0/24: Overlaps with CIDR '10.0.0.0/8'",
+            "10.1.1.0/24: Overlaps with CIDR '10.1.0.0/16' "
+            "(existing network)",
+            "10.2.0.0/16: Overlaps with CIDR '10.0.0.0/8'",
+            "10.2.0.0/16: Duplicate of CIDR '10.2.0.0/16' "
+            "(existing network)"
+        ]
+        self.assertEqual(sorted(find_network_conflicts(new, existing)),
+                         sorted(expected))
+
+    def test_existing_conflicts_ignored(self):
+        # The existing networks were checked when they were added.
+        self.assertEqual(find_network_conflicts(
+                            [], _nets("10.0.0.0/8", "10.0.0.0/16",
+                                      prefix="net")),
+                         [])
+
+    def test_names_and_invalid_cidrs(self):
+        new = [{"name" : "net-0", "cidr" : "11.0.0.0/8"},
+               {"name" : "a", "cidr" : "12.0.0.0/8"},
+               {"name" : "new-0", "cidr" : "13.0.0.0/8"},
+               {"name" : "new-0", "cidr" : "14.0.0.0/8"},
+               {"name" : "new-1", "cidr" : "15.0.0.0/33"}]
+        errors = find_network_conflicts(new, _nets("10.0.0.0/8",
+                                                   prefix="net"))
+        self.assertEqual(errors,
+                         ["net-0: This name is already in use.",
+                          "a: Name should be between 1 and 40 chracters.",
+                          "new-0: This name is already in use.",
+                          "15.0.0.0/33: Not a valid CIDR"])
+
+    def test_parse_network_list(self):
+        text = ("# Networks\n"
+                "10.0.0.0/8\n"
+                "\n"
+                "blue 11.0.0.0/8  # a comment\n"
+                "12.0.0.0/8, green\n"
+                "13.0.0.0/8\n"
+                "one two three\n")
+        networks, errors = parse_network_list(text, first_index=2)
+        self.assertEqual(networks, [{"cidr" : "10.0.0.0/8", "name" : "net-2"},
+                                    {"cidr" : "11.0.0.0/8", "name" : "blue"},
+                                    {"cidr" : "12.0.0.0/8", "name" : "green"},
+                                    {"cidr" : "13.0.0.0/8",
+                                     "name" : "net-5"}])
+        self.assertEqual(errors,
+                         ["Line 7: Expected '<name> <cidr>' or '<cidr>'"])
+
+    def test_many_networks(self):
+        # 65536 disjoint networks, and one new network that contains them
+        # all.
+        existing = [{"name" : "net-%d" % i,
+                     "cidr" : "10.%d.%d.0/24" % (i >> 8, i & 0xff)}
+                    for i in range(1 << 16)]
+        self.assertEqual(find_network_conflicts(_nets("11.0.0.0/8"),
+                                                existing),
+                         [])
+        self.assertEqual(len(find_network_conflicts(_nets("10.0.0.0/8"),
+                                                    existing)),
+                         1 << 16)
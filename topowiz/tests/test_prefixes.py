@@ -0,0 +1,95 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import random
+import unittest
+
+from topowiz.prefixes import check_prefix_lens, child_prefixes, \
+                             cidr_range, format_cidr, network_prefixes, \
+                             nth_prefixes, parse_cidr, range_cidrs, \
+                             split_bits
+
+
+class TestPrefixes(unittest.TestCase):
+
+    def test_parse_cidr(self):
+        self.assertEqual(parse_cidr("10.1.2.3/16"), (0x0a010203, 16))
+        self.assertEqual(parse_cidr("0.0.0.0/0"), (0, 0))
+        self.assertEqual(parse_cidr("255.255.255.255/32"), (0xffffffff, 32))
+        for cidr in ["10.1.2/16", "10.1.2.256/16", "10.1.2.3/33",
+                     "10.1.2.-3/16", "10.1.2.3", "a.b.c.d/8", "10.1.2.3/x"]:
+            self.assertRaises(Exception, parse_cidr, cidr)
+
+    def test_cidr_range(self):
+        self.assertEqual(cidr_range("10.0.0.0/8"), (0x0a000000, 0x0affffff))
+        # Host bits are ignored.
+        self.assertEqual(cidr_range("10.1.2.3/24"), (0x0a010200, 0x0a0102ff))
+        self.assertEqual(cidr_range("10.1.2.3/32"), (0x0a010203, 0x0a010203))
+        self.assertEqual(cidr_range("0.0.0.0/0"), (0, 0xffffffff))
+
+    def test_format_cidr(self):
+        self.assertEqual(format_cidr(0x0a010203, 16), "10.1.2.3/16")
+        self.assertEqual(format_cidr(0xffffffff, 32), "255.255.255.255/32")
+        for cidr in ["10.0.0.0/8", "192.168.17.128/25", "1.2.3.4/32"]:
+            self.assertEqual(format_cidr(*parse_cidr(cidr)), cidr)
+
+    def test_split_bits(self):
+        for num_groups, bits in [(0, 0), (1, 0), (2, 1), (3, 2), (4, 2),
+                                 (5, 3), (256, 8), (257, 9)]:
+            self.assertEqual(split_bits(num_groups), bits, num_groups)
+
+    def test_child_prefixes(self):
+        networks = [{"name" : "net-0", "cidr" : "10.0.0.0/8"},
+                    {"name" : "net-1", "cidr" : "172.16.0.0/12",
+                     "block_mask" : 28}]
+        roots = network_prefixes(networks)
+        self.assertEqual(roots, (("net-0", 0x0a000000, 8, 29),
+                                 ("net-1", 0xac100000, 12, 28)))
+
+        children = child_prefixes([r[:3] for r in roots], 5)
+        self.assertEqual([(name, format_cidr(addr, plen))
+                          for name, addr, plen in nth_prefixes(children, 4)],
+                         [("net-0", "10.128.0.0/11"),
+                          ("net-1", "172.24.0.0/15")])
+        # The children of a child continue below its prefix.
+        grand = child_prefixes(nth_prefixes(children, 1), 256)
+        self.assertEqual([format_cidr(addr, plen) for _, addr, plen
+                          in nth_prefixes(grand, 255)],
+                         ["10.63.224.0/19", "172.19.254.0/23"])
+
+    def test_range_cidrs(self):
+        # Both the general case and the one for prefixes of /24 or longer,
+        # against format_cidr().
+        rnd = random.Random(42)
+        for _ in range(500):
+            plen  = rnd.randint(1, 32)
+            step  = 1 << (32 - plen)
+            count = rnd.randint(0, min(600, 1 << plen))
+            start = rnd.randint(0, (1 << plen) - count)
+            addr  = 0 if plen == 32 else rnd.randrange(0, step)
+            self.assertEqual(range_cidrs(addr, plen, start, count),
+                             [format_cidr(addr + i * step, plen)
+                              for i in range(start, start + count)],
+                             (addr, plen, start, count))
+
+    def test_check_prefix_lens(self):
+        networks = [{"name" : "net-0", "cidr" : "10.0.0.0/16"}]
+        # 8 + 5 bits take a /16 to /29, the default block mask.
+        check_prefix_lens(networks, [256, 32])
+        self.assertRaises(Exception, check_prefix_lens, networks, [256, 33])
+        networks[0]["block_mask"] = 32
+        check_prefix_lens(networks, [256, 256])
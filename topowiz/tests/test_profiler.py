@@ -0,0 +1,86 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import os
+import unittest
+
+from unittest import mock
+
+from topowiz.profiler import ProfiledChunks, ProfileStore, on_lambda, \
+                             profiling_allowed
+
+
+def _chunks(count):
+    for i in range(count):
+        yield b"%d" % sum(range(1000))
+
+
+class TestGuard(unittest.TestCase):
+
+    def test_not_on_lambda(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop("AWS_LAMBDA_FUNCTION_NAME", None)
+            self.assertFalse(on_lambda())
+            self.assertTrue(profiling_allowed(True))
+            self.assertFalse(profiling_allowed(False))
+
+    def test_on_lambda(self):
+        with mock.patch.dict(os.environ,
+                             {"AWS_LAMBDA_FUNCTION_NAME" : "topowiz"}):
+            self.assertTrue(on_lambda())
+            self.assertFalse(profiling_allowed(True))
+            self.assertTrue(profiling_allowed(True, allow_lambda=True))
+            self.assertFalse(profiling_allowed(False, allow_lambda=True))
+
+
+class TestProfiledChunks(unittest.TestCase):
+
+    def setUp(self):
+        self.store = ProfileStore()
+
+    def test_iterate(self):
+        profile = self.store.start()
+        chunks  = ProfiledChunks(_chunks(3), self.store, "p", profile)
+        self.assertEqual(len(list(chunks)), 3)
+        # The profile is finished with the last chunk, and covers the
+        # production of the chunks.
+        self.assertIn("_chunks", self.store.summary("p"))
+        self.assertEqual(list(chunks), [])
+        profile = self.store.start()
+        self.assertIsNotNone(profile)
+        self.store.finish("q", profile)
+
+    def test_close(self):
+        # Closed without being iterated, as when the client is gone.
+        profile = self.store.start()
+        inner   = _chunks(3)
+        chunks  = ProfiledChunks(inner, self.store, "p", profile)
+        self.assertIsNone(self.store.start())
+        chunks.close()
+        self.assertIsNotNone(self.store.get("p"))
+        self.assertRaises(StopIteration, next, inner)
+        chunks.close()
+        self.assertEqual(self.store.ids(), ["p"])
+
+    def test_store(self):
+        store = ProfileStore(max_entries=2)
+        for pid in ["a", "b", "a", "c"]:
+            store.finish(pid, store.start())
+        self.assertEqual(store.ids(), ["a", "c"])
+        self.assertIsNone(store.summary("b"))
+        self.assertRaises(ValueError, store.summary, "a", sort="x")
+        self.assertIsInstance(store.pstats_data("a"), bytes)
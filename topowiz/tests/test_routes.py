@@ -0,0 +1,142 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import random
+import unittest
+
+from topowiz.prefixes    import parse_cidr
+from topowiz.routes      import _group_routes, route_tables, summarize
+from topowiz.tests.confs import dc_conf, multi_conf
+from topowiz.topo        import build_topology
+
+
+def _lookup(routes, addr):
+    # The next hop of the longest matching prefix, None without route.
+    best = (-1, None)
+    for prefix, plen, hop in routes:
+        if plen > best[0] and (addr ^ prefix) >> (32 - plen) == 0:
+            best = (plen, hop)
+    return best[1]
+
+
+def _addresses(routes, rnd):
+    # The first and last address of each route, the ones next to them, and
+    # some in between.
+    addrs = set()
+    for addr, plen, _ in routes:
+        last = addr | ((1 << (32 - plen)) - 1)
+        addrs.update([addr, last, max(addr - 1, 0), min(last + 1, 2**32 - 1),
+                      rnd.randint(addr, last)])
+    return sorted(addrs)
+
+
+def _parse_routes(routes):
+    return [parse_cidr(r["prefix"]) + (r["via"],) for r in routes]
+
+
+class TestSummarize(unittest.TestCase):
+
+    def assertSameForwarding(self, full, dont_care=()):
+        summarized = summarize(full, dont_care)
+        self.assertLessEqual(len(summarized), len(full))
+        rnd = random.Random(42)
+        for addr in _addresses(full + summarized, rnd):
+            if any(_lookup([(a, p, True)], addr) for a, p in dont_care) and \
+                    _lookup(full, addr) is None:
+                continue
+            self.assertEqual(_lookup(summarized, addr), _lookup(full, addr),
+                             addr)
+        return summarized
+
+    def test_unassigned(self):
+        # Three racks, the last quarter of the network has no route.
+        topo   = build_topology(dc_conf(3, 4, "10.0.0.0/16"), lazy=True,
+                                prefixes=True)
+        racks  = _group_routes(topo["topologies"][0]["map"])
+        routes = self.assertSameForwarding(racks)
+        self.assertEqual(len(routes), 3)
+        self.assertNotIn(None, [hop for _, _, hop in routes])
+        self.assertIsNone(_lookup(routes, 0x0a00c000))
+
+        # A summary route may cover the unassigned quarter.
+        network = [parse_cidr("10.0.0.0/16")]
+        routes  = self.assertSameForwarding(racks, network)
+        self.assertIsNotNone(_lookup(routes, 0x0a00c000))
+
+    def test_discard(self):
+        # The hole in the middle of the summary needs a discard route.
+        full = [(0x0a000000, 26, "a"), (0x0a000040, 26, "a"),
+                (0x0a0000c0, 26, "a")]
+        self.assertEqual(self.assertSameForwarding(full),
+                         [(0x0a000000, 24, "a"), (0x0a000080, 26, None)])
+
+    def test_random(self):
+        # Nested and adjacent prefixes within 10.0.0.0/16.
+        rnd = random.Random(7)
+        for _ in range(200):
+            full = {}
+            for _ in range(rnd.randint(1, 40)):
+                plen = rnd.randint(18, 26)
+                addr = 0x0a000000 | rnd.randrange(0, 1 << 16)
+                full[(addr >> (32 - plen) << (32 - plen), plen)] = \
+                    rnd.choice("abc")
+            full = sorted(key + (hop,) for key, hop in full.items())
+            self.assertSameForwarding(full)
+            self.assertSameForwarding(full, [parse_cidr("10.0.0.0/16")])
+
+
+class TestRouteTables(unittest.TestCase):
+
+    def test_same_forwarding(self):
+        # The summarized tables forward like the full ones, for each switch.
+        rnd = random.Random(42)
+        for num_racks in [1, 3, 4, 5, 12]:
+            conf  = dc_conf(num_racks, 5, "10.0.0.0/16")
+            doc   = route_tables(conf)
+            topo  = build_topology(conf, lazy=True, prefixes=True)
+            racks = topo["topologies"][0]["map"]
+            full  = _group_routes(racks)
+            spine = _parse_routes(doc["spine"])
+            for addr in _addresses(full + spine, rnd):
+                self.assertEqual(_lookup(spine, addr), _lookup(full, addr))
+            for rack, table in zip(racks, doc["racks"]):
+                full   = _group_routes(rack["groups"])
+                routes = _parse_routes(table["routes"])
+                for addr in _addresses(full + routes, rnd):
+                    self.assertEqual(_lookup(routes, addr),
+                                     _lookup(full, addr))
+
+    def test_dont_care(self):
+        # No summary route covers the unassigned last quarter of the
+        # network, unless it is don't care.
+        conf  = dc_conf(3, 4, "10.0.0.0/16")
+        spine = _parse_routes(route_tables(conf)["spine"])
+        self.assertEqual(len(spine), 3)
+        self.assertIsNone(_lookup(spine, 0x0a00c000))
+        doc   = route_tables(conf, dont_care=True)
+        spine = _parse_routes(doc["spine"])
+        self.assertEqual(len(spine), 3)
+        self.assertIsNotNone(_lookup(spine, 0x0a00c000))
+        self.assertEqual(doc["stats"]["routes"], 3 + 3 * 4)
+
+    def test_topologies(self):
+        doc = route_tables(multi_conf())
+        self.assertIsNone(doc["topologies"][0])
+        self.assertEqual(len(doc["topologies"][1]["racks"]), 4)
+        conf = dc_conf()
+        conf["datacenter"].update(flat_network=True, num_hosts=4)
+        self.assertRaises(Exception, route_tables, conf)
@@ -0,0 +1,93 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import json
+import tracemalloc
+import unittest
+
+from topowiz.serialize   import encode, iter_json, iter_topology
+from topowiz.tests.confs import all_confs, dc_conf
+from topowiz.topo        import build_topology
+
+
+# A data center with ranges of more than MEMO_MAX_GROUPS groups, and one
+# config of each kind.
+CONFS = [dc_conf(300, 20)] + all_confs()
+
+# The arguments of json.dumps() for each format, which is what the topologies
+# used to be serialized with.
+DUMPS_ARGS = {
+    "pretty" : {"indent" : 4},
+    "min"    : {"separators" : (",", ":")}
+}
+
+
+def _streaming_peak(conf, prefixes):
+    """
+    Return the size of the streamed topology and the memory peak while
+    streaming it.
+
+    """
+    topo = build_topology(conf, lazy=True, prefixes=prefixes)
+    tracemalloc.start()
+    try:
+        size = sum(len(chunk) for chunk in iter_json(topo))
+        return size, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class TestSerialize(unittest.TestCase):
+
+    def test_same_as_json_dumps(self):
+        for conf in CONFS:
+            for prefixes in (False, True):
+                expected = build_topology(conf, prefixes=prefixes)
+                for fmt, kwargs in DUMPS_ARGS.items():
+                    topo = build_topology(conf, lazy=True, prefixes=prefixes)
+                    self.assertEqual(b"".join(iter_topology(topo, fmt)),
+                                     json.dumps(expected,
+                                                **kwargs).encode("utf-8"),
+                                     (conf, prefixes, fmt))
+
+    def test_chunks(self):
+        topo   = build_topology(dc_conf(64, 64), lazy=True)
+        chunks = list(iter_json(topo, chunk_size=1024))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(c) >= 1024 for c in chunks[:-1]))
+        self.assertEqual(b"".join(chunks),
+                         b"".join(iter_json(topo, chunk_size=1 << 30)))
+
+    def test_plain_values(self):
+        for obj in [{}, [], {"a" : []}, [{}], None, True, 1.5, "x",
+                    {"s" : "\u00e4\"\\\n", "n" : [1, None, False]},
+                    [[1, [2, []]], {"b" : {"c" : {}}}]]:
+            for indent, kwargs in [(4, DUMPS_ARGS["pretty"]),
+                                   (None, DUMPS_ARGS["min"])]:
+                expected = json.dumps(obj, **kwargs)
+                self.assertEqual(b"".join(iter_json(obj, indent)),
+                                 expected.encode("utf-8"))
+                self.assertEqual(encode(obj, indent), expected)
+
+    def test_streaming_memory(self):
+        # The memory needed for streaming must not grow with the size of the
+        # topology, with or without prefixes.
+        conf = dc_conf(32, 1024)
+        for prefixes in (False, True):
+            size, peak = _streaming_peak(conf, prefixes)
+            self.assertGreater(size, 4 * 1024 * 1024)
+            self.assertLess(peak, 2 * 1024 * 1024, prefixes)
@@ -0,0 +1,133 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from topowiz.codec       import encode_conf
+from topowiz.store       import ID_LENGTHS, ID_MARKER, is_conf_id, open_store
+from topowiz.tests.confs import dc_conf
+
+
+class _StoreTests(object):
+    # The tests for each backend, see the classes below.
+
+    backend = None
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path      = os.path.join(self.directory, "store")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def open(self, **kwargs):
+        return open_store(self.backend, self.path, **kwargs)
+
+    def test_ids(self):
+        store   = self.open()
+        conf_id = store.put_conf(dc_conf(4))
+        self.assertTrue(is_conf_id(conf_id))
+        self.assertEqual(len(conf_id), len(ID_MARKER) + ID_LENGTHS[0])
+        self.assertFalse(is_conf_id(encode_conf(dc_conf(4))))
+        # The same config always gets the same ID, in any store.
+        self.assertEqual(store.put_conf(dc_conf(4)), conf_id)
+        self.assertEqual(open_store("files" if self.backend == "sqlite"
+                                    else "sqlite",
+                                    self.path + "-other").put_conf(dc_conf(4)),
+                         conf_id)
+        self.assertNotEqual(store.put_conf(dc_conf(5)), conf_id)
+
+    def test_key_order(self):
+        # The order of the keys is shown to the user, so configs that only
+        # differ by it get IDs of their own.
+        store = self.open()
+        conf  = dc_conf(4)
+        other = dict(reversed(list(conf.items())))
+        self.assertNotEqual(store.put_conf(conf), store.put_conf(other))
+        self.assertEqual(list(store.get_conf(store.put_conf(other))),
+                         list(other))
+
+    def test_get(self):
+        conf_id = self.open().put_conf(dc_conf(4))
+        # From the backend, and then from the cache of the store.
+        store = self.open()
+        for _ in range(2):
+            conf = store.get_conf(conf_id)
+            self.assertEqual(conf, dc_conf(4))
+            # Each caller gets a config of its own.
+            conf["networks"].append({"cidr" : "11.0.0.0/8"})
+
+    def test_unknown_ids(self):
+        store = self.open()
+        store.put_conf(dc_conf(4))
+        for conf_id in [ID_MARKER + "A" * ID_LENGTHS[0], ID_MARKER,
+                        ID_MARKER + "../store", "AAAA"]:
+            self.assertIsNone(store.get_conf(conf_id), conf_id)
+
+    def test_collision(self):
+        # Another config stored under the short ID of this one: The config
+        # gets the next longer ID.
+        store    = self.open()
+        conf_id  = store.put_conf(dc_conf(4))
+        store.backend.put("configs", conf_id[1:],
+                          json.dumps(dc_conf(5)).encode("utf-8"))
+        store    = self.open()
+        long_id  = store.put_conf(dc_conf(4))
+        self.assertEqual(len(long_id), len(ID_MARKER) + ID_LENGTHS[1])
+        self.assertTrue(long_id.startswith(conf_id))
+        self.assertEqual(store.get_conf(long_id), dc_conf(4))
+        self.assertEqual(store.get_conf(conf_id), dc_conf(5))
+
+    def test_topologies(self):
+        store = self.open()
+        self.assertIsNone(store.get_topology("abc+prefixes"))
+        store.put_topology("abc+prefixes", b"{}")
+        self.assertEqual(self.open().get_topology("abc+prefixes"), b"{}")
+        for key in ["../abc", "a/b", ".abc", ""]:
+            self.assertRaises(ValueError, store.put_topology, key, b"{}")
+
+    def test_max_bytes(self):
+        store = self.open(max_entries=0, max_bytes=64 * 1024)
+        data  = b" " * 1024
+        for i in range(1000):
+            store.put_topology("t%d" % i, data)
+        kept = [i for i in range(1000) if store.get_topology("t%d" % i)]
+        # The least recently used ones are removed, down to the limit, which
+        # is exceeded by at most the amount written between two checks.
+        self.assertIn(999, kept)
+        self.assertLessEqual(len(kept), 64 + 64 // 64 + 1)
+
+
+class TestSqliteStore(_StoreTests, unittest.TestCase):
+    backend = "sqlite"
+
+
+class TestFileStore(_StoreTests, unittest.TestCase):
+    backend = "files"
+
+
+class TestOpenStore(unittest.TestCase):
+
+    def test_no_backend(self):
+        self.assertIsNone(open_store(None, "path"))
+
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, open_store, "redis", "path")
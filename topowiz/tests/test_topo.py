@@ -0,0 +1,92 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import unittest
+
+from topowiz.tests.confs import aws_conf, dc_conf, multi_conf
+from topowiz.topo        import ROUTE_LIMIT, allocate_groups, \
+                                build_topology, calculate_num_groups, \
+                                group_levels, topology_confs, zone_groups
+
+
+class TestAllocateGroups(unittest.TestCase):
+
+    def test_equal(self):
+        # Without weights, the whole route budget is used and split evenly.
+        self.assertEqual(allocate_groups(2, 2), [12, 12])
+        self.assertEqual(allocate_groups(3, 1), [16, 16, 16])
+        self.assertEqual(allocate_groups(2, 1), [24, 24])
+        self.assertEqual(sorted(allocate_groups(5, 1)), [9, 9, 10, 10, 10])
+        self.assertEqual(allocate_groups(2, 2),
+                         allocate_groups(2, 2, weights=[1, 1]))
+
+    def test_weights(self):
+        self.assertEqual(allocate_groups(2, 1, weights=[3, 1]), [32, 16])
+        self.assertEqual(allocate_groups(2, 2, weights=[3, 1]), [18, 6])
+        for weights in [[1, 2, 3], [5, 1, 1], [1, 1, 100]]:
+            counts = allocate_groups(3, 2, weights=weights)
+            self.assertEqual(sum(counts), ROUTE_LIMIT // 2)
+            self.assertTrue(all(1 <= c <= 32 for c in counts), counts)
+
+    def test_limits(self):
+        self.assertEqual(allocate_groups(2, 1, max_groups=4), [4, 4])
+        self.assertEqual(allocate_groups(2, 3, route_limit=10), [2, 1])
+        self.assertEqual(allocate_groups(4, 12), [1, 1, 1, 1])
+        self.assertRaises(Exception, allocate_groups, 4, 13)
+
+    def test_conf(self):
+        conf = aws_conf()
+        self.assertEqual(zone_groups(conf), [16, 16, 16])
+        self.assertEqual(calculate_num_groups(conf, num_networks=5),
+                         ROUTE_LIMIT // 5 // 3)
+        self.assertEqual(group_levels(conf), [3, 16])
+        conf["aws"]["zone_weights"] = {"us-west-2b" : 2}
+        self.assertEqual(zone_groups(conf), [12, 24, 12])
+        self.assertEqual(calculate_num_groups(conf), 12)
+        self.assertEqual(group_levels(conf), [3, 24])
+
+
+class TestTopologies(unittest.TestCase):
+
+    def test_single(self):
+        conf = dc_conf()
+        self.assertEqual(topology_confs(conf), [conf])
+
+    def test_topology_confs(self):
+        conf  = multi_conf()
+        confs = topology_confs(conf)
+        self.assertEqual(confs, [
+            {"aws"      : conf["topologies"][0]["aws"],
+             "networks" : conf["networks"][:1]},
+            {"datacenter" : conf["topologies"][1]["datacenter"],
+             "networks"   : conf["networks"][1:]}])
+        # The networks are shared, not copied.
+        self.assertIs(confs[1]["networks"][0], conf["networks"][1])
+        self.assertNotIn("topologies", confs[0])
+
+    def test_build(self):
+        # Each topology is built like a config of its own, and all networks
+        # are listed.
+        conf = multi_conf()
+        for prefixes in [False, True]:
+            topo = build_topology(conf, prefixes=prefixes)
+            self.assertEqual([n["name"] for n in topo["networks"]],
+                             ["net-0", "net-1"])
+            self.assertEqual(topo["topologies"],
+                             [build_topology(c, prefixes=prefixes)
+                              ["topologies"][0]
+                              for c in topology_confs(conf)])
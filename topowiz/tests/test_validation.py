@@ -0,0 +1,124 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import unittest
+
+from topowiz.tests.confs import all_confs, aws_conf, dc_conf, flat_conf, \
+                                multi_conf
+from topowiz.validation  import MAX_NUM_RACKS, conf_errors
+
+
+class TestConfErrors(unittest.TestCase):
+
+    def assertErrors(self, conf, expected):
+        self.assertEqual(conf_errors(conf), expected)
+
+    def test_valid(self):
+        for conf in all_confs():
+            self.assertErrors(conf, [])
+
+    def test_malformed(self):
+        self.assertErrors([], ["The config should be an object"])
+        self.assertErrors({"networks" : []},
+                          ["The config should have one of 'aws', "
+                           "'datacenter' or 'topologies'"])
+        conf = dict(dc_conf(), aws=aws_conf()["aws"])
+        self.assertErrors(conf, ["The config should have one of 'aws', "
+                                 "'datacenter' or 'topologies'"])
+
+    def test_networks(self):
+        conf = dc_conf()
+        conf["networks"] = []
+        self.assertErrors(conf, ["networks: Should be a non-empty list of "
+                                 "networks"])
+        conf["networks"] = [{"cidr" : "10.0.0.0/8"}]
+        self.assertErrors(conf, ["networks[0]: Should be an object with "
+                                 "'cidr' and 'name'"])
+        conf = flat_conf()
+        conf["networks"][1]["block_mask"] = 8
+        self.assertErrors(conf, ["networks[1].block_mask: Should be between "
+                                 "16 and 32"])
+        conf["networks"][1] = {"cidr" : "10.1.0.0/16", "name" : "net-0"}
+        self.assertErrors(conf,
+                          ["networks: net-0: This name is already in use.",
+                           "networks: 10.1.0.0/16: Overlaps with CIDR "
+                           "'10.0.0.0/8'"])
+
+    def test_datacenter(self):
+        conf = dc_conf(num_racks=MAX_NUM_RACKS + 1)
+        self.assertErrors(conf, ["datacenter.num_racks: Should be an "
+                                 "integer between 1 and 256"])
+        conf["datacenter"]["num_racks"] = True
+        self.assertErrors(conf, ["datacenter.num_racks: Should be an "
+                                 "integer between 1 and 256"])
+        conf["datacenter"]["flat_network"] = "no"
+        self.assertErrors(conf, ["datacenter.flat_network: Should be true "
+                                 "or false"])
+
+    def test_aws(self):
+        conf = aws_conf(["us-west-2a", "us-west-2a", "us-east-1a"])
+        self.assertErrors(conf, ["aws.zones: Unknown zone 'us-east-1a' for "
+                                 "region 'us-west-2'",
+                                 "aws.zones: Zones should be unique"])
+        conf = aws_conf()
+        conf["aws"]["zone_weights"] = {"us-west-2a" : 0}
+        self.assertErrors(conf, ["aws.zone_weights: Should be an object with "
+                                 "a positive weight for some or all zones"])
+
+    def test_route_limit(self):
+        conf = aws_conf()
+        conf["networks"] = [{"cidr" : "10.%d.0.0/16" % i, "name" : "n%d" % i}
+                            for i in range(60)]
+        self.assertErrors(conf, ["Too many networks and/or zones, reaching "
+                                 "the 48 route limit for AWS."])
+
+    def test_topologies(self):
+        conf = multi_conf()
+        conf["topologies"] = []
+        self.assertErrors(conf, ["topologies: Should be a non-empty list of "
+                                 "topologies"])
+        conf = multi_conf()
+        conf["topologies"][0]["datacenter"] = dc_conf()["datacenter"]
+        self.assertErrors(conf, ["topologies[0]: Should have either 'aws' or "
+                                 "'datacenter'"])
+        for indices in [[], [2], [-1], [True], "0"]:
+            conf = multi_conf()
+            conf["topologies"][1]["networks"] = indices
+            self.assertErrors(conf, ["topologies[1].networks: Should be a "
+                                     "non-empty list of indices of networks"])
+        for indices in [[0], [1, 1]]:
+            conf = multi_conf()
+            conf["topologies"][1]["networks"] = indices
+            self.assertErrors(conf, ["topologies[1].networks: Each network "
+                                     "can only be used once"])
+
+    def test_topology_sections(self):
+        # The errors of each section name its topology.
+        conf = multi_conf()
+        conf["topologies"][0]["aws"]["zones"] = ["us-west-2a"]
+        conf["topologies"][1]["datacenter"]["num_racks"] = 0
+        self.assertErrors(conf, ["topologies[0].aws.zones: Unknown zone "
+                                 "'us-west-2a' for region 'us-east-1'",
+                                 "topologies[1].datacenter.num_racks: Should "
+                                 "be an integer between 1 and 256"])
+        conf = multi_conf()
+        conf["networks"] += [{"cidr" : "10.%d.0.0/16" % i, "name" : "n%d" % i}
+                             for i in range(3, 30)]
+        conf["topologies"][0]["networks"] += list(range(2, 29))
+        self.assertErrors(conf, ["topologies[0]: Too many networks and/or "
+                                 "zones, reaching the 48 route limit for "
+                                 "AWS."])
@@ -20,37 +20,117 @@ limitations under the License.
 # user configuration.
 #
 
+import heapq
+
 from copy import copy
 
+from . import model
+from .model import Group, GroupRange
+from .prefixes import check_prefix_lens, child_prefixes, network_prefixes, \
+                      nth_prefixes
+
+
+# Each prefix group needs a route in the VPC route table, which in AWS holds
+# at most 50 routes. By default, we leave a few of them for other uses.
+ROUTE_LIMIT         = 48
+MAX_GROUPS_PER_ZONE = 32
+
+
+def allocate_groups(num_zones, num_networks, route_limit=ROUTE_LIMIT,
+                    weights=None, max_groups=MAX_GROUPS_PER_ZONE):
+    """
+    Distribute the route budget over the zones: Returns the number of prefix
+    groups for each zone, such that the number of routes (one per group and
+    network) stays within the route limit and as many routes as possible are
+    used, with at most 'max_groups' groups per zone.
+
+    The groups are distributed in proportion to the optional weights of the
+    zones (for example their expected number of nodes), using the highest
+    averages method, so that the zones with more nodes get the finer
+    aggregation. Without weights, all zones weigh the same, so that their
+    numbers of groups differ by at most one.
+
+    """
+    total = min(route_limit // max(num_networks, 1), max_groups * num_zones)
+    if total < num_zones:
+        raise Exception("Too many networks and/or zones, reaching the "
+                        "%d route limit for AWS." % route_limit)
+    if weights is None:
+        weights = [1] * num_zones
+
+    counts = [1] * num_zones
+    heap   = [(-w / 2.0, i) for i, w in enumerate(weights)]
+    heapq.heapify(heap)
+    for _ in range(total - num_zones):
+        while True:
+            _, i = heapq.heappop(heap)
+            if counts[i] < max_groups:
+                break
+        counts[i] += 1
+        heapq.heappush(heap, (-weights[i] / (counts[i] + 1.0), i))
+    return counts
+
+
+def zone_groups(conf, num_networks=None):
+    """
+    Return the number of prefix groups for each AWS zone of the config. The
+    route limit and the weights of the zones can be set in the config, as
+    'route_limit' and 'zone_weights' (a dictionary of zone to weight).
+
+    """
+    aws      = conf['aws']
+    num_nets = len(conf['networks']) if num_networks is None else \
+                                     num_networks
+    weights  = aws.get('zone_weights')
+    if weights is not None:
+        weights = [weights.get(zone, 1) for zone in aws['zones']]
+    return allocate_groups(len(aws['zones']), num_nets,
+                           aws.get('route_limit', ROUTE_LIMIT), weights)
+
 
 def calculate_num_groups(conf, num_networks=None):
     """
-    Calculates how many prefix groups we can have per AWS zone. Takes into
-    account that we need a route for each prefix group and we can't have more
-    than 48 route total.
+    Calculates how many prefix groups we can have per AWS zone, which is the
+    smallest number of groups of any zone (see zone_groups()).
+
+    Raises an exception if the route limit doesn't allow a single group for
+    each zone and network.
 
     """
-    num_zones  = len(conf['aws']['zones'])
-    num_nets   = len(conf['networks']) if num_networks is None else \
-                                       num_networks
-    num_groups = 32
+    return min(zone_groups(conf, num_networks))
 
-    while num_groups * num_zones * num_nets > 48:
-        if num_groups == 1:
-            raise Exception("Too many networks and/or zones, reaching "
-                            "50 route limit for AWS.")
-        num_groups //= 2
-    return num_groups
+
+def group_levels(conf):
+    """
+    Return the number of groups at each level of the topology (of a config
+    with a single topology, see topology_confs()), for example
+    [num_racks, num_hosts_per_rack] for a routed data center with a prefix
+    group per host. For AWS zones with different numbers of groups, the
+    largest number is given, which determines the length of the prefixes.
+
+    """
+    if conf.get('aws'):
+        num_zones = len(conf['aws']['zones'])
+        if num_zones == 1:
+            return [1]
+        return [num_zones, max(zone_groups(conf))]
+
+    cd = conf['datacenter']
+    if cd['flat_network']:
+        return [cd['num_hosts'] if cd['prefix_per_host'] else 1]
+    if cd['prefix_per_host']:
+        return [cd['num_racks'], cd['num_hosts_per_rack']]
+    return [cd['num_racks']]
 
 
-def _build_aws_topology(conf):
+def _build_aws_topology(conf, prefixes=None):
     """
     Build a topology for am AWS VPC deployment.
 
     """
     # - If just one zone, we need one group, since it's a flat network.
-    # - If it's more than one zone, we want many groups per zone, but
-    #   the total number of groups should not exceed 50 or even 40.
+    # - If it's more than one zone, we want many groups per zone, as many
+    #   as the route limit allows (see allocate_groups()).
     # - We only have one topology if in VPC.
     t = {
         "networks" : [n['name'] for n in conf['networks']],
@@ -60,76 +140,133 @@ def _build_aws_topology(conf):
     num_zones = len(conf['aws']['zones'])
 
     if num_zones == 1:
-        t["map"].append({
-            "name"   : conf['aws']['zones'][0],
-            "groups" : []
-        })
+        t["map"].append(Group(conf['aws']['zones'][0], prefixes=prefixes))
     else:
-        num_groups = calculate_num_groups(conf)
-
-        for zone in conf['aws']['zones']:
-            m = {
-                "name" : zone,
-                "assignment" : {"failure-domain" : zone},
-                "groups" : []
-            }
-            for i in range(num_groups):
-                m["groups"].append({
-                    "name" : "%s-%02d" % (zone, i),
-                    "groups" : []
-                })
-            t["map"].append(m)
+        num_groups = zone_groups(conf)
+        if prefixes is not None:
+            prefixes = child_prefixes(prefixes, num_zones)
+
+        for i, zone in enumerate(conf['aws']['zones']):
+            groups = GroupRange("%s-%%02d" % zone, num_groups[i])
+            zone_prefixes = None
+            if prefixes is not None:
+                zone_prefixes = nth_prefixes(prefixes, i)
+                groups        = groups.with_prefixes(zone_prefixes)
+            t["map"].append(Group(zone, {"failure-domain" : zone}, groups,
+                                  prefixes=zone_prefixes))
     return t
 
 
-def _build_dc_topology(conf):
+def _build_dc_topology(conf, prefixes=None):
     """
     Build a topology for a routed data center network.
 
     """
-    t = {
-        "networks" : [n['name'] for n in conf['networks']],
-    }
-
-    top_level_group_label = None
     cd = conf['datacenter']
     if cd['flat_network']:
         if cd['prefix_per_host']:
-            num_groups = cd['num_hosts']
-            top_level_group_label = "host-%d"
+            m = GroupRange("host-%d", cd['num_hosts'], groups_first=True)
         else:
-            num_groups = 1
+            m = [Group(groups_first=True, prefixes=prefixes)]
     else:
-        num_groups = cd['num_racks']
-        top_level_group_label = "rack-%d"
-
-    m = []
-    for i in range(num_groups):
-        g = {"groups" : []}
-        if top_level_group_label:
-            g["name"] = top_level_group_label % i
-        if not cd['flat_network']:
-            g["assignment"] = {"rack" : g["name"]}
-        m.append(g)
-
-    if not cd['flat_network']:
+        hosts = ()
         if cd['prefix_per_host']:
-            for top_level_group in m:
-                for i in range(cd['num_hosts_per_rack']):
-                    g = {
-                        "name" : "host-%d" % i,
-                        "groups" : []
-                    }
-                    top_level_group["groups"].append(g)
-    t["map"]  = m
+            hosts = GroupRange("host-%d", cd['num_hosts_per_rack'])
+        m = GroupRange("rack-%d", cd['num_racks'], assignment_key="rack",
+                       children=hosts, groups_first=True)
+
+    if prefixes is not None and isinstance(m, GroupRange):
+        m = m.with_prefixes(prefixes)
+
+    t = {
+        "networks" : [n['name'] for n in conf['networks']],
+        "map"      : m
+    }
 
     return t
 
 
-def build_topology(conf):
+def topology_confs(conf):
+    """
+    Return a config with a single 'aws' or 'datacenter' section and its list
+    of networks for each topology of the user config.
+
+    Instead of 'aws' or 'datacenter', a user config may have a list of
+    'topologies', each with an 'aws' or 'datacenter' section and the indices
+    of its networks in the 'networks' list of the config:
+
+        {
+            "networks"   : [...],
+            "topologies" : [
+                {"aws" : {...}, "networks" : [0]},
+                {"datacenter" : {...}, "networks" : [1, 2]}
+            ]
+        }
+
+    The networks are shared with the user config, not copied.
+
+    """
+    if 'topologies' not in conf:
+        return [conf]
+    networks = conf['networks']
+    return [dict(spec, networks=[networks[i] for i in spec['networks']])
+            for spec in conf['topologies']]
+
+
+def is_routed(conf):
+    """
+    Return True if the config (with a single topology, see
+    topo.topology_confs()) is for a routed data center.
+
+    """
+    cd = conf.get('datacenter')
+    return bool(cd) and not cd['flat_network']
+
+
+def count_groups(conf):
+    """
+    Return the total number of prefix groups in the topology for the given
+    config. The topology is built lazily for this, which creates its
+    GroupRanges, but none of the groups in them.
+
+    """
+    topo = build_topology(conf, lazy=True)
+    return sum(model.count_groups(t["map"]) for t in topo["topologies"])
+
+
+def _build_one(conf, prefixes, lazy):
+    """
+    Build the topology for a config with a single 'aws' or 'datacenter'
+    section (see topology_confs()).
+
+    """
+    root_prefixes = None
+    if prefixes:
+        root_prefixes = tuple((name, addr, plen) for name, addr, plen, _ in
+                              network_prefixes(conf['networks']))
+
+    if conf.get('aws'):
+        t = _build_aws_topology(conf, root_prefixes)
+    else:
+        t = _build_dc_topology(conf, root_prefixes)
+    return t if lazy else model.to_dict(t)
+
+
+def build_topology(conf, lazy=False, prefixes=False):
     """
     From the user provided configuration, calculate the full topology config.
 
+    If 'lazy' is set, the groups in the topology are represented by the
+    objects of the lazy topology model (see model.py), which only create
+    groups as the topology is walked, for example by serialize.iter_json().
+
+    If 'prefixes' is set, each group gets a 'prefixes' dict with the CIDR it
+    is assigned in each network (see prefixes.py). An exception is raised if
+    a network is too small for the number of groups.
+
+    For configs with several topologies (see topology_confs()), the
+    topologies are built one after the other, in the order of the config.
+
     """
     topo = {"networks": [], "topologies" : []}
     for n in conf['networks']:
@@ -139,10 +276,10 @@ def build_topology(conf):
             net["block_mask"] = 29
         topo["networks"].append(net)
 
-    if conf.get('aws'):
-        t = _build_aws_topology(conf)
-    else:
-        t = _build_dc_topology(conf)
+    confs = topology_confs(conf)
+    if prefixes:
+        for c in confs:
+            check_prefix_lens(c['networks'], group_levels(c))
 
-    topo["topologies"].append(t)
+    topo["topologies"] = [_build_one(c, prefixes, lazy) for c in confs]
     return topo
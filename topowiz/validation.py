@@ -0,0 +1,223 @@
+"""
+Copyright 2017 Pani Networks Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+#
+# Validation of a complete user config in a single pass, as needed when a
+# config is provided directly (for example through the API), rather than
+# being assembled step by step by the wizard. The rules are the same as those
+# of the wizard's forms.
+#
+
+from .networks import find_network_conflicts
+from .topo     import calculate_num_groups, topology_confs
+
+
+AWS_REGIONS = [
+    "us-east-1",
+    "us-west-1",
+    "us-west-2",
+    "eu-west-1",
+    "eu-central-1",
+    "ap-southeast-1",
+    "ap-southeast-2",
+    "ap-northeast-1",
+    "sa-east-1"
+]
+
+
+AWS_ZONES = {
+    "us-east-1"      : ["us-east-1a", "us-east-1b", "us-east-1c",
+                        "us-east-1d", "us-east-1e"],
+    "us-west-1"      : ["us-west-1a", "us-west-1b"],
+    "us-west-2"      : ["us-west-2a", "us-west-2b", "us-west-2c"],
+    "eu-west-1"      : ["eu-west-1a", "eu-west-1b", "eu-west-1c"],
+    "eu-central-1"   : ["eu-central-1a", "eu-central-1b"],
+    "ap-southeast-1" : ["ap-southeast-1a", "ap-southeast-1b"],
+    "ap-southeast-2" : ["ap-southeast-2a", "ap-southeast-2b",
+                        "ap-southeast-2c"],
+    "ap-northeast-1" : ["ap-northeast-1a", "ap-northeast-1c"],
+    "sa-east-1"      : ["sa-east-1a", "sa-east-1b", "sa-east-1c"]
+}
+
+
+# Limits, as enforced by the forms of the wizard
+MAX_NUM_HOSTS          = 2048
+MAX_NUM_RACKS          = 256
+MAX_NUM_HOSTS_PER_RACK = 1024
+MIN_BLOCK_MASK         = 16
+MAX_BLOCK_MASK         = 32
+
+# Largest route table in AWS, with a raised quota
+MAX_ROUTE_LIMIT        = 1000
+
+
+def _int_error(cd, key, max_value):
+    value = cd.get(key)
+    if not isinstance(value, int) or isinstance(value, bool) or \
+            not 1 <= value <= max_value:
+        return "datacenter.%s: Should be an integer between 1 and %d" % \
+               (key, max_value)
+    return None
+
+
+def _valid_weight(weight):
+    return isinstance(weight, (int, float)) and \
+        not isinstance(weight, bool) and weight > 0
+
+
+def _aws_errors(conf):
+    aws = conf['aws']
+    if not isinstance(aws, dict):
+        return ["aws: Should be an object"]
+    region = aws.get('region')
+    if region not in AWS_ZONES:
+        return ["aws.region: Should be one of %s" % ", ".join(AWS_REGIONS)]
+    zones = aws.get('zones')
+    if not isinstance(zones, list) or not zones:
+        return ["aws.zones: Should be a non-empty list of zones"]
+    errors = ["aws.zones: Unknown zone '%s' for region '%s'" % (z, region)
+              for z in zones if z not in AWS_ZONES[region]]
+    if len(set(zones)) != len(zones):
+        errors.append("aws.zones: Zones should be unique")
+
+    route_limit = aws.get('route_limit', 1)
+    if not isinstance(route_limit, int) or isinstance(route_limit, bool) or \
+            not 1 <= route_limit <= MAX_ROUTE_LIMIT:
+        errors.append("aws.route_limit: Should be an integer between 1 and "
+                      "%d" % MAX_ROUTE_LIMIT)
+    weights = aws.get('zone_weights', {})
+    if not isinstance(weights, dict) or \
+            any(z not in zones for z in weights) or \
+            not all(map(_valid_weight, weights.values())):
+        errors.append("aws.zone_weights: Should be an object with a "
+                      "positive weight for some or all zones")
+    return errors
+
+
+def _dc_errors(conf):
+    cd = conf['datacenter']
+    if not isinstance(cd, dict):
+        return ["datacenter: Should be an object"]
+    errors = ["datacenter.%s: Should be true or false" % key
+              for key in ("prefix_per_host", "flat_network")
+              if not isinstance(cd.get(key), bool)]
+    if errors:
+        return errors
+    if cd['flat_network']:
+        if cd['prefix_per_host']:
+            errors.append(_int_error(cd, "num_hosts", MAX_NUM_HOSTS))
+    else:
+        errors.append(_int_error(cd, "num_racks", MAX_NUM_RACKS))
+        if cd['prefix_per_host']:
+            errors.append(_int_error(cd, "num_hosts_per_rack",
+                                     MAX_NUM_HOSTS_PER_RACK))
+    return [e for e in errors if e]
+
+
+def _valid_block_mask(block_mask):
+    return isinstance(block_mask, int) and \
+        MIN_BLOCK_MASK <= block_mask <= MAX_BLOCK_MASK
+
+
+def _networks_errors(conf):
+    networks = conf.get('networks')
+    if not isinstance(networks, list) or not networks:
+        return ["networks: Should be a non-empty list of networks"]
+    errors = []
+    for i, n in enumerate(networks):
+        if not isinstance(n, dict) or \
+                not isinstance(n.get('cidr'), str) or \
+                not isinstance(n.get('name'), str):
+            errors.append("networks[%d]: Should be an object with 'cidr' "
+                          "and 'name'" % i)
+        elif 'block_mask' in n and not _valid_block_mask(n['block_mask']):
+            errors.append("networks[%d].block_mask: Should be between %d "
+                          "and %d" % (i, MIN_BLOCK_MASK, MAX_BLOCK_MASK))
+    if errors:
+        return errors
+    return ["networks: " + e for e in find_network_conflicts(networks)]
+
+
+def _valid_index(index, networks):
+    return isinstance(index, int) and not isinstance(index, bool) and \
+        0 <= index < len(networks)
+
+
+def _topologies_errors(conf):
+    specs    = conf['topologies']
+    networks = conf.get('networks')
+    if not isinstance(specs, list) or not specs:
+        return ["topologies: Should be a non-empty list of topologies"]
+    if not isinstance(networks, list):
+        return []
+    errors = []
+    used   = set()
+    for i, spec in enumerate(specs):
+        prefix = "topologies[%d]" % i
+        if not isinstance(spec, dict) or \
+                ('aws' in spec) == ('datacenter' in spec):
+            errors.append(prefix + ": Should have either 'aws' or "
+                          "'datacenter'")
+            continue
+        indices = spec.get('networks')
+        if not isinstance(indices, list) or not indices or \
+                not all(_valid_index(n, networks) for n in indices):
+            errors.append(prefix + ".networks: Should be a non-empty list "
+                          "of indices of networks")
+        elif used & set(indices) or len(set(indices)) != len(indices):
+            errors.append(prefix + ".networks: Each network can only be "
+                          "used once")
+        else:
+            used |= set(indices)
+        section_errors = _aws_errors(spec) if 'aws' in spec else \
+            _dc_errors(spec)
+        errors += [prefix + "." + e for e in section_errors]
+    return errors
+
+
+def conf_errors(conf):
+    """
+    Check a complete user config.
+
+    Returns a list of all error messages, which is empty if the config is
+    valid and a topology can be built from it.
+
+    """
+    if not isinstance(conf, dict):
+        return ["The config should be an object"]
+    if sum(key in conf for key in ('aws', 'datacenter', 'topologies')) != 1:
+        return ["The config should have one of 'aws', 'datacenter' or "
+                "'topologies'"]
+
+    errors = _networks_errors(conf)
+    if 'topologies' in conf:
+        errors += _topologies_errors(conf)
+    elif 'aws' in conf:
+        errors += _aws_errors(conf)
+    else:
+        errors += _dc_errors(conf)
+
+    if not errors:
+        for i, c in enumerate(topology_confs(conf)):
+            if 'aws' not in c:
+                continue
+            try:
+                calculate_num_groups(c)
+            except Exception as e:
+                errors.append(("topologies[%d]: %s" % (i, e))
+                              if 'topologies' in conf else str(e))
+    return errors